@@ -4,6 +4,7 @@ VENV_DIR="../venv"
 source $VENV_DIR/bin/activate
 
 # Example usage of the Python script
+# (add dl_mode_global/dl.csv "Deadline Mode with global EDF" after running queue_experiments_dl.sh with DISPATCH="global")
 python3 exp_comparison_plot.py \
   --files dl_mode_edf/dl.csv dl_mode_fifo/dl.csv \
   --labels "Deadline Mode with EDF" "Dealine Mode with FIFO"
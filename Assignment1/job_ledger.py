@@ -0,0 +1,149 @@
+# job_ledger.py
+"""Compact per-job records for post-hoc analysis.
+
+Keeping per-job data in dictionaries of Python floats costs 100+ bytes per field per job. A `JobLedger` stores one row
+per completed job (arrival, start of service, completion, server, service time, deadline) as a struct of NumPy arrays:
+rows are buffered, converted to typed arrays a chunk at a time, and once more than `spill_threshold` rows are held in
+memory, chunks are appended to one binary file per field in the ledger directory. `close` writes everything there, and
+`read_ledger` memory-maps the result:
+
+    columns = read_ledger('run.ledger')
+    W = (columns['completion'] - columns['arrival']).mean()
+"""
+
+import json
+import os
+
+import numpy as np
+
+FIELDS = [
+    ('job_id', '<i8'),
+    ('arrival', '<f8'),
+    ('start', '<f8'),  # start of service
+    ('completion', '<f8'),
+    ('server', '<i8'),
+    ('service', '<f8'),  # service time
+    ('deadline', '<f8'),  # NaN for jobs without deadline
+]
+RECORD_DTYPE = np.dtype(FIELDS)
+
+
+def _field_path(path, name):
+    return os.path.join(path, f'{name}.bin')
+
+
+class JobLedger:
+    """Per-job records, saved in the directory `path`."""
+
+    def __init__(self, path, chunk_size=65536, spill_threshold=1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.spill_threshold = spill_threshold
+        self.buffer = []  # rows not yet converted, as tuples
+        self.chunks = []  # converted rows held in memory, as dicts field name -> array
+        self.in_memory = 0  # number of rows in self.chunks
+        self.spilled = 0  # number of rows written to the field files
+        self.files = None  # open field files, see `_spill`
+        self.from_snapshot = False  # loaded from a snapshot, and `resume` not called yet
+        os.makedirs(path, exist_ok=True)
+        for name, _ in FIELDS:  # start from empty files
+            open(_field_path(path, name), 'wb').close()
+        self._write_metadata()
+
+    def record(self, job_id, arrival, start, completion, server, service, deadline=float('nan')):
+        self.buffer.append((job_id, arrival, start, completion, server, service, deadline))
+        if len(self.buffer) >= self.chunk_size:
+            self._flush_buffer()
+
+    def __len__(self):
+        return self.spilled + self.in_memory + len(self.buffer)
+
+    def _flush_buffer(self):
+        if not self.buffer:
+            return
+        rows = np.array(self.buffer, dtype=RECORD_DTYPE)
+        self.chunks.append({name: np.ascontiguousarray(rows[name]) for name, _ in FIELDS})
+        self.in_memory += len(rows)
+        self.buffer.clear()
+        if self.spilled or self.in_memory >= self.spill_threshold:
+            self._spill()
+
+    def _spill(self):
+        """Append the chunks held in memory to the field files."""
+
+        if self.files is None:
+            if self.from_snapshot:
+                raise RuntimeError("call resume() before recording jobs in a ledger loaded from a snapshot")
+            self.files = {name: open(_field_path(self.path, name), 'ab') for name, _ in FIELDS}
+        for chunk in self.chunks:
+            for name, array in chunk.items():
+                array.tofile(self.files[name])
+        for f in self.files.values():
+            f.flush()
+        self.spilled += self.in_memory
+        self.chunks.clear()
+        self.in_memory = 0
+        self._write_metadata()
+
+    def _write_metadata(self):
+        with open(os.path.join(self.path, 'ledger.json'), 'w') as f:
+            json.dump({'fields': FIELDS, 'count': self.spilled}, f)
+
+    def column(self, name):
+        """All the values of field `name`, as a NumPy array (memory-mapped if the ledger was only spilled)."""
+
+        dtype = RECORD_DTYPE[name]
+        parts = []
+        if self.spilled:
+            parts.append(np.memmap(_field_path(self.path, name), dtype=dtype, mode='r', shape=(self.spilled,)))
+        parts.extend(chunk[name] for chunk in self.chunks)
+        if self.buffer:
+            index = RECORD_DTYPE.names.index(name)
+            parts.append(np.array([row[index] for row in self.buffer], dtype=dtype))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    def arrays(self):
+        """All the fields, as a dict field name -> NumPy array."""
+
+        return {name: self.column(name) for name, _ in FIELDS}
+
+    def close(self):
+        """Write all the rows to the ledger directory."""
+
+        self._flush_buffer()
+        self._spill()
+        for f in self.files.values():
+            f.close()
+        self.files = None
+
+    def __getstate__(self):
+        # snapshots (see `Simulation.save_checkpoint`) only record how many rows are on disk: write them all first
+        self._flush_buffer()
+        self._spill()
+        state = self.__dict__.copy()
+        state['files'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.from_snapshot = True  # loading a snapshot leaves the files alone, e.g. to inspect a run still going
+
+    def resume(self):
+        """Continue a ledger loaded from a snapshot: drop the rows written after the snapshot was taken, which the
+        resumed simulation will record again."""
+
+        for name, dtype in FIELDS:
+            os.truncate(_field_path(self.path, name), self.spilled * np.dtype(dtype).itemsize)
+        self.from_snapshot = False
+        self._write_metadata()
+
+
+def read_ledger(path):
+    """Memory-map a ledger saved by `JobLedger.close`, as a dict field name -> NumPy array."""
+
+    with open(os.path.join(path, 'ledger.json')) as f:
+        count = json.load(f)['count']
+    return {name: np.memmap(_field_path(path, name), dtype=dtype, mode='r', shape=(count,)) if count
+            else np.empty(0, dtype=dtype) for name, dtype in FIELDS}
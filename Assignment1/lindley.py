@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# lindley.py
+"""Fast path of the queue simulator for FIFO servers fed by random dispatch (d=1).
+
+With d=1 each job goes to a server chosen uniformly at random, and every server is an independent FIFO G/G/1 queue.
+The waiting time of the k-th job of a server follows the Lindley recursion
+
+    W_k = max(0, W_{k-1} + X_k),  with X_k = S_{k-1} - (A_k - A_{k-1})
+
+where A are arrival times and S service times. Its solution is W_k = C_k - min(0, C_1, ..., C_k), with
+C_k = X_1 + ... + X_k: a cumulative sum and a cumulative minimum, which NumPy computes without a Python-level loop.
+
+`run_lindley` does this a chunk of jobs at a time, drawing the same random numbers as the event loop of
+`Queues.run`, and fills the same statistics (response and waiting times, queue-length distribution, deadline misses)
+up to floating-point rounding. Run this file to cross-check it against the event loop and time both.
+"""
+
+import argparse
+import functools
+import random
+import time
+
+import numpy as np
+
+from scheduling_type import SchedulingType
+
+def applicable(sim):
+    """Whether `run_lindley` can replace `sim.run`: fresh simulation, FIFO servers, random dispatch, no job ledger."""
+
+    return (sim.scheduling_type == SchedulingType.FIFO and sim.dispatch == 'supermarket' and (sim.d == 1 or sim.n == 1)
+            and sim.t == 0 and sim.ledger is None and sim.event_trace is None
+            and (sim.n == 1 or randranges_match_random()))
+
+
+def lindley_waits(arrivals, services, last_completion):
+    """Waiting times of consecutive FIFO jobs of one server, which is busy until `last_completion`."""
+
+    x = np.empty(len(arrivals))
+    x[0] = last_completion - arrivals[0]
+    np.subtract(services[:-1], np.diff(arrivals), out=x[1:])
+    c = np.cumsum(x)
+    return c - np.minimum(np.minimum.accumulate(c), 0)
+
+
+class Randranges:
+    """The values successive `rng.randrange(n)` calls would return, generated in NumPy blocks.
+
+    For n < 2 ** 32, CPython's `random.Random.randrange(n)` takes the n.bit_length() most significant bits of the next
+    32-bit output of the Mersenne Twister, and tries again if they are >= n; `rng.getrandbits(32 * m)` returns the next
+    m outputs, least significant first.
+    """
+
+    def __init__(self, rng, n):
+        self.rng = rng
+        self.n = n
+        self.shift = 32 - n.bit_length()
+        self.values = np.empty(0, dtype=np.int64)
+
+    def take(self, size):
+        if self.shift < 0:  # n is too large for the trick
+            return np.array([self.rng.randrange(self.n) for _ in range(size)])
+        while len(self.values) < size:
+            words = 2 * size  # at least half of the draws are accepted
+            outputs = np.frombuffer(self.rng.getrandbits(32 * words).to_bytes(4 * words, 'little'), dtype='<u4')
+            draws = (outputs >> self.shift).astype(np.int64)
+            self.values = np.concatenate((self.values, draws[draws < self.n]))
+        values, self.values = self.values[:size], self.values[size:]
+        return values
+
+
+@functools.cache
+def randranges_match_random():
+    """Whether `Randranges` reproduces `random.Random.randrange` on this Python.
+
+    It relies on how CPython implements randrange, which is not part of its documented interface: if a Python version
+    changes it, `applicable` returns False and queue_sim falls back to the event loop.
+    """
+
+    for n in 2, 3, 10, 1000, 2 ** 31 - 1:
+        rng = random.Random(n)
+        actual = Randranges(rng, n).take(100).tolist()
+        rng.seed(n)
+        if actual != [rng.randrange(n) for _ in range(100)]:
+            return False
+    return True
+
+
+def run_lindley(sim, max_t, chunk_size=1 << 16, stop_when=None):
+    """Run `sim`, a queue_sim.Queues for which `applicable(sim)` is true, until max_t.
+
+    As `Queues.run_batches`, this adds the response times to sim.response_batches, and stops early if
+    `stop_when(sim)` is true after a chunk of jobs; it returns whether it did.
+    """
+
+    n = sim.n
+    routes = Randranges(sim.routing_rng, n)
+    next_arrival, _, _ = sim.events.pop()  # the first arrival, scheduled by Queues.__init__
+    last_completion = np.zeros(n)  # completion time of the last job of each server
+    pending = [np.empty(0)] * n  # completion times of each server that come after the current window
+    length = [0] * n  # length of each queue at the start of the current window
+    histogram = np.zeros(1)  # total time spent by the queues at each length
+    window_start = last_arrival = 0.0
+    waiting_arrivals = waiting_starts = np.empty(0)  # jobs arrived in past windows that haven't started yet
+    running = [np.empty(0)] * 3  # arrival, completion and service times of the jobs that haven't completed yet
+    stopped = False
+
+    while next_arrival <= max_t:
+        # the next chunk_size jobs: the random numbers are drawn in the same order as by the Arrival events
+        interarrivals = sim.arrival_pool.take(chunk_size) * sim.arrival_scale
+        arrivals = np.cumsum(np.concatenate(([next_arrival], interarrivals)))  # sequential sums, like sim.schedule
+        arrivals, next_arrival = arrivals[:-1], arrivals[-1]
+        services = sim.service_pool.take(chunk_size) * sim.service_scale
+        if n > 1:
+            servers = routes.take(chunk_size)
+        else:
+            servers = np.zeros(chunk_size, dtype=np.int64)
+        if next_arrival > max_t:  # last chunk: drop the jobs arriving after max_t
+            count = np.searchsorted(arrivals, max_t, 'right')
+            arrivals, services, servers = arrivals[:count], services[:count], servers[:count]
+        if len(arrivals):
+            last_arrival = arrivals[-1]
+
+        # start of service and completion of each job, server by server
+        order = np.argsort(servers, kind='stable')
+        bounds = np.searchsorted(servers[order], np.arange(n + 1))
+        jobs = [order[bounds[i]:bounds[i + 1]] for i in range(n)]
+        starts = np.empty(len(arrivals))
+        completions = np.empty(len(arrivals))
+        for i, job in enumerate(jobs):
+            if len(job):
+                server_arrivals, server_services = arrivals[job], services[job]
+                server_starts = server_arrivals + lindley_waits(server_arrivals, server_services, last_completion[i])
+                starts[job] = server_starts
+                completions[job] = server_completions = server_starts + server_services
+                last_completion[i] = server_completions[-1]
+
+        # the current window ends at the next arrival or, at the end, at the last event of the run
+        if next_arrival <= max_t:
+            window_end = next_arrival
+        else:
+            window_end = last_arrival
+            for i, job in enumerate(jobs):
+                server_completions = np.concatenate((pending[i], completions[job]))
+                k = np.searchsorted(server_completions, max_t, 'right')
+                if k:
+                    window_end = max(window_end, server_completions[k - 1])
+
+        # statistics of the jobs that start or complete within the window, as Queues.schedule_completion and job_done
+        # do; the others are deferred to the next windows
+        waiting_arrivals = np.concatenate((waiting_arrivals, arrivals))
+        waiting_starts = np.concatenate((waiting_starts, starts))
+        started = waiting_starts <= window_end
+        sim.waiting_sketch.add_many(waiting_starts[started] - waiting_arrivals[started])
+        waiting_arrivals, waiting_starts = waiting_arrivals[~started], waiting_starts[~started]
+        running = [np.concatenate((previous, current))
+                   for previous, current in zip(running, (arrivals, completions, services))]
+        done = running[1] <= window_end
+        done_arrivals, done_completions, done_services = (values[done] for values in running)
+        running = [values[~done] for values in running]
+        response_times = done_completions - done_arrivals
+        sim.response_times.add_many(response_times)
+        sim.response_sketch.add_many(response_times)
+        for increment in np.array_split(response_times, max(1, round(len(response_times) / sim.BATCH_JOBS))):
+            if len(increment):
+                sim.response_batches.add(float(increment.sum()), len(increment))
+        if sim.deadline_mode:
+            for i, margin in enumerate(sim.slack_margins):
+                deadlines = done_arrivals + done_services * margin
+                sim.deadline_misses[i] += int((done_completions > deadlines).sum())
+
+        # queue lengths between window_start and window_end
+        for i, job in enumerate(jobs):
+            server_completions = np.concatenate((pending[i], completions[job]))
+            k = np.searchsorted(server_completions, window_end, 'right')
+            times = np.concatenate((arrivals[job], server_completions[:k]))
+            steps = np.concatenate((np.ones(len(job), dtype=np.int64), np.full(k, -1, dtype=np.int64)))
+            by_time = np.argsort(times, kind='stable')
+            lengths = np.concatenate(([length[i]], length[i] + np.cumsum(steps[by_time])))
+            durations = np.diff(np.concatenate(([window_start], times[by_time], [window_end])))
+            counts = np.bincount(lengths, weights=durations)
+            if len(counts) > len(histogram):
+                histogram = np.concatenate((histogram, np.zeros(len(counts) - len(histogram))))
+            histogram[:len(counts)] += counts
+            length[i] = int(lengths[-1])
+            pending[i] = server_completions[k:]
+        window_start = window_end
+        if stop_when is not None and next_arrival <= max_t and stop_when(sim):
+            stopped = True  # as if the run ended just before the next arrival
+            break
+
+    sim.t = window_start
+    sim.queue_length_since = [sim.t] * n
+    sim.queue_length_distribution.clear()
+    for queue_length, total in enumerate(histogram.tolist()):
+        if total > 0:
+            sim.queue_length_distribution[queue_length] = total
+    return stopped
+
+
+def main():
+    from queue_sim import Queues
+    from random_streams import RandomStreams
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description="compare the Lindley fast path with the event loop (test_lindley.py "
+                                                 "checks that they agree)")
+    parser.add_argument('--lambd', type=float, nargs='+', default=[0.5, 0.9, 0.99], help="arrival rates")
+    parser.add_argument('--n', type=int, default=10, help="number of servers")
+    parser.add_argument('--max-t', type=float, default=20_000, help="simulated time")
+    parser.add_argument('--weibull-shape', type=float, help="use Weibull times with this shape")
+    parser.add_argument('--chunk-size', type=int, default=1 << 14, help="jobs per chunk")
+    args = parser.parse_args()
+
+    weibull_mode = args.weibull_shape is not None
+    for lambd in args.lambd:
+        sims = [Queues(lambd, 1, args.n, 1, weibull_mode, args.weibull_shape or 1, True, [1, 2, 5, 10],
+                       streams=RandomStreams(42)) for _ in range(2)]
+        start = time.perf_counter()
+        sims[0].run(args.max_t)
+        sims[0].flush_queue_length_distribution()
+        engine_time = time.perf_counter() - start
+        start = time.perf_counter()
+        run_lindley(sims[1], args.max_t, args.chunk_size)
+        lindley_time = time.perf_counter() - start
+
+        engine, fast = sims
+        expected, actual = engine.queue_length_distribution, fast.queue_length_distribution
+        distribution_error = max(abs(expected.get(k, 0) - actual.get(k, 0))
+                                 for k in set(expected) | set(actual)) / (args.n * engine.t)
+        print(f"lambda={lambd}: {engine.response_times.count} jobs, "
+              f"event loop {engine_time:.2f}s, Lindley {lindley_time:.3f}s ({engine_time / lindley_time:.0f}x)")
+        print(f"  W {engine.response_times.mean:.6f} / {fast.response_times.mean:.6f}, "
+              f"completions {engine.response_times.count} / {fast.response_times.count}, "
+              f"deadline misses {engine.deadline_misses} / {fast.deadline_misses}, "
+              f"p99 waiting {engine.waiting_sketch.quantile(0.99):.4f} / {fast.waiting_sketch.quantile(0.99):.4f}, "
+              f"max queue-length fraction error {distribution_error:.2g}")
+
+
+if __name__ == '__main__':
+    main()
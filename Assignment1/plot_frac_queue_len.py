@@ -12,12 +12,12 @@ def process_csv_data(csv_file):
     """
     Processes CSV data into a nested dictionary structure.
     """
-    data = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    data = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
     with open(csv_file, 'r') as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
             queue_length = int(row["queue_length"])
-            count = int(row["count"])
+            count = float(row["count"])  # time spent at that length (number of samples in older files)
             lambd = float(row["lambda"])
             d = int(row["d"])
             data[d][lambd][queue_length] += count
@@ -8,7 +8,8 @@ from matplotlib import pyplot as plt
 
 from queue_sim import CSV_COLUMNS
 
-Row = collections.namedtuple('Row', CSV_COLUMNS)
+# rows written before the percentile columns were added only have the first six columns
+Row = collections.namedtuple('Row', CSV_COLUMNS, defaults=[None] * (len(CSV_COLUMNS) - 6))
 
 Params = collections.namedtuple('Params', 'mu max_t n d')
 
@@ -60,7 +61,7 @@ def main():
     You can specify multiple values for mu, max-t, n and d. The program will plot the W metric for
     all the combinations of these values that are present in the CSV file.
 
-    The CSV file must have the following columns: lambd, mu, max_t, n, d, w.
+    The CSV file must have the following columns: lambd, mu, max_t, n, d, w (optionally followed by percentiles).
 
     Example:
         plot_queue_w.py out.csv --max-t 100000 -d 1 2 5 10 -n 10
@@ -3,9 +3,10 @@
 VENV_DIR="../venv"
 source $VENV_DIR/bin/activate
 
-for LAMBD in 0.5 0.7 0.9 0.95 0.99; do
- for D in 1 2 5 10; do
-  echo "\nRunning simulation with LAMBD=$LAMBD, D=$D"
-  ./queue_sim.py --lambd $LAMBD --d $D --n 10 --csv out.csv --max-t 100_000 --verbose
- done
-done
+# All the (lambda, d) points run in parallel, one worker process per core (see sweep.py)
+./sweep.py --lambd 0.5 0.7 0.9 0.95 0.99 --d 1 2 5 10 --n 10 --max-t 100_000 --store results.db --cache cache
+
+# Export the runs of this configuration in the CSV files read by the plot scripts (see result_store.py)
+WHERE="n=10 max_t=100000 scheduling_type=FIFO weibull_shape=null deadline_mode=false dispatch=supermarket"
+./result_store.py results.db export out out.csv --where $WHERE
+./result_store.py results.db export queue-lengths d_out.csv --where $WHERE
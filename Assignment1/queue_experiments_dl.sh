@@ -5,13 +5,16 @@ source $VENV_DIR/bin/activate
 
 # Set the scheduling type here (FIFO, SJF, or EDF)
 SCHEDULING="EDF"
+# Set the dispatch here: "supermarket" (per-server queues, d sampled at arrival) or "global" (one central queue)
+DISPATCH="supermarket"
+# All the slack margins are evaluated by a single run (one run per margin if the scheduling is EDF)
+SLACK_MARGINS="1 2 5 10"
 
-for SLACK_MARGIN in 1 2 5 10; do
-  for LAMBD in 0.5 0.7 0.9 0.95 0.99; do
-   for D in 1 2 5 10; do
-    echo "\nRunning simulation with LAMBDA=$LAMBD, d=$D in deadline mode with scheduling $SCHEDULING and slack margin $SLACK_MARGIN"
-    # Running in deadline mode (Each task have a deadline)
-    ./queue_sim_dl.py --lambd $LAMBD --d $D --n 10 --csv out.csv --max-t 100_000 --deadline_mode --slack_margin $SLACK_MARGIN --scheduling_type $SCHEDULING
-   done
-  done
-done
+# Running in deadline mode (Each task have a deadline); all the points run in parallel (see sweep.py)
+./sweep.py --lambd 0.5 0.7 0.9 0.95 0.99 --d 1 2 5 10 --n 10 --max-t 100_000 --deadline_mode --slack_margin $SLACK_MARGINS --scheduling_type $SCHEDULING --dispatch $DISPATCH --store results.db --cache cache
+
+# Export the runs of this configuration in the CSV files read by the plot scripts (see result_store.py)
+WHERE="n=10 max_t=100000 scheduling_type=$SCHEDULING weibull_shape=null deadline_mode=true dispatch=$DISPATCH"
+./result_store.py results.db export out out.csv --where $WHERE
+./result_store.py results.db export queue-lengths d_out.csv --where $WHERE
+./result_store.py results.db export deadline-misses dl.csv --where $WHERE
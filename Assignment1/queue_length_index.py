@@ -0,0 +1,87 @@
+# queue_length_index.py
+"""Index of the servers by current queue length, for fast supermarket-model dispatch.
+
+Sampling d queues with `random.sample(range(n), d)` and taking the shortest allocates a list per arrival, and becomes
+O(n) when d approaches n (join-the-shortest-queue). `QueueLengthIndex` instead keeps the servers in buckets by queue
+length, updated in O(1) whenever a job joins or leaves a queue, and gives:
+
+- exact JSQ in O(1), breaking ties among the shortest queues at random (`shortest`);
+- power-of-d choices in O(d) expected time, without building lists (`choose`).
+"""
+
+
+class QueueLengthIndex:
+    """Lengths of n queues, with the queues bucketed by length.
+
+    Call `increment(i)` when a job joins queue i (running jobs included) and `decrement(i)` when one leaves it.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.length = [0] * n  # current length of each queue
+        self.buckets = [list(range(n))]  # buckets[k] holds the queues of length k, in no particular order
+        self.position = list(range(n))  # position of each queue in its bucket
+        self.min_length = 0  # length of the shortest queues
+
+    def _move(self, i, new_length):
+        buckets, position = self.buckets, self.position
+        bucket = buckets[self.length[i]]
+        last = bucket.pop()  # remove i in O(1) by moving the last queue of the bucket in its place
+        if last != i:
+            bucket[position[i]] = last
+            position[last] = position[i]
+        if new_length == len(buckets):
+            buckets.append([])
+        bucket = buckets[new_length]
+        position[i] = len(bucket)
+        bucket.append(i)
+        self.length[i] = new_length
+
+    def increment(self, i):
+        length = self.length[i]
+        self._move(i, length + 1)
+        if length == self.min_length and not self.buckets[length]:
+            self.min_length = length + 1
+
+    def decrement(self, i):
+        length = self.length[i] - 1
+        self._move(i, length)
+        if length < self.min_length:
+            self.min_length = length
+
+    def shortest(self, rng):
+        """One of the shortest queues, chosen uniformly at random using `rng` (a random.Random)."""
+
+        bucket = self.buckets[self.min_length]
+        return bucket[rng.randrange(len(bucket))]
+
+    def choose(self, d, rng):
+        """The shortest of d distinct queues chosen uniformly at random, ties broken at random.
+
+        With d >= n this is exact JSQ, in O(1). Otherwise queues are drawn one at a time, rejecting repeats: the first
+        shortest one in draw order is a uniformly random one among the shortest sampled. When d > n / 2 rejections
+        would dominate, so we fall back to `rng.sample`.
+        """
+
+        n = self.n
+        if d >= n:
+            return self.shortest(rng)
+        length = self.length
+        if 2 * d > n:
+            return min(rng.sample(range(n), d), key=length.__getitem__)
+        randrange = rng.randrange
+        best = randrange(n)
+        best_length = length[best]
+        if d == 1 or best_length == self.min_length:  # nothing sampled later can be strictly shorter
+            return best
+        seen = {best}
+        while len(seen) < d:
+            i = randrange(n)
+            if i in seen:
+                continue
+            seen.add(i)
+            if length[i] < best_length:
+                best, best_length = i, length[i]
+                if best_length == self.min_length:
+                    break
+        return best
@@ -3,12 +3,22 @@
 import argparse
 import collections
 import csv
+import json
 import logging
+import math
 import os
-from random import expovariate, sample, seed
 
-from discrete_event_sim import Simulation, Event
-from workloads import weibull_generator
+from discrete_event_sim import Simulation, Event, pooled
+from event_queue import EVENT_QUEUES
+from event_trace import EventTraceWriter
+from job_ledger import JobLedger
+import lindley
+from online_stats import BatchMeans, DDSketch, RunningStats
+from queue_length_index import QueueLengthIndex
+from random_streams import RandomStreams
+from result_cache import DEFAULT_SIZE as DEFAULT_CACHE_SIZE, ResultCache
+from scheduling_type import SchedulingType, make_discipline
+from workloads import weibull_scale
 
 # One possible modification is to use a different distribution for job sizes or and/or interarrival times.
 # Weibull distributions (https://en.wikipedia.org/wiki/Weibull_distribution) are a generalization of the
@@ -22,7 +32,10 @@ from workloads import weibull_generator
 # and then call gen() every time you need a random variable
 
 # columns saved in the CSV file
-CSV_COLUMNS = ['lambd', 'mu', 'max_t', 'n', 'd', 'w']
+PERCENTILES = [50, 95, 99]  # percentiles of the response (w) and waiting times saved next to W
+DISPATCH_MODES = ['supermarket', 'global']
+CSV_COLUMNS = (['lambd', 'mu', 'max_t', 'n', 'd', 'w'] + [f'{kind}_p{p}' for kind in ['w', 'wait'] for p in PERCENTILES]
+               + ['w_ci'])  # half-width of the confidence interval of w, from batch means
 
 
 class Queues(Simulation):
@@ -30,39 +43,134 @@ class Queues(Simulation):
 
     The system has n servers with one queue each. Jobs arrive at rate lambd and are served at rate mu.
     When a job arrives, according to the supermarket model, it chooses d queues at random and joins
-    the shortest one.
+    the shortest one. Each server picks the next job to serve according to `scheduling_type`; with the preemptive
+    disciplines (SRPT, PS), arrivals can also interrupt or slow down the jobs in service.
+
+    The options can be combined: Weibull-distributed interarrival and service times, and deadlines (in deadline mode,
+    a job must complete within `slack_margin` times its service time from its arrival). `slack_margin` can also be a
+    list: deadline misses are then counted for every margin on the same run, which is exact as long as the schedule
+    doesn't depend on the deadlines (i.e., with any discipline but EDF).
+
+    With `dispatch='global'`, jobs instead wait in a single central queue ordered by `scheduling_type` (e.g., a global
+    EDF heap), and whichever server frees up first takes the next job; d is ignored.
     """
 
+    BATCH_JOBS = 4096  # average number of arrivals per increment of the batch means (see `run_batches`)
+
     def __init__(self, lambd, mu, n, d,
-                 weibull_mode: bool, weibull_shape: float):
-        super().__init__()
+                 weibull_mode: bool = False, weibull_shape: float = 1,
+                 deadline_mode: bool = False, slack_margin=1.0,
+                 scheduling_type: SchedulingType = SchedulingType.FIFO,
+                 event_queue: str = 'heap', streams: RandomStreams = None,
+                 streaming: bool = False, ledger: JobLedger = None, dispatch: str = 'supermarket'):
+        super().__init__(event_queue, streams=streams)
+        # one random stream per purpose: e.g., changing how queues are sampled doesn't change arrivals and services
+        self.routing_rng = self.streams.stream('routing')
         self.running = [None] * n  # if not None, the id of the running job (per queue)
-        self.queues = [collections.deque() for _ in range(n)]  # FIFO queues of the system
-        # NOTE: we don't keep the running jobs in self.queues
+        self.scheduling_type = scheduling_type
+        self.dispatch = dispatch
+        self.central_queue = None
+        if dispatch == 'global':
+            if scheduling_type in (SchedulingType.SRPT, SchedulingType.PS):
+                raise ValueError(f"global dispatch doesn't support the preemptive {scheduling_type.value} discipline")
+            self.central_queue = make_discipline(scheduling_type)  # jobs waiting for any server
+            self.idle_servers = list(range(n - 1, -1, -1))  # stack of idle servers, the lowest index on top
+            self.queues = []
+        else:
+            self.queues = [make_discipline(scheduling_type) for _ in range(n)]  # waiting lines, see scheduling_type.py
+        # NOTE: we don't keep the running jobs in self.queues (except with PS, where self.running is the id of the job
+        # that will complete first)
         self.arrivals = {}  # dictionary mapping job id to arrival time
         self.completions = {}  # dictionary mapping job id to completion time
+        # service times are drawn on arrival, so that disciplines like SJF can use them: this maps the id of each
+        # waiting job to its service time
+        self.service_times = {}
+        # in streaming mode, jobs are only kept in the dictionaries while in the system, and completions is not filled
+        self.streaming = streaming
+        self.ledger = ledger  # optional compact record of every job, see job_ledger.py
+        self.service_started = [None] * n  # (start, service time) of the job running on each server, for the ledger
+        self.response_times = RunningStats()  # time spent in the system by completed jobs, accumulated online
+        self.response_sketch = DDSketch()  # quantiles of the same
+        self.waiting_sketch = DDSketch()  # quantiles of the time spent waiting before being served
+        self.response_batches = BatchMeans()  # confidence interval of the mean response time, see `run_batches`
+        self.slice_total = 0.0  # sum of the response times of the jobs completed in the current slice of `run_batches`
         self.lambd = lambd  # arrival rate
         self.n = n  # number of servers
         self.d = d  # number of queues to sample
         self.mu = mu  # service rate
         self.arrival_rate = lambd * n  # frequency of new jobs is proportional to the number of queues
-        self.queue_length_distribution = collections.defaultdict(int)
+        # total time spent by the queues at each length: only the queue whose length changes is updated, in O(1)
+        self.queue_length_distribution = collections.defaultdict(float)
+        # with global dispatch, there's a single queue: the number of jobs in the system
+        queues = 1 if dispatch == 'global' else n
+        self.queue_length_since = [0.0] * queues  # time at which each queue took its current length
+        self.lengths = QueueLengthIndex(queues)  # queues bucketed by length, to dispatch arrivals without scanning them
+
+        # preemptive disciplines cancel and reschedule the completion of the jobs in service
+        self.preemptive = scheduling_type in (SchedulingType.SRPT, SchedulingType.PS)
+        if self.preemptive:
+            # the Completion event scheduled on each server, to cancel it, as an (event, seq) handle: events are pooled
+            self.completion_events = [None] * n
+            self.busy_until = [0.0] * n  # SRPT: time at which the running job completes, unless preempted
+            self.preempted = {}  # SRPT: maps preempted jobs to the (start, service time) of their first service
 
         # New Modes
         self.weibull_mode = weibull_mode
-
-        # Weibull mode
+        self.deadline_mode = deadline_mode
+        if scheduling_type == SchedulingType.EDF and not deadline_mode:
+            logging.warning("Scheduling type EDF requires deadline mode. Switching to deadline mode.")
+            self.deadline_mode = True
+        if self.deadline_mode:
+            self.slack_margins = list(slack_margin) if isinstance(slack_margin, (list, tuple)) else [slack_margin]
+            if len(self.slack_margins) > 1 and scheduling_type == SchedulingType.EDF:
+                raise ValueError("EDF schedules depend on the slack margin: simulate one margin at a time")
+            self.slack_margin = self.slack_margins[0]  # the margin of the deadlines used by EDF and in the ledger
+            self.deadline_misses = [0] * len(self.slack_margins)  # for each margin
+            self.job_sizes = {}  # dictionary mapping job id to service time, from which its deadlines are computed
+
+        # interarrival and service times come from pools of variates with unit scale, which we multiply by the scale
+        # of the distribution we want
         if self.weibull_mode:
             self.weibull_shape = weibull_shape
-            self.weibull_gen = weibull_generator(self.weibull_shape, 1 / self.arrival_rate)
-            self.schedule(self.weibull_gen(), Arrival(0))
+            self.arrival_pool = self.streams.pool('arrivals', 'weibull', weibull_shape)
+            self.service_pool = self.streams.pool('service', 'weibull', weibull_shape)
+            self.arrival_scale = weibull_scale(weibull_shape, 1 / self.arrival_rate)
+            self.service_scale = weibull_scale(weibull_shape, 1 / mu)  # mean service time 1/mu, as with exponentials
         else:
-            self.schedule(expovariate(lambd), Arrival(0))
-
-    def update_queue_length_distribution(self):
-        for i in range(self.n):
-            qlen = self.queue_len(i)
-            self.queue_length_distribution[qlen] += 1
+            self.arrival_pool = self.streams.pool('arrivals', 'exponential')
+            self.service_pool = self.streams.pool('service', 'exponential')
+            self.arrival_scale = 1 / self.arrival_rate
+            self.service_scale = 1 / mu
+        self.schedule(self.arrival_pool() * self.arrival_scale, Arrival(0))
+
+    def update_queue_length_distribution(self, queue_index):
+        """Credit queue `queue_index` with the time spent at its current length: call this before changing it."""
+
+        t = self.t
+        self.queue_length_distribution[self.lengths.length[queue_index]] += t - self.queue_length_since[queue_index]
+        self.queue_length_since[queue_index] = t
+
+    def run_batches(self, max_t, stop_when=None):
+        """Run until max_t in slices of about BATCH_JOBS arrivals, adding the response times of each slice to
+        self.response_batches; stop after a slice if `stop_when(self)` is true, and return whether it was."""
+
+        slice_t = self.BATCH_JOBS / self.arrival_rate
+        horizon = self.t
+        while horizon < max_t:
+            horizon = min(horizon + slice_t, max_t)
+            count = self.response_times.count
+            self.slice_total = 0.0
+            self.run(horizon)
+            self.response_batches.add(self.slice_total, self.response_times.count - count)
+            if stop_when is not None and stop_when(self):
+                return True
+        return False
+
+    def flush_queue_length_distribution(self):
+        """Credit every queue up to the current time, before reading self.queue_length_distribution."""
+
+        for i in range(len(self.queue_length_since)):
+            self.update_queue_length_distribution(i)
 
     def schedule_arrival(self, job_id):
         """Schedule the arrival of a new job."""
@@ -70,86 +178,294 @@ class Queues(Simulation):
         # schedule the arrival following an exponential distribution, to compensate the number of queues the arrival
         # time should depend also on "n"
 
-        # memoryless behavior results in exponentially distributed times between arrivals (we use `expovariate`)
+        # memoryless behavior results in exponentially distributed times between arrivals (unless in Weibull mode)
         # the rate of arrivals is proportional to the number of queues
-        if self.weibull_mode:
-            next_arrival = self.weibull_gen()
-        else:
-            next_arrival = expovariate(self.arrival_rate)
-        self.schedule(next_arrival, Arrival(job_id))
+        self.schedule(self.arrival_pool() * self.arrival_scale, Arrival.new(job_id))
 
-    def schedule_completion(self, job_id, queue_index):
-        """Schedule the completion of a job."""
+    def schedule_completion(self, job_id, queue_index, completion_delay):
+        """Schedule the completion of a job, which starts being served now and needs `completion_delay` time."""
 
         # schedule the time of the completion event
         # check `schedule_arrival` for inspiration
-        if self.weibull_mode:
-            weibull_gen = weibull_generator(self.weibull_shape, self.mu)
-            completion_delay = weibull_gen()
+        if self.preemptive and job_id in self.preempted:  # SRPT: the job resumes, with completion_delay work left
+            self.service_started[queue_index] = self.preempted.pop(job_id)
         else:
-            completion_delay = expovariate(self.mu)
+            self.waiting_sketch.add(self.t - self.arrivals[job_id])
+            if self.ledger is not None:
+                self.service_started[queue_index] = (self.t, completion_delay)
 
         # Schedule the job completion event
-        self.schedule(completion_delay, Completion(job_id, queue_index))
-
-    def queue_len(self, i):
-        """Return the length of the i-th queue.
-        
-        Notice that the currently running job is counted even if it is not in self.queues[i]."""
-
-        return (self.running[i] is not None) + len(self.queues[i])
-
-
-
+        event = self.schedule(completion_delay, Completion.new(job_id, queue_index))
+        if self.preemptive:
+            self.completion_events[queue_index] = event, event.seq
+            self.busy_until[queue_index] = self.t + completion_delay
+
+    def global_arrival(self, job_id, service_time, deadline):
+        """Global dispatch: a job joins the central queue, or goes to an idle server if there is one."""
+
+        self.update_queue_length_distribution(0)  # the number of jobs in the system is about to change
+        self.lengths.increment(0)
+        if self.idle_servers:
+            server = self.idle_servers.pop()
+            self.running[server] = job_id
+            self.schedule_completion(job_id, server, service_time)
+        else:
+            self.service_times[job_id] = service_time
+            self.central_queue.push(job_id, service_time, deadline)
+
+    def global_departure(self, server):
+        """Global dispatch: `server` has completed a job, and takes the next one from the central queue if any."""
+
+        self.update_queue_length_distribution(0)  # the number of jobs in the system is about to change
+        self.lengths.decrement(0)
+        if self.central_queue:
+            job_id = self.central_queue.pop()
+            self.running[server] = job_id
+            self.schedule_completion(job_id, server, self.service_times.pop(job_id))
+        else:
+            self.running[server] = None
+            self.idle_servers.append(server)
+
+    def preemptive_arrival(self, job_id, queue_index, service_time, deadline):
+        """Add a job to server `queue_index`, which uses a preemptive discipline."""
+
+        queue = self.queues[queue_index]
+        if self.scheduling_type == SchedulingType.PS:
+            # the job is served right away, and only the next completion on the server changes
+            queue.advance(self.t)
+            queue.push(job_id, service_time, deadline)
+            self.service_times[job_id] = service_time
+            self.waiting_sketch.add(0.0)
+            self.reschedule_ps_completion(queue_index)
+            return
+
+        running = self.running[queue_index]
+        if running is not None:
+            remaining = self.busy_until[queue_index] - self.t
+            if service_time >= remaining:
+                self.service_times[job_id] = service_time
+                queue.push(job_id, service_time, deadline)
+                return
+            # the new job preempts the running one, which goes back in the queue with its remaining work
+            event, seq = self.completion_events[queue_index]
+            event.cancel(seq)
+            self.preempted[running] = self.service_started[queue_index]
+            self.service_times[running] = remaining
+            queue.push(running, remaining, None)
+        self.running[queue_index] = job_id
+        self.schedule_completion(job_id, queue_index, service_time)
+
+    def reschedule_ps_completion(self, queue_index):
+        """PS: (re)schedule the first completion on server `queue_index`, after its number of jobs changed."""
+
+        handle = self.completion_events[queue_index]
+        if handle is not None:
+            event, seq = handle
+            event.cancel(seq)
+        queue = self.queues[queue_index]
+        if queue:
+            delay, job_id = queue.next_completion()
+            self.running[queue_index] = job_id
+            event = self.schedule(delay, Completion.new(job_id, queue_index))
+            self.completion_events[queue_index] = event, event.seq
+        else:
+            self.running[queue_index] = None
+            self.completion_events[queue_index] = None
+
+    def ps_departure(self, job_id, queue_index):
+        """PS: job `job_id` completes on server `queue_index`."""
+
+        queue = self.queues[queue_index]
+        queue.advance(self.t)
+        assert queue.pop() == job_id  # the job must be the one with the smallest finish tag
+        service_time = self.service_times.pop(job_id)
+        if self.ledger is not None:
+            self.service_started[queue_index] = (self.arrivals[job_id], service_time)
+        self.job_done(job_id, queue_index)
+        self.update_queue_length_distribution(queue_index)  # the length of this queue is about to change
+        self.lengths.decrement(queue_index)
+        self.reschedule_ps_completion(queue_index)
+
+    def job_done(self, job_id, queue_index):
+        """Record the completion of a job at the current time; in streaming mode, forget about the job."""
+
+        if self.streaming:
+            arrival = self.arrivals.pop(job_id)
+        else:
+            arrival = self.arrivals[job_id]
+            self.completions[job_id] = self.t
+        deadline = float('nan')
+        if self.deadline_mode:
+            size = self.job_sizes.pop(job_id) if self.streaming else self.job_sizes[job_id]
+            t, misses = self.t, self.deadline_misses
+            for i, margin in enumerate(self.slack_margins):
+                if t > arrival + size * margin:
+                    misses[i] += 1
+            deadline = arrival + size * self.slack_margin
+        response_time = self.t - arrival
+        self.response_times.add(response_time)
+        self.response_sketch.add(response_time)
+        self.slice_total += response_time
+        if self.ledger is not None:
+            start, service_time = self.service_started[queue_index]
+            self.ledger.record(job_id, arrival, start, self.t, queue_index, service_time, deadline)
+
+
+@pooled
 class Arrival(Event):
     """Event representing the arrival of a new job."""
 
+    __slots__ = ('id',)
+
     def __init__(self, job_id):
         self.id = job_id
 
+    def trace_ids(self):
+        return self.id, -1, float('nan')
+
     def process(self, sim: Queues):
         """Process an arrival of a new job at the simulation."""
         sim.arrivals[self.id] = sim.t  # Log the arrival time
-
-        sample_queues = sample(range(sim.n), sim.d)  # Choose d queues at random
-
-        queue_index = min(sample_queues, key=sim.queue_len)
-
-        if sim.running[queue_index] is None:
-            sim.running[queue_index] = self.id
-            sim.schedule_completion(self.id, queue_index)
+        service_time = sim.service_pool() * sim.service_scale
+        deadline = None
+        if sim.deadline_mode:
+            deadline = sim.t + service_time * sim.slack_margin
+            sim.job_sizes[self.id] = service_time
+
+        if sim.central_queue is not None:
+            sim.global_arrival(self.id, service_time, deadline)
         else:
-            sim.queues[queue_index].append(self.id)
-
-        sim.update_queue_length_distribution()  # Update after job is queued
+            queue_index = sim.lengths.choose(sim.d, sim.routing_rng)  # the shortest of d queues chosen at random
+            sim.update_queue_length_distribution(queue_index)  # the length of this queue is about to change
+            sim.lengths.increment(queue_index)
+
+            if sim.preemptive:
+                sim.preemptive_arrival(self.id, queue_index, service_time, deadline)
+            elif sim.running[queue_index] is None:
+                sim.running[queue_index] = self.id
+                sim.schedule_completion(self.id, queue_index, service_time)
+            else:
+                sim.service_times[self.id] = service_time
+                sim.queues[queue_index].push(self.id, service_time, deadline)
 
         # Schedule the arrival of the next job
         next_job_id = self.id + 1  # increment to the next job ID
         sim.schedule_arrival(next_job_id)
 
 
+@pooled
 class Completion(Event):
     """Job completion."""
 
+    __slots__ = ('job_id', 'queue_index')
+
     def __init__(self, job_id, queue_index):
         self.job_id = job_id  # currently unused, might be useful when extending
         self.queue_index = queue_index
 
+    def trace_ids(self):
+        return self.job_id, self.queue_index, float('nan')
+
     def process(self, sim: Queues):
         queue_index = self.queue_index
         assert sim.running[queue_index] == self.job_id  # the job must be the one running
-        sim.completions[self.job_id] = sim.t
+        if sim.preemptive:
+            sim.completion_events[queue_index] = None  # this event is being processed, it can't be canceled anymore
+            if sim.scheduling_type == SchedulingType.PS:
+                sim.ps_departure(self.job_id, queue_index)
+                return
+        sim.job_done(self.job_id, queue_index)
+        if sim.central_queue is not None:
+            sim.global_departure(queue_index)
+            return
+        sim.update_queue_length_distribution(queue_index)  # the length of this queue is about to change
+        sim.lengths.decrement(queue_index)
 
         queue = sim.queues[queue_index]
 
         if queue:  # If queue is not empty, choose next job based on scheduling type
-            new_job_id = queue.popleft()
+            new_job_id = queue.pop()
             sim.running[queue_index] = new_job_id  # Assign the next job
-            sim.schedule_completion(new_job_id, queue_index)  # Schedule its completion
+            # Schedule its completion
+            sim.schedule_completion(new_job_id, queue_index, sim.service_times.pop(new_job_id))
         else:
             sim.running[queue_index] = None  # No job is running on the queue
 
-        sim.update_queue_length_distribution()
+
+def sketch_percentiles(sim):
+    """The PERCENTILES of the response times, followed by those of the waiting times, as saved in the CSV file."""
+
+    return [sketch.quantile(p / 100) for sketch in [sim.response_sketch, sim.waiting_sketch] for p in PERCENTILES]
+
+
+def run_params(sim, max_t, target_ci=None, confidence=0.95):
+    """All the parameters the results of `sim`, run until max_t (or until the relative half-width of the confidence
+    interval of W reaches target_ci), depend on (besides the random streams)."""
+
+    params = {'lambd': sim.lambd, 'mu': sim.mu, 'max_t': max_t, 'n': sim.n, 'd': sim.d,
+              'scheduling_type': sim.scheduling_type.value, 'dispatch': sim.dispatch,
+              'weibull_shape': sim.weibull_shape if sim.weibull_mode else None, 'deadline_mode': sim.deadline_mode,
+              'target_ci': target_ci, 'confidence': confidence}
+    if sim.deadline_mode:
+        params['slack_margins'] = sim.slack_margins  # with EDF, a single margin, which changes the schedule
+    return params
+
+
+def run_record(sim, max_t, seed, replication, target_ci=None, confidence=0.95, target_reached=False):
+    """The results of `sim`, a finished run, as a dict (see result_store.py and result_cache.py)."""
+
+    return {
+        'simulator': 'queue_sim', 'params': run_params(sim, max_t, target_ci, confidence), 'seed': seed,
+        'replication': replication,
+        # in the order of CSV_COLUMNS, from w
+        'metrics': ([sim.response_times.mean if sim.response_times.count else math.nan]  # undefined without jobs
+                    + sketch_percentiles(sim) + [sim.response_batches.half_width(confidence)]),
+        'std': sim.response_times.std,
+        't': sim.t,
+        'target_reached': target_reached,  # whether the run stopped before max_t because target_ci was reached
+        'jobs': sim.response_times.count,
+        'queue_lengths': dict(sim.queue_length_distribution),
+        'slack_margins': sim.slack_margins if sim.deadline_mode else [],
+        'deadline_misses': sim.deadline_misses if sim.deadline_mode else [],
+    }
+
+
+def write_queue_lengths(path, queue_length_distribution, lambd, d, n):
+    """Append a queue length distribution to the CSV file `path` (d_out.csv), with a header if the file is new."""
+
+    file_exists = os.path.isfile(path)
+    with open(path, 'a', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        if not file_exists:
+            writer.writerow(["queue_length", "count", "lambda", "d", "n"])
+
+        for queue_length, count in queue_length_distribution.items():
+            writer.writerow([queue_length, count, lambd, d, n])
+
+
+def write_deadline_misses(path, slack_margins, deadline_misses, total_jobs, lambd, d):
+    """Append one row per slack margin to the CSV file `path` (dl.csv), with a header if the file is new."""
+
+    file_exists = os.path.isfile(path)
+    with open(path, 'a', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        # Write header only if the file does not already exist
+        if not file_exists:
+            writer.writerow(["Slack Margin", "Lambda", "d", "Total Jobs", "Deadline Misses", "Miss Rate (%)"])
+
+        for slack_margin, misses in zip(slack_margins, deadline_misses):
+            # Calculate and round the miss rate (undefined if no job completed)
+            miss_rate = round(misses / total_jobs * 100) if total_jobs else math.nan
+
+            # Write the current simulation's data
+            writer.writerow([
+                slack_margin,  # Slack Margin
+                lambd,  # Lambda
+                d,  # d
+                total_jobs,  # Total Jobs
+                misses,  # Deadline Misses
+                miss_rate  # Miss Rate (%), rounded
+            ])
 
 
 def main():
@@ -160,26 +476,78 @@ def main():
     parser.add_argument('--n', type=int, default=1, help="number of servers")
     parser.add_argument('--d', type=int, default=1, help="number of queues to sample")
     parser.add_argument('--csv', help="CSV file in which to store results")
+    parser.add_argument('--store', metavar='DB',
+                        help="save the results in the SQLite result store DB instead of d_out.csv and dl.csv "
+                             "(see result_store.py)")
+    parser.add_argument('--queue-lengths', default='d_out.csv', help="CSV file for the queue length distribution")
+    parser.add_argument('--cache', metavar='DIR',
+                        help="reuse the results of identical runs cached in DIR, and cache new ones (see "
+                             "result_cache.py)")
+    parser.add_argument('--cache-size', default=DEFAULT_CACHE_SIZE,
+                        help="size of the cache, beyond which the least recently used results are evicted")
+    parser.add_argument('--dl-csv', default='dl.csv', help="CSV file for the deadline misses (in deadline mode)")
+    parser.add_argument('--sketches', metavar='JSON_FILE',
+                        help="save the response and waiting time sketches, which can be merged across runs, as JSON")
     parser.add_argument("--seed", help="random seed", default=42)
+    parser.add_argument("--replication", type=int, default=0,
+                        help="replication number: each one gets independent random streams from the same seed")
     parser.add_argument("--verbose", action='store_true')
+    parser.add_argument("--event-trace", metavar='FILE',
+                        help="record every arrival and completion in the binary trace FILE (see event_trace.py)")
+    parser.add_argument("--event-queue", choices=EVENT_QUEUES, default='heap',
+                        help="event queue implementation (calendar is amortised O(1) for very large runs)")
+    parser.add_argument("--profile", nargs='?', const='-', metavar='JSON_FILE',
+                        help="print per-event-class statistics, or save them as JSON in JSON_FILE")
+    parser.add_argument("--checkpoint", metavar='FILE', help="periodically save a snapshot of the simulation in FILE")
+    parser.add_argument("--checkpoint-every", type=float, default=float('inf'),
+                        help="simulated time between two snapshots (one is always saved at the end)")
+    parser.add_argument("--resume", metavar='FILE',
+                        help="resume from a snapshot instead of starting anew (--max-t can extend the original one)")
+    parser.add_argument("--max-events", type=int, help="stop after processing this many events")
+    parser.add_argument("--wall-time", type=float, help="stop after this many seconds of wall-clock time")
+    parser.add_argument("--max-completions", type=int, help="stop after this many completed jobs")
+    parser.add_argument("--target-ci", type=float, metavar='REL',
+                        help="stop as soon as the half-width of the confidence interval of the average time spent in "
+                             "the system is at most REL times the average (e.g. 0.01), or at --max-t otherwise")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="confidence level of the interval (estimated with batch means) saved in the CSV file")
+    parser.add_argument("--ledger", metavar='DIR',
+                        help="save arrival, start, completion, server, service time and deadline of every job in DIR "
+                             "(see job_ledger.py)")
+    parser.add_argument("--no-fast-path", action='store_true',
+                        help="always use the event loop, even where the Lindley recursion applies (see lindley.py)")
+    parser.add_argument("--streaming", action='store_true',
+                        help="keep per-job data only while jobs are in the system: memory scales with the jobs in the "
+                             "system rather than with all the jobs ever seen")
 
     # weibull mode
     parser.add_argument("--weibull_mode", action='store_true',
                         help="Use Weibull distribution for arrival and service times")
     parser.add_argument("--weibull_shape", type=float, default=1, help="Shape parameter for Weibull distribution")
 
+    # Deadline mode
+    parser.add_argument("--deadline_mode", action='store_true', help="Add deadline to jobs")
+    parser.add_argument("--slack_margin", type=float, nargs='+', default=[1.0],
+                        help="Slack Margin: with several margins, all are evaluated on the same run (one run per "
+                             "margin with EDF, all on the same random inputs)")
+
+    # Scheduling type
+    parser.add_argument("--scheduling_type", type=str, choices=[t.value for t in SchedulingType],
+                        default=SchedulingType.FIFO.value, help="Scheduling type (see scheduling_type.py)")
+    parser.add_argument("--dispatch", choices=DISPATCH_MODES, default='supermarket',
+                        help="supermarket: each job joins the shortest of d queues sampled at random; global: jobs "
+                             "wait in one central queue served by all servers (queue lengths are then jobs in the "
+                             "system)")
+
     args = parser.parse_args()
 
-    params = [getattr(args, column) for column in CSV_COLUMNS[:-1]]
+    params = [getattr(args, column) for column in CSV_COLUMNS[:CSV_COLUMNS.index('w')]]
     # corresponds to params = [args.lambd, args.mu, args.max_t, args.n, args.d]
 
     if any(x <= 0 for x in params):
         logging.error("lambd, mu, max-t, n and d must all be positive")
         exit(1)
 
-    if args.seed:
-        seed(args.seed)  # set a seed to make experiments repeatable
-
     if args.verbose:
         # output info on stderr
         logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')
@@ -187,42 +555,171 @@ def main():
     if args.lambd >= args.mu:
         logging.warning("The system is unstable: lambda >= mu")
 
-    sim = Queues(args.lambd, args.mu, args.n, args.d,
-                 args.weibull_mode, args.weibull_shape)
-
-    sim.run(args.max_t)
-
-    completions = sim.completions
+    if not 0 < args.confidence < 1 or (args.target_ci is not None and args.target_ci <= 0):
+        logging.error("confidence must be between 0 and 1, and target-ci positive")
+        exit(1)
+    if args.target_ci is not None and any(option is not None for option in [
+            args.checkpoint, args.profile, args.max_events, args.wall_time, args.max_completions]):
+        logging.error("--target-ci stops at --max-t at the latest: it cannot be combined with --checkpoint, --profile, "
+                      "--max-events, --wall-time or --max-completions")
+        exit(1)
 
-    W = ((sum(completions.values()) - sum(sim.arrivals[job_id] for job_id in completions)) / len(completions))
+    if SchedulingType(args.scheduling_type) == SchedulingType.EDF and len(args.slack_margin) > 1:
+        # EDF schedules depend on the deadlines, so each margin needs its own run; all runs see the same arrivals and
+        # service times, since they use the same random streams
+        if any(option is not None for option in [args.resume, args.checkpoint, args.ledger, args.event_trace,
+                                                 args.sketches, args.profile]):
+            logging.error("with EDF, snapshots, ledgers, event traces, sketches and profiles need a single slack "
+                          "margin")
+            exit(1)
+        for slack_margin in args.slack_margin:
+            simulate(argparse.Namespace(**{**vars(args), 'slack_margin': [slack_margin]}), params)
+    else:
+        simulate(args, params)
+
+
+def simulate(args, params):
+    """Run the simulation described by the command-line arguments `args` and report its results."""
+
+    if args.resume:
+        sim = Queues.load_checkpoint(args.resume)
+        if ((sim.lambd, sim.mu, sim.n, sim.d, sim.scheduling_type, sim.dispatch)
+                != (args.lambd, args.mu, args.n, args.d, SchedulingType(args.scheduling_type), args.dispatch)):
+            logging.error("the snapshot was taken with different values of lambd, mu, n, d, scheduling type or "
+                          "dispatch")
+            exit(1)
+        if sim.ledger is not None:
+            sim.ledger.resume()
+    else:
+        try:
+            sim = Queues(args.lambd, args.mu, args.n, args.d,
+                         args.weibull_mode, args.weibull_shape,
+                         args.deadline_mode, args.slack_margin,
+                         SchedulingType(args.scheduling_type), args.event_queue,
+                         RandomStreams(args.seed, args.replication),  # a seed makes experiments repeatable
+                         args.streaming, None if args.ledger is None else JobLedger(args.ledger), args.dispatch)
+        except ValueError as e:
+            logging.error(e)
+            exit(1)
+
+    # results depend only on the parameters, the random streams and the code, unless a run is cut short or resumed;
+    # runs that save more than the results (ledger, traces, ...) or are unseeded always simulate
+    cache = record = None
+    uncacheable = [args.resume, args.checkpoint, args.ledger, args.event_trace, args.sketches, args.profile,
+                   args.max_events, args.wall_time, args.max_completions]
+    if args.cache is not None and args.seed is not None and all(option is None for option in uncacheable):
+        cache = ResultCache(args.cache, args.cache_size)
+        key = cache.key('queue_sim', __file__, run_params(sim, args.max_t, args.target_ci, args.confidence),
+                        args.seed, args.replication)
+        record = cache.get(key)
+        if record is not None:
+            logging.info(f"results found in the cache {args.cache}")
+    if record is None:
+        record = run_simulation(args, sim)
+        if cache is not None:
+            cache.put(key, record, record['params'])
+    report(args, params, record)
+
+
+def run_simulation(args, sim):
+    """Run `sim` as the command-line arguments `args` say, and return its results (see `run_record`)."""
+
+    event_trace = None
+    if args.event_trace:
+        event_trace = EventTraceWriter(args.event_trace, append=args.resume is not None)
+        sim.set_event_trace(event_trace)
+
+    stop_when = None
+    if args.max_completions is not None:
+        stop_when = lambda sim: sim.response_times.count >= args.max_completions
+    precise_enough = None
+    if args.target_ci is not None:
+        precise_enough = lambda sim: (sim.response_batches.half_width(args.confidence)
+                                      <= args.target_ci * sim.response_times.mean)
+    engine_only = [args.profile, args.checkpoint, args.max_events, args.wall_time, args.max_completions]
+    stopped = reached = None
+    if not args.no_fast_path and lindley.applicable(sim) and all(option is None for option in engine_only):
+        logging.info("FIFO servers with random dispatch: using the Lindley recursion instead of the event loop")
+        reached = lindley.run_lindley(sim, args.max_t, stop_when=precise_enough)
+    elif all(option is None for option in engine_only):
+        # in batches of simulated time, for the confidence interval
+        reached = sim.run_batches(args.max_t, precise_enough)
+    else:  # no confidence interval
+        stopped = sim.run(args.max_t, profile=args.profile is not None,
+                          checkpoint=args.checkpoint, checkpoint_interval=args.checkpoint_every,
+                          max_events=args.max_events, wall_time=args.wall_time, stop_when=stop_when)
+    if stopped:
+        logging.warning(f"simulation stopped early ({stopped}) at time {sim.t}")
+    if reached:
+        logging.info(f"target confidence interval reached at time {sim.t}")
+    if args.profile is not None:
+        sim.profile.save(args.profile)
+    if event_trace is not None:
+        event_trace.close()
+
+    sim.flush_queue_length_distribution()
+    if sim.ledger is not None:
+        sim.ledger.close()
+    if args.sketches is not None:
+        with open(args.sketches, 'w') as f:
+            json.dump({'response': sim.response_sketch.to_dict(), 'waiting': sim.waiting_sketch.to_dict()}, f)
+    return run_record(sim, args.max_t, args.seed, args.replication, args.target_ci, args.confidence, bool(reached))
+
+
+def report(args, params, record):
+    """Print the results in `record` (see `run_record`) and save them as the command-line arguments `args` say."""
+
+    W, percentiles, half_width = record['metrics'][0], record['metrics'][1:-1], record['metrics'][-1]
+    jobs = record['jobs']
     print(f"Average time spent in the system: {W}")
+    if not math.isnan(half_width):
+        print(f"{args.confidence:.0%} confidence interval of the average: {W} ± {half_width:.4g} "
+              f"({half_width / W:.2%})")
+    if args.target_ci is not None:
+        if record['target_reached']:
+            print(f"Target confidence interval reached at time {record['t']:.6g}, after {jobs} jobs")
+        else:
+            print(f"Target confidence interval not reached by time {args.max_t}")
+    print(f"Standard deviation of the time spent in the system: {record['std']}")
+    for kind, values in [("Time spent in the system", percentiles[:len(PERCENTILES)]),
+                         ("Waiting time", percentiles[len(PERCENTILES):])]:
+        print(f"{kind} percentiles: " + ', '.join(f"p{p}={value:.4g}" for p, value in zip(PERCENTILES, values)))
 
     # Theoretical M/M/1 (only valid if d=1, mu=1, etc.)
-    if args.mu == 1 and args.lambd != 1 and args.d == 1:
+    if args.mu == 1 and args.lambd != 1 and args.d == 1 and args.dispatch == 'supermarket':
         print(f"Theoretical expectation for random server choice (d=1): {1 / (1 - args.lambd)}")
 
     if args.csv is not None:
         with open(args.csv, 'a', newline='') as f:
             writer = csv.writer(f)
-            writer.writerow(params + [W])
-
-    # Check if the CSV file exists
-    file_name_plot = "d_out.csv"
-    file_exists = os.path.isfile(file_name_plot)
-
-    # Append results to CSV
-    try:
-        with open(file_name_plot, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            if not file_exists:
-                writer.writerow(["queue_length", "count", "lambda", "d", "n"])
-
-            for queue_length, count in sim.queue_length_distribution.items():
-                writer.writerow([queue_length, count, args.lambd, args.d, args.n])
-    except IOError as e:
-        logging.error(f"Failed to write to file {file_name_plot}: {e}")
-        exit(1)
-
+            writer.writerow(params + record['metrics'])
+
+    if args.store is not None:
+        from result_store import ResultStore  # result_store imports this module
+        store = ResultStore(args.store)
+        store.add_many([record])
+        store.close()
+    else:
+        # Append results to CSV
+        try:
+            write_queue_lengths(args.queue_lengths, record['queue_lengths'], args.lambd, args.d, args.n)
+        except IOError as e:
+            logging.error(f"Failed to write to file {args.queue_lengths}: {e}")
+            exit(1)
+
+    for slack_margin, deadline_misses in zip(record['slack_margins'], record['deadline_misses']):
+        print(f"Deadline mode with slack margin= {slack_margin}")
+        print(f"Deadline misses / Total jobs: {deadline_misses} / {jobs}")
+        print(f"Deadline miss rate: {deadline_misses / jobs * 100 if jobs else math.nan:.2f}%")
+
+    if record['slack_margins'] and args.store is None:
+        # Record to CSV
+        try:
+            write_deadline_misses(args.dl_csv, record['slack_margins'], record['deadline_misses'], jobs,
+                                  args.lambd, args.d)
+        except IOError as e:
+            logging.error(f"Failed to write to file {args.dl_csv}: {e}")
+            exit(1)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# result_cache.py
+"""On-disk cache of simulation results, so that re-running a sweep only simulates the points that changed.
+
+An entry is keyed by a hash of the simulator name, its parameters, the seed and replication, and the source code of
+the simulator: the file of its main module and, recursively, of the modules it imports from the same directory. Any
+change to that code gives new keys, so stale results are never served (they are evicted eventually). Entries are
+pickle files in the cache directory; when their total size exceeds the limit, the least recently used ones are
+deleted. Several processes can share a cache: entries are written atomically.
+
+queue_sim.py, sweep.py and sir.py use a cache with --cache DIR, and so does storage.py in Assignment2, which keeps a
+copy of this file. The command line shows and invalidates entries:
+
+    ./result_cache.py cache info
+    ./result_cache.py cache invalidate --simulator queue_sim --where lambd=0.99
+"""
+
+import argparse
+import ast
+import collections
+import functools
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from humanfriendly import format_size, parse_size
+
+DEFAULT_SIZE = '1 GB'
+
+
+@functools.cache
+def source_hash(path):
+    """Hash of the source file `path` and of the modules of its directory it imports, recursively."""
+
+    directory = os.path.dirname(os.path.abspath(path))
+    seen = set()
+    todo = [os.path.abspath(path)]
+    while todo:
+        file = todo.pop()
+        if file in seen:
+            continue
+        seen.add(file)
+        with open(file, 'rb') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):  # imports inside functions count too
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_file = os.path.join(directory, name.split('.')[0] + '.py')
+                if os.path.isfile(module_file):
+                    todo.append(module_file)
+    digest = hashlib.sha256()
+    for file in sorted(seen):
+        with open(file, 'rb') as f:
+            digest.update(os.path.basename(file).encode() + b'\0' + f.read() + b'\0')
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Results cached in the directory `path`, up to `max_size` bytes (a number or a string like '1 GB')."""
+
+    def __init__(self, path, max_size=DEFAULT_SIZE):
+        self.path = path
+        self.max_size = parse_size(max_size) if isinstance(max_size, str) else max_size
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, simulator, source, params, seed, replication):
+        """The key of a run of `simulator`, whose main module is the file `source`.
+
+        Only cache seeded runs: an unseeded one (seed None) would be served again instead of drawing new numbers.
+        """
+
+        if seed is None:
+            raise ValueError("unseeded runs can't be cached")
+        description = json.dumps([simulator, source_hash(source), params, str(seed), replication], sort_keys=True)
+        return f'{simulator}-{hashlib.sha256(description.encode()).hexdigest()}'
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f'{key}.pkl')
+
+    def get(self, key):
+        """The result cached for `key`, or None."""
+
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                entry = pickle.load(f)
+            os.utime(self._entry_path(key))  # the modification time is the last use, for LRU eviction
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError, TypeError, IndexError):
+            # e.g., written by an incompatible version of the code (ImportError includes ModuleNotFoundError): drop it
+            self._remove(key)
+            return None
+        return entry['result']
+
+    def put(self, key, result, params=None):
+        """Cache `result` for `key`; `params` are saved with it, for `invalidate`."""
+
+        with tempfile.NamedTemporaryFile('wb', dir=self.path, suffix='.tmp', delete=False) as f:
+            pickle.dump({'params': params, 'result': result}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, self._entry_path(key))  # atomic: readers never see half an entry
+        self.evict()
+
+    def entries(self):
+        """(key, size, last use) of each entry, least recently used first."""
+
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except FileNotFoundError:  # evicted by another process meanwhile
+                    continue
+                entries.append((name[:-len('.pkl')], stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_size."""
+
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_size:
+                break
+            self._remove(key)
+            total -= size
+
+    def invalidate(self, simulator=None, **params):
+        """Delete the entries of `simulator` (all simulators if None) whose parameters have the given values.
+
+        Returns the number of entries deleted.
+        """
+
+        removed = 0
+        for key, _, _ in self.entries():
+            if simulator is not None and not key.startswith(f'{simulator}-'):
+                continue
+            if params:
+                try:
+                    with open(self._entry_path(key), 'rb') as f:
+                        entry_params = pickle.load(f)['params'] or {}
+                except (FileNotFoundError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError,
+                        TypeError, IndexError):
+                    continue
+                if any(entry_params.get(name) != value for name, value in params.items()):
+                    continue
+            self._remove(key)
+            removed += 1
+        return removed
+
+    def _remove(self, key):
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+
+def parse_where(conditions):
+    """['n=10', 'scheduling_type=FIFO'] -> {'n': 10, 'scheduling_type': 'FIFO'}."""
+
+    params = {}
+    for condition in conditions:
+        name, _, value = condition.partition('=')
+        try:
+            params[name] = json.loads(value)
+        except json.JSONDecodeError:
+            params[name] = value  # a string
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description="show or invalidate a cache of simulation results")
+    parser.add_argument('cache', help="cache directory (see --cache in queue_sim.py, sweep.py, sir.py and storage.py)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('info', help="print the number and size of the entries of each simulator")
+    invalidate = subparsers.add_parser('invalidate', help="delete entries (all of them by default)")
+    invalidate.add_argument('--simulator', help="only entries of this simulator, e.g. queue_sim, sir or storage")
+    invalidate.add_argument('--where', nargs='*', default=[], metavar='PARAM=VALUE',
+                            help="only entries with these parameters, e.g. lambd=0.99 d=2")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache)
+    if args.command == 'info':
+        counts, sizes = collections.Counter(), collections.Counter()
+        for key, size, _ in cache.entries():
+            simulator = key.rpartition('-')[0]
+            counts[simulator] += 1
+            sizes[simulator] += size
+        for simulator in sorted(counts):
+            print(f"{simulator}: {counts[simulator]} entries, {format_size(sizes[simulator])}")
+        print(f"total: {sum(counts.values())} entries, {format_size(sum(sizes.values()))}")
+    else:
+        removed = cache.invalidate(args.simulator, **parse_where(args.where))
+        print(f"{removed} entries deleted")
+
+
+if __name__ == '__main__':
+    main()
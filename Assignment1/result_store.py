@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# result_store.py
+"""SQLite store of simulation results.
+
+Appending to out.csv, d_out.csv and dl.csv keeps every run ever made, with no way to tell them apart. A
+`ResultStore` instead keeps one run per key (simulator, full parameter set, seed, replication, code version):
+running the same simulation again replaces its results. The parameters are stored as canonical JSON, with the usual
+ones (lambd, mu, max_t, n, d) also in indexed columns; queue length distributions and deadline misses go to tables of
+their own. Inserts are batched in transactions, and the database is in WAL mode, so several processes can write to
+it at once (e.g., queue_sim.py runs started in parallel by a shell script).
+
+queue_sim.py and sweep.py save their results here with --store DB; the CSV files read by the plot scripts are then
+exported from it:
+
+    ./result_store.py results.db export out out.csv --where n=10 scheduling_type=FIFO
+    ./result_store.py results.db export queue-lengths d_out.csv
+    ./result_store.py results.db export deadline-misses dl.csv --where scheduling_type=EDF
+
+By default, only the most recent run of each key is exported when the code changed in between (--all-versions
+exports them all).
+"""
+
+import argparse
+import csv
+import functools
+import json
+import math
+import os
+import sqlite3
+import subprocess
+import time
+
+from queue_sim import CSV_COLUMNS, write_deadline_misses, write_queue_lengths
+from result_cache import parse_where
+
+PARAM_COLUMNS = CSV_COLUMNS[:CSV_COLUMNS.index('w')]  # lambd, mu, max_t, n, d
+METRIC_COLUMNS = CSV_COLUMNS[CSV_COLUMNS.index('w'):]  # w, its percentiles, those of the waiting times, w_ci
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    simulator TEXT NOT NULL,
+    params TEXT NOT NULL,  -- JSON, with sorted keys
+    seed TEXT NOT NULL,
+    replication INTEGER NOT NULL,
+    code_version TEXT NOT NULL,
+    created REAL NOT NULL,
+    {', '.join(f'{column} REAL' for column in PARAM_COLUMNS)},
+    {', '.join(f'{column} REAL' for column in METRIC_COLUMNS)},
+    jobs INTEGER,
+    UNIQUE (simulator, params, seed, replication, code_version)
+);
+CREATE INDEX IF NOT EXISTS runs_by_params ON runs (simulator, {', '.join(PARAM_COLUMNS)});
+CREATE TABLE IF NOT EXISTS queue_lengths (
+    run_id INTEGER NOT NULL REFERENCES runs ON DELETE CASCADE,
+    queue_length INTEGER NOT NULL,
+    time REAL NOT NULL,  -- total time spent by the queues at this length
+    PRIMARY KEY (run_id, queue_length)
+);
+CREATE TABLE IF NOT EXISTS deadline_misses (
+    run_id INTEGER NOT NULL REFERENCES runs ON DELETE CASCADE,
+    slack_margin REAL NOT NULL,
+    misses INTEGER NOT NULL,
+    PRIMARY KEY (run_id, slack_margin)
+);
+"""
+
+
+@functools.cache
+def code_version():
+    """The git commit of this code (with a -dirty suffix if it has uncommitted changes), or 'unknown'."""
+
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty', '--abbrev=12'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class ResultStore:
+    """Simulation results in the SQLite database `path` (created if needed)."""
+
+    def __init__(self, path, timeout=60.0):
+        self.connection = sqlite3.connect(path, timeout=timeout)  # wait up to `timeout` seconds for other writers
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+        # databases created before a metric was added (e.g. w_ci) get its column, NULL for the old runs
+        existing = {row['name'] for row in self.connection.execute("PRAGMA table_info(runs)")}
+        with self.connection:
+            for column in METRIC_COLUMNS:
+                if column not in existing:
+                    self.connection.execute(f"ALTER TABLE runs ADD COLUMN {column} REAL")
+
+    def close(self):
+        self.connection.close()
+
+    def add_many(self, records):
+        """Insert `records` (see `queue_sim.run_record`) in a single transaction, replacing runs with the same key."""
+
+        version = code_version()
+        columns = ['simulator', 'params', 'seed', 'replication', 'code_version', 'created'] + PARAM_COLUMNS \
+            + METRIC_COLUMNS + ['jobs']
+        insert = f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        with self.connection:
+            for record in records:
+                params = record['params']
+                key = [record['simulator'], json.dumps(params, sort_keys=True), str(record['seed']),
+                       record['replication'], version]
+                self.connection.execute("DELETE FROM runs WHERE simulator = ? AND params = ? AND seed = ? "
+                                        "AND replication = ? AND code_version = ?", key)
+                run_id = self.connection.execute(insert, key + [time.time()] + [params.get(c) for c in PARAM_COLUMNS]
+                                                 + record['metrics'] + [record['jobs']]).lastrowid
+                self.connection.executemany("INSERT INTO queue_lengths VALUES (?, ?, ?)",
+                                            [(run_id, length, total)
+                                             for length, total in record['queue_lengths'].items()])
+                self.connection.executemany("INSERT INTO deadline_misses VALUES (?, ?, ?)",
+                                            zip([run_id] * len(record['slack_margins']), record['slack_margins'],
+                                                record['deadline_misses']))
+
+    def runs(self, simulator='queue_sim', all_versions=False, **params):
+        """The runs of `simulator` whose parameters have the given values, ordered by parameters.
+
+        Unless `all_versions` is true, only the most recent run of each key is returned when the code version differs.
+        """
+
+        conditions, values = ["simulator = ?"], [simulator]
+        for name, value in params.items():
+            if not name.isidentifier():
+                raise ValueError(f"invalid parameter name {name!r}")
+            if name in PARAM_COLUMNS:  # indexed
+                conditions.append(f"{name} = ?")
+            else:
+                conditions.append(f"json_extract(params, '$.{name}') IS ?")
+                if isinstance(value, (list, dict)):  # json_extract returns those as minified JSON
+                    value = json.dumps(value, separators=(',', ':'))
+            values.append(value)
+        if not all_versions:
+            conditions.append("id IN (SELECT MAX(id) FROM runs GROUP BY simulator, params, seed, replication)")
+        return self.connection.execute(f"SELECT * FROM runs WHERE {' AND '.join(conditions)} "
+                                       f"ORDER BY {', '.join(PARAM_COLUMNS)}, seed, replication, id", values).fetchall()
+
+    def queue_lengths(self, run_id):
+        """The queue length distribution of a run, as a dict queue length -> total time."""
+
+        return dict(self.connection.execute("SELECT queue_length, time FROM queue_lengths WHERE run_id = ? "
+                                            "ORDER BY queue_length", (run_id,)).fetchall())
+
+    def deadline_misses(self, run_id):
+        """The (slack margin, deadline misses) pairs of a run."""
+
+        return self.connection.execute("SELECT slack_margin, misses FROM deadline_misses WHERE run_id = ? "
+                                       "ORDER BY slack_margin", (run_id,)).fetchall()
+
+    def export(self, kind, path, runs):
+        """Write `runs` to the CSV file `path` in the format of out.csv, d_out.csv or dl.csv (`kind` out,
+        queue-lengths or deadline-misses), replacing it."""
+
+        if os.path.exists(path):
+            os.remove(path)
+        if kind == 'out':
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                for run in runs:
+                    writer.writerow([run['lambd'], run['mu'], run['max_t'], int(run['n']), int(run['d'])]
+                                    + [math.nan if run[column] is None else run[column]  # SQLite stores NaN as NULL
+                                       for column in METRIC_COLUMNS])
+            return
+        for run in runs:
+            if kind == 'queue-lengths':
+                write_queue_lengths(path, self.queue_lengths(run['id']), run['lambd'], int(run['d']), int(run['n']))
+            else:
+                misses = self.deadline_misses(run['id'])
+                if misses:
+                    write_deadline_misses(path, *zip(*misses), run['jobs'], run['lambd'], int(run['d']))
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description="query and export a store of simulation results")
+    parser.add_argument('db', help="SQLite database (see --store in queue_sim.py and sweep.py)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help="write runs in the CSV formats read by the plot scripts")
+    export.add_argument('kind', choices=['out', 'queue-lengths', 'deadline-misses'],
+                        help="the format of out.csv, d_out.csv or dl.csv")
+    export.add_argument('csv', help="CSV file to write (replaced if it exists)")
+    show = subparsers.add_parser('list', help="print the runs")
+    for subparser in export, show:
+        subparser.add_argument('--simulator', default='queue_sim')
+        subparser.add_argument('--where', nargs='*', default=[], metavar='PARAM=VALUE',
+                               help="only runs with these parameters, e.g. n=10 scheduling_type=EDF")
+        subparser.add_argument('--all-versions', action='store_true',
+                               help="include the runs of older code versions with the same parameters")
+    args = parser.parse_args()
+
+    store = ResultStore(args.db)
+    runs = store.runs(args.simulator, args.all_versions, **parse_where(args.where))
+    if args.command == 'export':
+        store.export(args.kind, args.csv, runs)
+        print(f"{len(runs)} runs written to {args.csv}")
+    else:
+        for run in runs:
+            w = math.nan if run['w'] is None else run['w']  # NULL when no job completed
+            print(run['id'], run['params'], f"seed={run['seed']} replication={run['replication']}",
+                  run['code_version'], f"W={w:.4g}", f"jobs={run['jobs']}")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,122 @@
+# scheduling_type.py
+"""Scheduling disciplines of the queue simulator.
+
+`SchedulingType` names a discipline, and `make_discipline` returns the corresponding waiting line: an object with
+`push(job_id, service_time, deadline)`, `pop()` (which returns the id of the next job to serve and raises IndexError
+when empty) and `len()`. Operations cost O(1) (FIFO, LIFO) or O(log q) (the others) in the number q of waiting jobs;
+ties are broken by job id, i.e., by order of arrival.
+
+SRPT and PS are preemptive. With SRPT, the waiting line is the SJF heap, where a preempted job is pushed back with
+its remaining work as service time. With PS, all the jobs of a server are in service at once and the `PSQueue` holds
+them all (see its docstring).
+"""
+
+import collections
+import heapq
 from enum import Enum
 
+
 class SchedulingType(Enum):
-    FIFO = "FIFO" # First In First Out
+    FIFO = "FIFO"  # First In First Out
+    LIFO = "LIFO"  # Last In First Out
     SJF = "SJF"  # Shortest Job First
     EDF = "EDF"  # Earliest Deadline First
+    SRPT = "SRPT"  # Shortest Remaining Processing Time (preemptive)
+    PS = "PS"  # Processor Sharing (preemptive)
+
+
+class FIFOQueue:
+    __slots__ = ('jobs',)
+
+    def __init__(self):
+        self.jobs = collections.deque()
+
+    def push(self, job_id, service_time, deadline):
+        self.jobs.append(job_id)
+
+    def pop(self):
+        return self.jobs.popleft()
+
+    def __len__(self):
+        return len(self.jobs)
+
+
+class LIFOQueue(FIFOQueue):
+    __slots__ = ()
+
+    def pop(self):
+        return self.jobs.pop()
+
+
+class SJFQueue:
+    """Heap of (service time, job id) pairs."""
+
+    __slots__ = ('jobs',)
+
+    def __init__(self):
+        self.jobs = []
+
+    def push(self, job_id, service_time, deadline):
+        heapq.heappush(self.jobs, (service_time, job_id))
+
+    def pop(self):
+        return heapq.heappop(self.jobs)[1]
+
+    def __len__(self):
+        return len(self.jobs)
+
+
+class EDFQueue(SJFQueue):
+    """Heap of (deadline, job id) pairs."""
+
+    __slots__ = ()
+
+    def push(self, job_id, service_time, deadline):
+        heapq.heappush(self.jobs, (deadline, job_id))
+
+
+class PSQueue(SJFQueue):
+    """Egalitarian processor sharing: the k jobs in service each get 1/k of the server.
+
+    Instead of tracking the remaining work of every job, which changes whenever k does, we keep a virtual time that
+    grows at rate 1/k: a job that arrives at virtual time v with service time s completes when the virtual time
+    reaches v + s. These finish tags never change, so the jobs are kept in a heap by tag and an arrival or a departure
+    costs O(log k). Call `advance(t)` before pushing or popping at time t.
+    """
+
+    __slots__ = ('virtual_time', 'updated')
+
+    def __init__(self):
+        super().__init__()
+        self.virtual_time = 0.0
+        self.updated = 0.0  # time of the last call to advance
+
+    def advance(self, t):
+        if self.jobs:
+            self.virtual_time += (t - self.updated) / len(self.jobs)
+        self.updated = t
+
+    def push(self, job_id, service_time, deadline):
+        heapq.heappush(self.jobs, (self.virtual_time + service_time, job_id))
+
+    def next_completion(self):
+        """Return (delay, job id): the job that completes first if no job arrives meanwhile, and after how long."""
+
+        tag, job_id = self.jobs[0]
+        return max(tag - self.virtual_time, 0.0) * len(self.jobs), job_id  # rounding can make it negative
+
+
+DISCIPLINES = {
+    SchedulingType.FIFO: FIFOQueue,
+    SchedulingType.LIFO: LIFOQueue,
+    SchedulingType.SJF: SJFQueue,
+    SchedulingType.EDF: EDFQueue,
+    SchedulingType.SRPT: SJFQueue,  # ordered by remaining work
+    SchedulingType.PS: PSQueue,
+}
+
+
+def make_discipline(scheduling_type=SchedulingType.FIFO):
+    """Return an empty waiting line for the given SchedulingType."""
+
+    return DISCIPLINES[scheduling_type]()
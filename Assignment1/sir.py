@@ -4,11 +4,14 @@ import argparse
 import collections
 import enum
 import logging
-import random
 
 from matplotlib import pyplot as plt
 
-from discrete_event_sim import Simulation, Event
+from discrete_event_sim import Simulation, Event, pooled
+from event_queue import EVENT_QUEUES
+from random_streams import RandomStreams
+from result_cache import DEFAULT_SIZE as DEFAULT_CACHE_SIZE, ResultCache
+from tracing import JsonLinesSink, TextSink, Tracer
 
 
 class Condition(enum.Enum):
@@ -29,12 +32,25 @@ class SIR(Simulation):
     periodically through the MonitorSIR event.
     """
 
-    def __init__(self, population, infected, contact_rate, recovery_rate, plot_interval):
-        super().__init__()  # call the initialization method from Simulation
+    TRACE_FORMATS = {  # how trace records are rendered by --verbose
+        'infected': '{patient} infected',
+        'contact': '{source} contacts {destination}',
+        'recovered': '{patient} recovered',
+    }
+
+    def __init__(self, population, infected, contact_rate, recovery_rate, plot_interval, event_queue='heap',
+                 tracer=None, streams=None):
+        super().__init__(event_queue, tracer, streams)  # call the initialization method from Simulation
+        # contacts and recoveries draw from pools of variates generated in blocks (see random_streams.py)
+        self.contact_delay = self.streams.pool('contacts', 'exponential')  # unit mean, divide by the rate
+        self.contact_target = self.streams.pool('contact-targets', 'integers', population)
+        self.recovery_delay = self.streams.pool('recoveries', 'exponential')
         self.contact_rate = contact_rate
         self.recovery_rate = recovery_rate
         self.conditions = [Condition.SUSCEPTIBLE] * population  # a list of identical items of length 'population'
-        for i in random.sample(range(population), infected):  # starting infected individuals
+        # pending Contact event of each infected individual, as an (event, seq) handle: contacts are pooled
+        self.next_contacts = [None] * population
+        for i in self.streams.stream('seeding').sample(range(population), infected):  # starting infected individuals
             self.infect(i)
         self.s, self.i, self.r = [], [], []  # values of susceptible, infected, recovered over time
         self.schedule(0, MonitorSIR(plot_interval))
@@ -42,22 +58,27 @@ class SIR(Simulation):
     def schedule_contact(self, patient):
         """Schedule a patient's next contact."""
 
-        other = random.randrange(len(self.conditions))  # choose a random contact
-        self.schedule(random.expovariate(self.contact_rate), Contact(patient, other))
+        other = self.contact_target()  # choose a random contact
+        event = self.schedule(self.contact_delay() / self.contact_rate, Contact.new(patient, other))
+        self.next_contacts[patient] = event, event.seq
 
     def infect(self, i):
         """Patient i is infected."""
 
-        self.log_info(f"{i} infected")
+        if self.tracing:
+            self.trace('infected', patient=i)
         self.conditions[i] = Condition.INFECTED
         self.schedule_contact(i)  # schedule the patient's next contact
         # (further contacts will be scheduled by the Contact event, see the process() function)
-        self.schedule(random.expovariate(self.recovery_rate), Recover(i))  # schedule the patient's recovery
+        self.schedule(self.recovery_delay() / self.recovery_rate, Recover(i))  # schedule the patient's recovery
 
 
+@pooled
 class Contact(Event):
     """A possible contagion event."""
 
+    __slots__ = ('source', 'destination')
+
     def __init__(self, source, destination):
         """Parameters: indexes of both the source and the destination of the possible contagion."""
 
@@ -67,7 +88,8 @@ class Contact(Event):
     def process(self, sim):
         """If the patient is still infectious and the contact is susceptible, the latter will be infected."""
 
-        sim.log_info(f"{self.source} contacts {self.destination}")
+        if sim.tracing:
+            sim.trace('contact', source=self.source, destination=self.destination)
         if sim.conditions[self.source] != Condition.INFECTED:
             return  # healthy people can't infect
         if sim.conditions[self.destination] == Condition.SUSCEPTIBLE:
@@ -78,17 +100,25 @@ class Contact(Event):
 class Recover(Event):
     """A sick patient recovers."""
 
+    __slots__ = ('patient',)
+
     def __init__(self, patient):
         self.patient = patient
 
     def process(self, sim):
-        sim.log_info(f"{self.patient} recovered")
+        if sim.tracing:
+            sim.trace('recovered', patient=self.patient)
         sim.conditions[self.patient] = Condition.RECOVERED
+        event, seq = sim.next_contacts[self.patient]
+        event.cancel(seq)  # recovered people can't infect: drop their pending contact
+        sim.next_contacts[self.patient] = None
 
 
 class MonitorSIR(Event):
     """At any configurable interval, we save the number of susceptible, infected and recovered individuals."""
 
+    __slots__ = ('interval',)
+
     def __init__(self, interval=1):
         self.interval = interval
 
@@ -107,27 +137,83 @@ def main():
     parser.add_argument("--population", type=int, default=1000)
     parser.add_argument("--infected", type=int, default=1, help="starting infected individuals")
     parser.add_argument("--seed", help="random seed")
+    parser.add_argument("--replication", type=int, default=0,
+                        help="replication number: each one gets independent random streams from the same seed")
     parser.add_argument("--avg-contact-time", type=float, default=1)
     parser.add_argument("--avg-recovery-time", type=float, default=3)
     parser.add_argument("--verbose", action='store_true')
+    parser.add_argument("--trace", metavar='FILE', help="write trace records to FILE as JSON lines")
+    parser.add_argument("--trace-categories", nargs='*', choices=SIR.TRACE_FORMATS,
+                        help="only trace these categories (default: all)")
+    parser.add_argument("--event-queue", choices=EVENT_QUEUES, default='heap',
+                        help="event queue implementation (calendar is amortised O(1) for very large runs)")
+    parser.add_argument("--profile", nargs='?', const='-', metavar='JSON_FILE',
+                        help="print per-event-class statistics, or save them as JSON in JSON_FILE")
+    parser.add_argument("--checkpoint", metavar='FILE', help="periodically save a snapshot of the simulation in FILE")
+    parser.add_argument("--checkpoint-every", type=float, default=float('inf'),
+                        help="simulated time between two snapshots (one is always saved at the end)")
+    parser.add_argument("--resume", metavar='FILE',
+                        help="resume from a snapshot instead of starting anew (--max-t can extend the original one)")
+    parser.add_argument("--max-events", type=int, help="stop after processing this many events")
+    parser.add_argument("--wall-time", type=float, help="stop after this many seconds of wall-clock time")
     parser.add_argument("--plot_interval", type=float, default=1, help="how often to collect data points for the plot")
+    parser.add_argument("--cache", metavar='DIR',
+                        help="reuse the results of an identical run cached in DIR, or cache them (see result_cache.py)")
+    parser.add_argument("--cache-size", default=DEFAULT_CACHE_SIZE,
+                        help="size of the cache, beyond which the least recently used results are evicted")
     args = parser.parse_args()
 
-    if args.seed:
-        random.seed(args.seed)  # set a seed to make experiments repeatable
     if args.verbose:
         logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')  # output info on stdout
 
     # the rates to use in random.expovariate are 1 over the desired mean
-    sim = SIR(args.population, args.infected, 1 / args.avg_contact_time, 1 / args.avg_recovery_time, args.plot_interval)
-    sim.run()
-    assert all(c != Condition.INFECTED for c in sim.conditions)  # nobody should be infected at the end of the sim
-    print(f"Simulation over at time {sim.t:.2f}")
-
-    days = [i * args.plot_interval for i in range(len(sim.s))]  # compute the times at which values were taken
-    plt.plot(days, sim.s, label="Susceptible")
-    plt.plot(days, sim.i, label="Infected")
-    plt.plot(days, sim.r, label="Recovered")
+    sinks = []
+    if args.verbose:
+        sinks.append(TextSink(SIR.TRACE_FORMATS))
+    if args.trace:
+        sinks.append(JsonLinesSink(args.trace))
+    tracer = Tracer(sinks, categories=args.trace_categories)
+
+    # a full, seeded run that only produces the s, i, r series can be served from the cache: unseeded runs are
+    # meant to differ each time
+    cache = result = None
+    uncacheable = [args.resume, args.checkpoint, args.profile, args.max_events, args.wall_time, args.trace]
+    if (args.cache is not None and args.seed is not None and not args.verbose
+            and all(option is None for option in uncacheable)):
+        cache = ResultCache(args.cache, args.cache_size)
+        params = {'population': args.population, 'infected': args.infected,
+                  'avg_contact_time': args.avg_contact_time, 'avg_recovery_time': args.avg_recovery_time,
+                  'plot_interval': args.plot_interval}
+        key = cache.key('sir', __file__, params, args.seed, args.replication)
+        result = cache.get(key)
+
+    if result is None:
+        if args.resume:
+            sim = SIR.load_checkpoint(args.resume)
+            sim.set_tracer(tracer)
+        else:
+            sim = SIR(args.population, args.infected, 1 / args.avg_contact_time, 1 / args.avg_recovery_time,
+                      args.plot_interval, args.event_queue, tracer,
+                      RandomStreams(args.seed, args.replication))  # a seed makes experiments repeatable
+        stopped = sim.run(profile=args.profile is not None,
+                          checkpoint=args.checkpoint, checkpoint_interval=args.checkpoint_every,
+                          max_events=args.max_events, wall_time=args.wall_time)
+        if stopped:
+            logging.warning(f"simulation stopped early ({stopped}) at time {sim.t}")
+        if args.profile is not None:
+            sim.profile.save(args.profile)
+        # nobody should be infected at the end of the sim, unless it was stopped early
+        assert stopped or all(c != Condition.INFECTED for c in sim.conditions)
+        result = {'t': sim.t, 's': sim.s, 'i': sim.i, 'r': sim.r}
+        if cache is not None:
+            cache.put(key, result, params)
+    tracer.close()
+    print(f"Simulation over at time {result['t']:.2f}")
+
+    days = [i * args.plot_interval for i in range(len(result['s']))]  # compute the times at which values were taken
+    plt.plot(days, result['s'], label="Susceptible")
+    plt.plot(days, result['i'], label="Infected")
+    plt.plot(days, result['r'], label="Recovered")
     plt.xlabel("Days")
     plt.ylabel("Individuals")
     plt.legend(loc=0)
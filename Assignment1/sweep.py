@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# sweep.py
+"""Run a grid of queue simulations on a pool of worker processes.
+
+Every combination of lambda, d and replication (and of slack margin, with EDF) is a task for a pool of worker
+processes, one per core by default; the main process is the only one writing to the CSV files, and it does so as
+soon as each result arrives, in the same formats as queue_sim.py (out.csv, d_out.csv and dl.csv). Tasks that fail
+are retried, and progress is reported on stderr with an estimate of the remaining time. E.g.
+
+    ./sweep.py --lambd 0.5 0.7 0.9 0.95 0.99 --d 1 2 5 10 --n 10 --max-t 100_000 --replications 5
+
+With --target-ci REL, each simulation stops as soon as the confidence interval of W (batch means) is narrower than
+±REL*W, and --max-t is only a budget: low loads stop early, and high loads get the time they need.
+
+Each replication r of a point uses the random streams RandomStreams(seed, r), so results don't depend on the number
+of workers or on the order in which tasks complete.
+
+To use several hosts, start a coordinator with --serve HOST:PORT (and the grid options), then workers on any host
+with --connect HOST:PORT (and --workers), all with the same secret --authkey; see broker.py.
+"""
+
+import argparse
+import csv
+import itertools
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from humanfriendly import format_timespan
+
+import broker
+import lindley
+from event_queue import EVENT_QUEUES
+import queue_sim
+from queue_sim import DISPATCH_MODES, Queues, run_params, run_record, write_deadline_misses, write_queue_lengths
+from random_streams import RandomStreams
+from result_cache import DEFAULT_SIZE as DEFAULT_CACHE_SIZE, ResultCache
+from result_store import ResultStore
+from scheduling_type import SchedulingType
+
+
+def grid(args):
+    """The tasks of the sweep, as dicts of parameters."""
+
+    if SchedulingType(args.scheduling_type) == SchedulingType.EDF and len(args.slack_margin) > 1:
+        slack_margins = [[margin] for margin in args.slack_margin]  # with EDF, each margin needs its own run
+    else:
+        slack_margins = [args.slack_margin]  # one run evaluates all the margins
+    return [dict(lambd=lambd, d=d, slack_margin=margins, replication=replication)
+            for lambd, d, margins, replication
+            in itertools.product(args.lambd, args.d, slack_margins, range(args.replications))]
+
+
+def run_point(config, point):
+    """Simulate one task (in a worker process), or find it in the cache, and return its results (see
+    queue_sim.run_record).
+
+    `config` holds the parameters common to all the tasks, `point` those of this task (see `grid`).
+    """
+
+    start = time.perf_counter()
+    sim = Queues(point['lambd'], config['mu'], config['n'], point['d'],
+                 config['weibull_mode'], config['weibull_shape'],
+                 config['deadline_mode'], point['slack_margin'],
+                 SchedulingType(config['scheduling_type']), config['event_queue'],
+                 RandomStreams(config['seed'], point['replication']),
+                 streaming=True, dispatch=config['dispatch'])  # per-job data isn't needed after the run
+    cache = record = None
+    if config['cache'] is not None and config['seed'] is not None:
+        cache = ResultCache(config['cache'], config['cache_size'])
+        key = cache.key('queue_sim', queue_sim.__file__,
+                        run_params(sim, config['max_t'], config['target_ci'], config['confidence']), config['seed'],
+                        point['replication'])
+        record = cache.get(key)
+    if record is None:
+        precise_enough = None
+        if config['target_ci'] is not None:
+            precise_enough = lambda sim: (sim.response_batches.half_width(config['confidence'])
+                                          <= config['target_ci'] * sim.response_times.mean)
+        if not config['no_fast_path'] and lindley.applicable(sim):
+            reached = lindley.run_lindley(sim, config['max_t'], stop_when=precise_enough)
+        else:
+            reached = sim.run_batches(config['max_t'], precise_enough)
+        sim.flush_queue_length_distribution()
+        record = run_record(sim, config['max_t'], config['seed'], point['replication'], config['target_ci'],
+                            config['confidence'], reached)
+        if cache is not None:
+            cache.put(key, record, record['params'])
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def run_sweep(config, points, workers, retries, on_result):
+    """Run `points` on `workers` processes, calling `on_result(point, result)` in this process as results arrive.
+
+    A failed task is retried up to `retries` times. If a worker dies, its pool breaks and all the tasks it was running
+    fail with it: those are run again each in a pool of its own, where a worker that dies is charged to its task alone,
+    and a new pool takes the other tasks. Returns the failed points.
+    """
+
+    attempts = [0] * len(points)
+    todo = list(range(len(points)))
+    suspects = []  # points that were running in a pool when one of its workers died
+    failed = []
+
+    def retry(i, e):
+        """Charge an attempt to point i; whether it should run again."""
+
+        attempts[i] += 1
+        if attempts[i] > retries:
+            logging.error(f"{points[i]} failed {attempts[i]} times, giving up: {e!r}")
+            failed.append(points[i])
+            return False
+        logging.warning(f"{points[i]} failed, retrying: {e!r}")
+        return True
+
+    while todo or suspects:
+        isolated = bool(suspects)  # each point in a pool of its own
+        if isolated:
+            queued, suspects = suspects, []
+        else:
+            queued, todo = todo[::-1], []  # popped from the end
+        pools = []
+        running = {}  # future -> (point index, pool)
+        broken = False
+        try:
+            while queued or running:
+                while queued and len(running) < workers:  # no more than workers, so that all of them are running
+                    i = queued.pop()
+                    if isolated or not pools:
+                        pools.append(ProcessPoolExecutor(1 if isolated else workers))
+                    running[pools[-1].submit(run_point, config, points[i])] = i, pools[-1]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, pool = running.pop(future)
+                    if isolated:
+                        pool.shutdown()
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:  # a worker died
+                        if not isolated:
+                            broken = True
+                            suspects.append(i)  # we don't know which one of the running points killed it
+                        elif retry(i, e):
+                            suspects.append(i)
+                    except Exception as e:
+                        if retry(i, e):
+                            queued.append(i)
+                    else:
+                        on_result(points[i], result)
+                if broken:  # the other points wait for the next pool
+                    todo.extend(reversed(queued))
+                    queued = []
+        finally:
+            for pool in pools:
+                pool.shutdown()
+        if broken:
+            logging.warning(f"a worker process died, running again the {len(suspects)} simulations it may have "
+                            f"killed, one per process, then restarting the pool for {len(todo)} others")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description="run a grid of queue simulations in parallel")
+    parser.add_argument('--lambd', type=float, nargs='+', default=[0.5, 0.7, 0.9, 0.95, 0.99], help="arrival rates")
+    parser.add_argument('--mu', type=float, default=1, help="service rate")
+    parser.add_argument('--max-t', type=float, default=100_000, help="maximum time to run each simulation")
+    parser.add_argument('--target-ci', type=float, metavar='REL',
+                        help="stop each simulation as soon as the half-width of the confidence interval of W is at "
+                             "most REL times W (--max-t is then a budget), so that long runs go where the variance is")
+    parser.add_argument('--confidence', type=float, default=0.95, help="confidence level of the intervals of W")
+    parser.add_argument('--n', type=int, default=10, help="number of servers")
+    parser.add_argument('--d', type=int, nargs='+', default=[1, 2, 5, 10], help="numbers of queues to sample")
+    parser.add_argument('--replications', type=int, default=1, help="replications of each point of the grid")
+    parser.add_argument("--seed", help="random seed", default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--retries', type=int, default=2, help="times a failed simulation is retried")
+    parser.add_argument('--serve', metavar='HOST:PORT',
+                        help="don't run the simulations: hand them out to the workers connecting to HOST:PORT")
+    parser.add_argument('--connect', metavar='HOST:PORT',
+                        help="run --workers worker processes for the coordinator at HOST:PORT (ignores the grid)")
+    parser.add_argument('--lease-time', type=float, default=60,
+                        help="with --serve, seconds without news from a worker before its simulation is run again")
+    parser.add_argument('--authkey',
+                        help=f"secret key shared by the coordinator and the workers (default: ${broker.AUTHKEY_ENV}); "
+                             "if neither is set, --serve generates one and prints it")
+    parser.add_argument('--store', metavar='DB',
+                        help="save the results in the SQLite result store DB instead of the CSV files (see "
+                             "result_store.py)")
+    parser.add_argument('--store-batch', type=int, default=32, help="results saved per transaction with --store")
+    parser.add_argument('--cache', metavar='DIR',
+                        help="reuse the results of identical runs cached in DIR, and cache new ones (see "
+                             "result_cache.py)")
+    parser.add_argument('--cache-size', default=DEFAULT_CACHE_SIZE,
+                        help="size of the cache, beyond which the least recently used results are evicted")
+    parser.add_argument('--csv', default='out.csv', help="CSV file in which to store W and percentiles")
+    parser.add_argument('--queue-lengths', default='d_out.csv', help="CSV file for the queue length distributions")
+    parser.add_argument('--dl-csv', default='dl.csv', help="CSV file for the deadline misses (in deadline mode)")
+    parser.add_argument("--event-queue", choices=EVENT_QUEUES, default='heap', help="event queue implementation")
+    parser.add_argument("--no-fast-path", action='store_true',
+                        help="always use the event loop, even where the Lindley recursion applies (see lindley.py)")
+    parser.add_argument("--weibull_mode", action='store_true',
+                        help="Use Weibull distribution for arrival and service times")
+    parser.add_argument("--weibull_shape", type=float, default=1, help="Shape parameter for Weibull distribution")
+    parser.add_argument("--deadline_mode", action='store_true', help="Add deadline to jobs")
+    parser.add_argument("--slack_margin", type=float, nargs='+', default=[1.0], help="Slack Margins")
+    parser.add_argument("--scheduling_type", type=str, choices=[t.value for t in SchedulingType],
+                        default=SchedulingType.FIFO.value, help="Scheduling type (see scheduling_type.py)")
+    parser.add_argument("--dispatch", choices=DISPATCH_MODES, default='supermarket', help="see queue_sim.py")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')
+    if any(x <= 0 for x in args.lambd + args.d + [args.mu, args.max_t, args.n, args.replications, args.workers]):
+        logging.error("lambd, mu, max-t, n, d, replications and workers must all be positive")
+        exit(1)
+    if not 0 < args.confidence < 1 or (args.target_ci is not None and args.target_ci <= 0):
+        logging.error("confidence must be between 0 and 1, and target-ci positive")
+        exit(1)
+    authkey = args.authkey or os.environ.get(broker.AUTHKEY_ENV)
+    if args.connect is not None:
+        if not authkey:
+            logging.error(f"--connect needs the key of the coordinator: use --authkey or ${broker.AUTHKEY_ENV}")
+            exit(1)
+        broker.work(args.connect, run_point, authkey.encode(), args.workers)
+        return
+    if args.serve is not None and not authkey:
+        authkey = broker.new_authkey()
+        logging.info(f"workers must connect with --authkey {authkey} (or ${broker.AUTHKEY_ENV}={authkey})")
+
+    config = {name: getattr(args, name) for name in ['mu', 'max_t', 'n', 'seed', 'weibull_mode', 'weibull_shape',
+                                                    'deadline_mode', 'scheduling_type', 'event_queue', 'dispatch',
+                                                    'no_fast_path', 'cache', 'cache_size', 'target_ci',
+                                                    'confidence']}
+    points = grid(args)
+    store = None if args.store is None else ResultStore(args.store)
+    batch = []  # results not yet saved in the store
+    start = time.perf_counter()
+    completed = 0
+
+    def on_result(point, result):
+        nonlocal completed
+        if args.serve is not None:
+            _, point = point  # the broker passes back the (config, point) task
+        lambd, d = point['lambd'], point['d']
+        w, half_width = result['metrics'][0], result['metrics'][-1]
+        if store is not None:
+            batch.append(result)
+            if len(batch) >= args.store_batch:
+                store.add_many(batch)
+                batch.clear()
+        else:
+            with open(args.csv, 'a', newline='') as f:
+                csv.writer(f).writerow([lambd, args.mu, args.max_t, args.n, d] + result['metrics'])
+            write_queue_lengths(args.queue_lengths, result['queue_lengths'], lambd, d, args.n)
+            if result['slack_margins']:
+                write_deadline_misses(args.dl_csv, result['slack_margins'], result['deadline_misses'],
+                                      result['jobs'], lambd, d)
+        completed += 1
+        elapsed = time.perf_counter() - start
+        eta = elapsed / completed * (len(points) - completed)
+        print(f"[{completed}/{len(points)}] lambda={lambd} d={d} replication={point['replication']}: "
+              f"W={w:.4g} ± {half_width:.2g} (t={result['t']:.6g}) in {result['seconds']:.1f}s, "
+              f"ETA {format_timespan(eta)}", file=sys.stderr)
+
+    try:
+        if args.serve is not None:
+            tasks = [(config, point) for point in points]
+            failed = broker.serve(tasks, args.serve, on_result, authkey.encode(), args.lease_time, args.retries)
+            failed = [point for _, point in failed]
+        else:
+            logging.info(f"{len(points)} simulations on {args.workers} worker processes")
+            failed = run_sweep(config, points, args.workers, args.retries, on_result)
+    finally:
+        if store is not None:  # save what we have, even if interrupted
+            store.add_many(batch)
+            store.close()
+    logging.info(f"done in {format_timespan(time.perf_counter() - start)}")
+    if failed:
+        logging.error(f"{len(failed)} simulations failed")
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import collections
+import socket
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import broker
+
+AUTHKEY = b'test-key'
+
+
+def square(x):
+    time.sleep(0.05)
+    return x * x
+
+
+def free_address():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return f'localhost:{s.getsockname()[1]}'
+
+
+def test_every_task_is_reported_once():
+    address = free_address()
+    tasks = [(x,) for x in range(20)]
+    leased = threading.Event()
+    stalled = []
+
+    def stalled_worker():
+        # leases a task and never renews it nor answers: the task goes back to the queue when the lease expires
+        while True:
+            try:
+                connection = Client(broker.parse_address(address), authkey=AUTHKEY)
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+        connection.send(('lease',))
+        stalled.append(connection.recv()[2])
+        leased.set()
+        time.sleep(3)
+        connection.close()
+
+    def workers():
+        leased.wait()
+        broker.work(address, square, AUTHKEY, processes=2)
+
+    threads = [threading.Thread(target=stalled_worker, daemon=True), threading.Thread(target=workers, daemon=True)]
+    for thread in threads:
+        thread.start()
+    reported = collections.Counter()
+    results = {}
+
+    def on_result(task, result):
+        reported[task] += 1
+        results[task] = result
+
+    failed = broker.serve(tasks, address, on_result, AUTHKEY, lease_time=0.5)
+    assert failed == []
+    assert stalled == [tasks[0]]
+    assert reported == collections.Counter(tasks)
+    assert results == {(x,): x * x for x in range(20)}
+
+
+def test_late_results_are_ignored():
+    b = broker.Broker(['a', 'b'], lease_time=0.01, retries=1)
+    assert b.lease('slow') == 0
+    time.sleep(0.02)
+    assert b.lease('fast') == 1
+    assert b.lease('fast') == 0  # expired: handed out again
+    b.complete(0, 'fast')
+    b.complete(0, 'slow')  # the first lease's result comes in late
+    b.complete(1, 'fast')
+    assert [b.results.get_nowait() for _ in range(b.results.qsize())] == [('a', 'fast'), ('b', 'fast')]
+    assert b.finished()
+
+
+def test_results_of_failed_tasks_are_ignored():
+    b = broker.Broker(['a'], lease_time=0.01, retries=0)
+    assert b.lease('slow') == 0
+    time.sleep(0.02)
+    assert b.finished()  # the lease expired, and there are no retries left
+    b.complete(0, 'late')
+    assert b.results.empty()
+    assert b.failed == {0}
+
+
+def test_wrong_key_is_rejected():
+    address = free_address()
+    results = []
+    server = threading.Thread(target=broker.serve, args=([(3,)], address, lambda task, result: results.append(result),
+                                                        AUTHKEY), daemon=True)
+    server.start()
+    while True:
+        try:
+            Client(broker.parse_address(address), authkey=b'wrong key')
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+            continue
+        except AuthenticationError:
+            break
+        raise AssertionError("connected with the wrong key")
+    broker.work(address, square, AUTHKEY)
+    server.join(5)
+    assert results == [9]
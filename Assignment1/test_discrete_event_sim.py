@@ -0,0 +1,256 @@
+from discrete_event_sim import Event, Simulation, pooled
+
+
+class Record(Event):
+    """Append the time at which it is processed to sim.processed."""
+
+    def process(self, sim):
+        sim.processed.append(sim.t)
+
+
+def make_sim():
+    sim = Simulation()
+    sim.processed = []
+    return sim
+
+
+def test_cancel_processed_event_is_a_no_op(tmp_path):
+    sim = make_sim()
+    first = sim.schedule(1, Record())
+    sim.schedule(10, Record())
+    sim.run(5)
+    assert sim.processed == [1]
+
+    first.cancel()  # already processed: nothing is left in the queue to skip
+    assert sim.tombstones == 0
+
+    # a checkpointed run stops when only tombstones are left: the pending event must still be processed
+    sim.run(20, checkpoint=tmp_path / 'sim.ckpt', checkpoint_interval=5)
+    assert sim.processed == [1, 10]
+    assert len(sim.events) == 0
+
+
+def test_cancel_scheduled_event():
+    sim = make_sim()
+    canceled = sim.schedule(1, Record())
+    sim.schedule(2, Record())
+    canceled.cancel()
+    canceled.cancel()  # twice is the same as once
+    assert sim.tombstones == 1
+    sim.run()
+    assert sim.processed == [2]
+    assert sim.tombstones == 0
+
+
+def test_event_can_reschedule_itself():
+    class Tick(Event):
+        def process(self, sim):
+            sim.processed.append(sim.t)
+            if sim.t < 3:
+                sim.schedule(1, self)
+
+    sim = make_sim()
+    sim.schedule(1, Tick())
+    sim.step(2)
+    assert sim.processed == [1, 2]
+    sim.run_instrumented()
+    assert sim.processed == [1, 2, 3]
+
+
+def test_reschedule_canceled_event():
+    sim = make_sim()
+    event = sim.schedule(1, Record())
+    event.cancel()
+    sim.schedule(2, event)  # the canceled entry at t=1 must stay dead
+    sim.run(10)
+    assert sim.processed == [2]
+    assert sim.tombstones == 0
+    assert len(sim.events) == 0
+
+
+def test_reschedule_queued_event_moves_it():
+    sim = make_sim()
+    event = sim.schedule(1, Record())
+    sim.schedule(3, event)
+    assert sim.tombstones == 1
+    sim.run()
+    assert sim.processed == [3]
+    assert sim.tombstones == 0
+
+
+def test_compaction_keeps_live_entries():
+    sim = make_sim()
+    sim.COMPACT_MIN_TOMBSTONES = 2
+    events = [sim.schedule(t, Record()) for t in range(1, 11)]
+    for event in events[:6]:
+        event.cancel()
+    sim.schedule(20, events[0])  # canceled, then rescheduled: only its new entry is live
+    assert len(sim.events) == 5  # compacted
+    sim.run()
+    assert sim.processed == [7, 8, 9, 10, 20]
+    assert sim.tombstones == 0
+
+
+def test_stale_handle_of_a_recycled_event():
+    @pooled
+    class Pooled(Event):
+        __slots__ = ()
+
+        def process(self, sim):
+            sim.processed.append(sim.t)
+
+    sim = make_sim()
+    first = sim.schedule(1, Pooled.new())
+    handle = first, first.seq
+    sim.run(2)
+    second = sim.schedule(1, Pooled.new())
+    assert second is first  # recycled
+    event, seq = handle
+    event.cancel(seq)  # the handle is stale: the new scheduling must survive
+    sim.run()
+    assert sim.processed == [1, 2]
+    assert sim.tombstones == 0
+
+
+def test_load_checkpoint_leaves_the_random_module_alone(tmp_path):
+    import random
+
+    sim = make_sim()
+    sim.schedule(1, Record())
+    sim.save_checkpoint(tmp_path / 'sim.ckpt')
+    random.seed(1)
+    state = random.getstate()
+    loaded = Simulation.load_checkpoint(tmp_path / 'sim.ckpt')
+    assert random.getstate() == state
+    loaded.run()
+    assert loaded.processed == [1]
+
+
+def test_simultaneous_events_are_processed_in_scheduling_order():
+    class Named(Event):
+        __slots__ = ('name',)  # no __lt__: entries must never compare the events themselves
+
+        def __init__(self, name):
+            self.name = name
+
+        def process(self, sim):
+            sim.processed.append(self.name)
+
+    sim = make_sim()
+    for name in 'abcde':
+        sim.schedule(1, Named(name))
+    sim.schedule(0.5, Named('first'))
+    sim.run()
+    assert sim.processed == ['first', 'a', 'b', 'c', 'd', 'e']
+    assert not hasattr(Named('x'), '__dict__')
+
+
+def test_pooled_instances_are_recycled_but_not_shared_with_subclasses():
+    @pooled
+    class Pooled(Event):
+        __slots__ = ('value',)
+
+        def __init__(self, value):
+            self.value = value
+
+        def process(self, sim):
+            sim.processed.append(self.value)
+
+    class Sub(Pooled):
+        __slots__ = ()
+
+    sim = make_sim()
+    first = sim.schedule(1, Pooled.new(1))
+    sim.schedule(2, Sub.new(2))
+    sim.run()
+    assert sim.processed == [1, 2]
+    assert Pooled.free_list == [first] and Sub.free_list is None
+    again = Pooled.new(3)
+    assert again is first and again.value == 3
+    assert Pooled.free_list == []
+
+
+def test_profile_counts_the_events_of_each_class(tmp_path):
+    import json
+
+    class Other(Record):
+        __slots__ = ()
+
+    sim = make_sim()
+    for t in range(1, 6):
+        sim.schedule(t, Record())
+    for t in range(1, 4):
+        sim.schedule(t + 0.5, Other())
+    sim.schedule(7, Record()).cancel()  # tombstones aren't counted
+    sim.run(profile=True)
+    assert sim.processed == [1, 1.5, 2, 2.5, 3, 3.5, 4, 5]
+    assert dict(sim.profile.counts) == {Record: 5, Other: 3}
+
+    sim.profile.save(tmp_path / 'profile.json')
+    with open(tmp_path / 'profile.json') as f:
+        stats = json.load(f)
+    assert stats['events'] == 8
+    assert {name: s['count'] for name, s in stats['classes'].items()} == {'Record': 5, 'Other': 3}
+    assert stats['queue_len_peak'] <= 9
+
+
+def test_profiled_run_gives_the_same_results():
+    from queue_sim import Queues
+    from random_streams import RandomStreams
+
+    plain, profiled = [Queues(0.9, 1, 10, 2, streams=RandomStreams(42)) for _ in range(2)]
+    plain.run(1000)
+    profiled.run(1000, profile=True)
+    assert profiled.response_times.mean == plain.response_times.mean
+    assert sum(profiled.profile.counts.values()) > 2 * profiled.response_times.count  # arrivals and completions
+
+
+def schedule_records(sim, times):
+    for t in times:
+        sim.schedule(t, Record())
+
+
+def test_max_events_budget():
+    sim = make_sim()
+    schedule_records(sim, range(1, 11))
+    assert sim.run(max_events=3, check_every=2) == 'max_events'
+    assert sim.processed == [1, 2, 3]
+    assert sim.run(max_events=100) is None  # the queue ran dry first
+    assert sim.processed == list(range(1, 11))
+
+
+def test_stop_when_budget():
+    sim = make_sim()
+    schedule_records(sim, range(1, 11))
+    assert sim.run(stop_when=lambda sim: len(sim.processed) >= 4, check_every=1, profile=True) == 'stop_when'
+    assert sim.processed == [1, 2, 3, 4]
+    assert sum(sim.profile.counts.values()) == 4
+
+
+def test_wall_time_budget():
+    sim = make_sim()
+    schedule_records(sim, range(1, 11))
+    assert sim.run(wall_time=0, check_every=5) == 'wall_time'
+    assert sim.processed == [1, 2, 3, 4, 5]
+
+
+def test_budget_stops_checkpointed_runs(tmp_path):
+    sim = make_sim()
+    schedule_records(sim, range(1, 11))
+    assert sim.run(checkpoint=tmp_path / 'sim.ckpt', checkpoint_interval=2, max_events=3, check_every=1) == 'max_events'
+    loaded = Simulation.load_checkpoint(tmp_path / 'sim.ckpt')
+    assert loaded.processed == [1, 2, 3]
+    loaded.run()
+    assert loaded.processed == list(range(1, 11))
+
+
+def test_step():
+    sim = make_sim()
+    schedule_records(sim, [1, 2, 3, 4])
+    sim.schedule(1.5, Record()).cancel()
+    assert sim.step(2) == 2  # the canceled event doesn't count
+    assert sim.processed == [1, 2]
+    assert sim.step(5, max_t=3.5) == 1
+    assert sim.t == 3
+    assert sim.step(5) == 1
+    assert sim.step() == 0
@@ -0,0 +1,53 @@
+import heapq
+import random
+
+import pytest
+
+from event_queue import CalendarQueue, make_event_queue
+from queue_sim import Queues
+from random_streams import RandomStreams
+
+
+@pytest.mark.parametrize('spread', [1e-3, 1, 1e6])
+def test_calendar_queue_pops_in_the_order_of_heapq(spread):
+    rng = random.Random(42)
+    calendar, heap = CalendarQueue(), []
+    seq = 0
+    t = 0.0
+    for _ in range(20_000):
+        # pushes and pops at random, so that the queue grows and shrinks (and resizes) several times
+        if heap and rng.random() < 0.5:
+            entry = heapq.heappop(heap)
+            assert calendar.pop() == entry
+            t = entry[0]
+        else:
+            delay = rng.expovariate(1 / spread) if rng.random() < 0.9 else 0.0  # ties are broken by seq
+            entry = (t + delay, seq)
+            seq += 1
+            heapq.heappush(heap, entry)
+            calendar.push(entry)
+        assert len(calendar) == len(heap)
+    while heap:
+        assert calendar.pop() == heapq.heappop(heap)
+    with pytest.raises(IndexError):
+        calendar.pop()
+
+
+def test_calendar_queue_rebuild():
+    rng = random.Random(1)
+    entries = [(rng.random() * 100, i) for i in range(1000)]
+    calendar = make_event_queue('calendar')
+    for entry in entries[:10]:
+        calendar.push(entry)
+    calendar.rebuild(entries[::2])
+    assert [calendar.pop() for _ in range(500)] == sorted(entries[::2])
+
+
+def test_simulations_do_not_depend_on_the_event_queue():
+    sims = [Queues(0.9, 1, 10, 2, event_queue=kind, streams=RandomStreams(42)) for kind in ['heap', 'calendar']]
+    for sim in sims:
+        sim.run(2000)
+    heap, calendar = sims
+    assert heap.t == calendar.t
+    assert heap.response_times.mean == calendar.response_times.mean
+    assert heap.queue_length_distribution == calendar.queue_length_distribution
@@ -0,0 +1,41 @@
+from event_trace import EventTrace, EventTraceWriter
+from queue_sim import Queues
+from random_streams import RandomStreams
+
+
+def make_sim():
+    return Queues(0.9, 1, 5, 2, streams=RandomStreams(42))
+
+
+def traced_run(sim, path, max_t, append=False, checkpoint=None):
+    writer = EventTraceWriter(path, chunk_size=100, append=append)
+    sim.set_event_trace(writer)
+    sim.run(max_t, checkpoint=checkpoint, checkpoint_interval=500)
+    writer.close()
+
+
+def test_resume_gives_the_trace_of_an_uninterrupted_run(tmp_path):
+    traced_run(make_sim(), tmp_path / 'full.events', 3000)
+
+    # a run that saves a snapshot at t=1000, then goes on (writing more records) until it crashes
+    sim = make_sim()
+    traced_run(sim, tmp_path / 'resumed.events', 1000, checkpoint=tmp_path / 'sim.ckpt')
+    traced_run(sim, tmp_path / 'resumed.events', 1700, append=True)
+    resumed = Queues.load_checkpoint(tmp_path / 'sim.ckpt')
+    traced_run(resumed, tmp_path / 'resumed.events', 3000, append=True)
+
+    full, resumed = EventTrace(tmp_path / 'full.events'), EventTrace(tmp_path / 'resumed.events')
+    assert len(full) > 1000
+    assert full.kinds == resumed.kinds
+    assert full.records.tobytes() == resumed.records.tobytes()  # payloads are NaN: compare the bytes
+
+
+def test_size_counts_buffered_records(tmp_path):
+    writer = EventTraceWriter(tmp_path / 'run.events', chunk_size=3)
+    sim = make_sim()
+    sim.set_event_trace(writer)
+    sim.run_instrumented(max_events=5)  # one chunk written, two records buffered
+    assert writer.size() == 5 * writer.file.tell() // 3
+    writer.truncate(2 * writer.size() // 5)
+    writer.close()
+    assert len(EventTrace(tmp_path / 'run.events')) == 2
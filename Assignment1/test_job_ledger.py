@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from job_ledger import FIELDS, JobLedger, read_ledger
+from queue_sim import Queues
+from random_streams import RandomStreams
+
+
+def make_sim(path):
+    return Queues(0.9, 1, 5, 2, streams=RandomStreams(42), ledger=JobLedger(path, chunk_size=50, spill_threshold=100))
+
+
+def field_sizes(path):
+    return [os.path.getsize(os.path.join(path, f'{name}.bin')) for name, _ in FIELDS]
+
+
+def test_resume_gives_the_ledger_of_an_uninterrupted_run(tmp_path):
+    full = make_sim(tmp_path / 'full')
+    full.run(3000)
+    full.ledger.close()
+
+    # a run that saves a snapshot at t=1000, then goes on (spilling more rows) until it crashes
+    sim = make_sim(tmp_path / 'resumed')
+    sim.run(1000, checkpoint=tmp_path / 'sim.ckpt')
+    sim.run(1700)
+    sim.ledger._flush_buffer()
+    sizes = field_sizes(tmp_path / 'resumed')
+
+    resumed = Queues.load_checkpoint(tmp_path / 'sim.ckpt')
+    assert field_sizes(tmp_path / 'resumed') == sizes  # loading a snapshot doesn't touch the files
+    resumed.ledger.resume()
+    resumed.run(3000)
+    resumed.ledger.close()
+
+    expected, actual = read_ledger(tmp_path / 'full'), read_ledger(tmp_path / 'resumed')
+    assert len(expected['job_id']) > 1000
+    for name, _ in FIELDS:
+        np.testing.assert_array_equal(expected[name], actual[name])
+
+
+def test_recording_needs_resume(tmp_path):
+    sim = make_sim(tmp_path / 'ledger')
+    sim.run(500, checkpoint=tmp_path / 'sim.ckpt')
+    resumed = Queues.load_checkpoint(tmp_path / 'sim.ckpt')
+    with pytest.raises(RuntimeError):
+        resumed.run(1000)
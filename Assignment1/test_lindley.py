@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from lindley import applicable, run_lindley
+from queue_sim import Queues
+from random_streams import RandomStreams
+
+N = 5
+MAX_T = 5000
+CHUNK_SIZE = 1 << 10  # small, so that runs span many chunks
+
+
+def make_sims(lambd, weibull_shape):
+    return [Queues(lambd, 1, N, 1, weibull_shape is not None, weibull_shape or 1, True, [1, 2, 5, 10],
+                   streams=RandomStreams(42)) for _ in range(2)]
+
+
+def assert_same_results(engine, fast):
+    assert engine.response_times.count == fast.response_times.count
+    assert engine.deadline_misses == fast.deadline_misses
+    assert engine.waiting_sketch.count == fast.waiting_sketch.count
+    assert engine.response_times.mean == pytest.approx(fast.response_times.mean, rel=1e-9)
+    assert engine.response_times.std == pytest.approx(fast.response_times.std, rel=1e-9)
+
+
+@pytest.mark.parametrize('weibull_shape', [None, 0.5, 2])
+@pytest.mark.parametrize('lambd', [0.5, 0.95])
+def test_same_results_as_the_event_loop(lambd, weibull_shape):
+    engine, fast = make_sims(lambd, weibull_shape)
+    assert applicable(fast)
+    engine.run(MAX_T)
+    engine.flush_queue_length_distribution()
+    assert not run_lindley(fast, MAX_T, CHUNK_SIZE)
+
+    assert_same_results(engine, fast)
+    assert engine.response_sketch.quantile(0.99) == pytest.approx(fast.response_sketch.quantile(0.99), rel=1e-9)
+    expected, actual = engine.queue_length_distribution, fast.queue_length_distribution
+    for length in set(expected) | set(actual):
+        assert expected.get(length, 0) == pytest.approx(actual.get(length, 0), abs=1e-9 * N * MAX_T)
+
+
+@pytest.mark.parametrize('weibull_shape', [None, 0.5])
+@pytest.mark.parametrize('lambd', [0.5, 0.95])
+def test_early_stop_matches_the_event_loop_until_then(lambd, weibull_shape):
+    full, _ = make_sims(lambd, weibull_shape)
+    full.run(MAX_T)
+    half = full.response_times.count // 2
+
+    engine, fast = make_sims(lambd, weibull_shape)
+    assert run_lindley(fast, MAX_T, CHUNK_SIZE, stop_when=lambda sim: sim.response_times.count > half)
+    assert fast.t < MAX_T
+    engine.run(np.nextafter(fast.t, 0))  # just before the arrival that follows the last chunk
+    assert_same_results(engine, fast)
+
+
+def test_fall_back_to_the_event_loop_if_randranges_differs_from_random(monkeypatch):
+    import lindley
+
+    assert lindley.randranges_match_random()
+    sim, _ = make_sims(0.5, None)
+    monkeypatch.setattr(lindley, 'randranges_match_random', lambda: False)
+    assert not applicable(sim)
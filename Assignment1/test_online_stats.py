@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+import pytest
+
+from online_stats import BatchMeans, DDSketch, t_quantile
+
+
+@pytest.mark.parametrize('alpha', [0.01, 0.05])
+def test_sketch_quantiles_are_within_the_relative_accuracy(alpha):
+    values = np.random.default_rng(42).lognormal(0, 3, 20_000)  # about 10 orders of magnitude
+    sketch = DDSketch(alpha)
+    sketch.add_many(values)
+    ordered = np.sort(values)
+    for q in [0, 0.001, 0.1, 0.5, 0.9, 0.99, 0.999, 1]:
+        exact = ordered[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= alpha * exact
+
+
+def test_add_many_and_merge_are_the_same_as_adding_one_at_a_time():
+    values = np.random.default_rng(1).exponential(1, 5000)
+    values[::100] = 0  # counted as zeros
+    one_by_one = DDSketch()
+    for value in values.tolist():
+        one_by_one.add(value)
+    first, second = DDSketch(), DDSketch()
+    first.add_many(values[:1234])
+    second.add_many(values[1234:])
+    first.merge(second)
+    for sketch in first, DDSketch.from_dict(first.to_dict()):
+        assert (sketch.bins, sketch.zero_count, sketch.count) == (one_by_one.bins, 50, 5000)
+        assert sketch.quantile(0.005) == 0.0
+        assert sketch.quantile(0.5) == one_by_one.quantile(0.5)
+
+
+def test_sketch_edge_cases():
+    assert math.isnan(DDSketch().quantile(0.5))
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch(0.02))
+
+
+@pytest.mark.parametrize('p, df, expected', [(0.975, 5, 2.571), (0.975, 10, 2.228), (0.975, 30, 2.042),
+                                             (0.995, 15, 2.947), (0.95, 20, 1.725), (0.9995, 60, 3.460)])
+def test_t_quantile_matches_the_tables(p, df, expected):
+    assert t_quantile(p, df) == pytest.approx(expected, abs=2e-3)
+
+
+def test_batch_means_interval():
+    batches = BatchMeans(batches=6)
+    means = [1.0, 3.0, 2.0, 6.0, 4.0, 2.0]
+    for mean in means[:5]:
+        batches.add(mean * 10, 10)
+    assert math.isnan(batches.half_width())  # fewer than 6 batches
+    batches.add(means[5] * 10, 10)
+    # mean 3, sample variance 16 / 5, t quantile 2.571 for 5 degrees of freedom
+    assert batches.mean == 3
+    assert batches.half_width() == pytest.approx(2.571 * math.sqrt(16 / 5 / 6), rel=1e-3)
+
+
+def test_batch_means_merge_adjacent_batches():
+    batches = BatchMeans(batches=2)
+    for i in range(4):
+        batches.add(i, 1)
+    assert (batches.totals, batches.counts, batches.increments) == ([1, 5], [2, 2], 2)
+    batches.add(10, 2)  # a batch now takes two increments
+    assert len(batches.totals) == 2 and batches.partial == [10, 2, 1]
+    assert batches.mean == 16 / 6
+    batches.add(0, 0)
+    assert (batches.totals, batches.counts) == ([1, 5, 10], [2, 2, 2])
+
+
+def test_run_stops_once_the_interval_is_narrow_enough():
+    from queue_sim import Queues
+    from random_streams import RandomStreams
+
+    sim = Queues(0.7, 1, 10, 2, streams=RandomStreams(42), streaming=True)
+    precise_enough = lambda sim: sim.response_batches.half_width() <= 0.02 * sim.response_times.mean
+    assert sim.run_batches(1e6, precise_enough)
+    assert sim.t < 1e6
+    assert sim.response_batches.half_width() <= 0.02 * sim.response_times.mean
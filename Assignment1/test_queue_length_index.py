@@ -0,0 +1,70 @@
+import collections
+import itertools
+import math
+import random
+
+import pytest
+
+from queue_length_index import QueueLengthIndex
+
+LENGTHS = [2, 0, 3, 0, 1, 2, 5]  # two shortest queues, and ties among the others
+
+
+def make_index(lengths):
+    index = QueueLengthIndex(len(lengths))
+    for i, length in enumerate(lengths):
+        for _ in range(length):
+            index.increment(i)
+    return index
+
+
+def jsq_probabilities(lengths, d):
+    """Exact probability of each queue under JSQ(d), by enumerating the subsets of d queues."""
+
+    n = len(lengths)
+    probabilities = [0.0] * n
+    subsets = list(itertools.combinations(range(n), d))
+    for subset in subsets:
+        shortest = min(lengths[i] for i in subset)
+        ties = [i for i in subset if lengths[i] == shortest]
+        for i in ties:
+            probabilities[i] += 1 / len(ties) / len(subsets)
+    return probabilities
+
+
+def test_index_follows_the_lengths():
+    rng = random.Random(42)
+    n = 20
+    index, lengths = QueueLengthIndex(n), [0] * n
+    for _ in range(5000):
+        i = rng.randrange(n)
+        if lengths[i] and rng.random() < 0.5:
+            index.decrement(i)
+            lengths[i] -= 1
+        else:
+            index.increment(i)
+            lengths[i] += 1
+        assert index.length == lengths
+        assert index.min_length == min(lengths)
+    for length, bucket in enumerate(index.buckets):
+        assert sorted(bucket) == [i for i in range(n) if lengths[i] == length]
+        assert all(index.position[i] == position for position, i in enumerate(bucket))
+
+
+@pytest.mark.parametrize('d', [1, 2, 3, 4, 6, 7, 10])
+def test_choose_matches_brute_force_jsq(d):
+    index = make_index(LENGTHS)
+    rng = random.Random(d)
+    draws = 40_000
+    counts = collections.Counter(index.choose(d, rng) for _ in range(draws))
+    for i, p in enumerate(jsq_probabilities(LENGTHS, min(d, len(LENGTHS)))):
+        assert counts[i] / draws == pytest.approx(p, abs=4 * math.sqrt(p * (1 - p) / draws) + 1e-12)
+    assert index.length == LENGTHS  # choosing doesn't change anything
+
+
+def test_shortest_is_uniform_among_the_shortest_queues():
+    index = make_index(LENGTHS)
+    rng = random.Random(1)
+    counts = collections.Counter(index.shortest(rng) for _ in range(10_000))
+    assert set(counts) == {1, 3}
+    assert counts[1] == pytest.approx(5000, abs=200)
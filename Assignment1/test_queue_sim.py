@@ -0,0 +1,77 @@
+import csv
+import math
+
+import pytest
+
+from queue_sim import Queues, run_record, write_deadline_misses
+from random_streams import RandomStreams
+from scheduling_type import SchedulingType
+
+
+def test_no_completed_job(tmp_path):
+    sim = Queues(0.7, 1, 1, 1, deadline_mode=True, slack_margin=[1, 2], streams=RandomStreams(42))
+    sim.run(0.001)
+    record = run_record(sim, 0.001, 42, 0)
+    assert record['jobs'] == 0
+    assert math.isnan(record['metrics'][0])
+
+    path = tmp_path / 'dl.csv'
+    write_deadline_misses(path, record['slack_margins'], record['deadline_misses'], record['jobs'], 0.7, 1)
+    with open(path) as f:
+        rows = list(csv.DictReader(f))
+    assert [row['Miss Rate (%)'] for row in rows] == ['nan', 'nan']
+
+
+def test_weibull_and_exponential_times_have_the_same_means():
+    for weibull_mode in False, True:
+        sim = Queues(0.5, 4, 3, 1, weibull_mode=weibull_mode, weibull_shape=0.7, streams=RandomStreams(42))
+        services = sim.service_pool.take(200_000) * sim.service_scale
+        interarrivals = sim.arrival_pool.take(200_000) * sim.arrival_scale
+        assert services.mean() == pytest.approx(1 / 4, rel=0.02)
+        assert interarrivals.mean() == pytest.approx(1 / (0.5 * 3), rel=0.02)
+
+
+def test_batches_hold_the_response_times_of_the_run():
+    sim = Queues(0.9, 1, 5, 2, streams=RandomStreams(42))
+    sim.run_batches(20_000)
+    batches = sim.response_batches
+    assert len(batches.totals) >= batches.batches
+    assert sum(batches.counts) + batches.partial[1] == len(sim.completions) == sim.response_times.count
+    expected = math.fsum(t - sim.arrivals[job_id] for job_id, t in sim.completions.items())
+    assert math.fsum(batches.totals) + batches.partial[0] == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize('scheduling_type, dispatch', [(SchedulingType.FIFO, 'supermarket'),
+                                                       (SchedulingType.SRPT, 'supermarket'),
+                                                       (SchedulingType.EDF, 'global')])
+def test_queue_length_distribution_is_the_time_integral_of_the_lengths(scheduling_type, dispatch):
+    sim = Queues(0.9, 1, 5, 2, deadline_mode=scheduling_type == SchedulingType.EDF, scheduling_type=scheduling_type,
+                 streams=RandomStreams(42), dispatch=dispatch)
+    sim.run(2000)
+    sim.flush_queue_length_distribution()
+    distribution = sim.queue_length_distribution
+    queues = 1 if dispatch == 'global' else 5
+    assert math.fsum(distribution.values()) == pytest.approx(queues * sim.t, rel=1e-9)
+    # jobs in the system over time, job by job: from arrival to completion (or to now)
+    in_system = math.fsum(sim.completions.get(job_id, sim.t) - arrival for job_id, arrival in sim.arrivals.items())
+    assert math.fsum(length * time for length, time in distribution.items()) == pytest.approx(in_system, rel=1e-9)
+
+
+@pytest.mark.parametrize('scheduling_type', [SchedulingType.FIFO, SchedulingType.SJF, SchedulingType.SRPT])
+def test_one_run_counts_the_misses_of_every_margin(scheduling_type):
+    margins = [1, 1.5, 2, 5, 10]
+
+    def misses(slack_margin):
+        sim = Queues(0.9, 1, 5, 2, deadline_mode=True, slack_margin=slack_margin, scheduling_type=scheduling_type,
+                     streams=RandomStreams(42))
+        sim.run(2000)
+        return sim.deadline_misses
+
+    together = misses(margins)
+    assert together == [misses(margin)[0] for margin in margins]
+    assert together == sorted(together, reverse=True) and together[0] > together[-1] > 0
+
+
+def test_edf_needs_a_run_per_margin():
+    with pytest.raises(ValueError):
+        Queues(0.9, 1, 5, 2, deadline_mode=True, slack_margin=[1, 2], scheduling_type=SchedulingType.EDF)
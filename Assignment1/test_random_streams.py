@@ -0,0 +1,66 @@
+import pytest
+
+from random_streams import RandomStreams
+
+
+def draws(streams, name, k=5):
+    rng = streams.stream(name)
+    return [rng.random() for _ in range(k)]
+
+
+def test_a_stream_only_depends_on_seed_replication_and_name():
+    alone = draws(RandomStreams(42, 3), 'arrivals')
+    busy = RandomStreams(42, 3)
+    draws(busy, 'service', 1000)  # other streams, used first, don't shift it
+    assert draws(busy, 'arrivals') == alone
+    assert draws(RandomStreams(42).spawn(5)[3], 'arrivals') == alone
+    assert draws(RandomStreams(42, 0).for_replication(3), 'arrivals') == alone
+    assert draws(RandomStreams('42', 3), 'arrivals') == alone  # as parsed from the command line
+
+
+def test_streams_differ_by_name_replication_and_seed():
+    reference = draws(RandomStreams(42, 0), 'arrivals')
+    assert draws(RandomStreams(42, 0), 'service') != reference
+    assert draws(RandomStreams(42, 1), 'arrivals') != reference
+    assert draws(RandomStreams(43, 0), 'arrivals') != reference
+    assert draws(RandomStreams('forty-two', 0), 'arrivals') != reference
+
+
+def test_unseeded_streams_can_be_reproduced_from_their_entropy():
+    streams = RandomStreams(replication=2)
+    assert draws(RandomStreams(streams.entropy, 2), 'arrivals') == draws(streams, 'arrivals')
+    assert RandomStreams().entropy != streams.entropy
+
+
+def test_a_stream_is_created_once():
+    streams = RandomStreams(42)
+    assert streams.stream('arrivals') is streams.stream('arrivals')
+    # the NumPy generators are independent from the random.Random streams of the same name
+    assert streams.generator('arrivals').random() != RandomStreams(42).stream('arrivals').random()
+
+
+@pytest.mark.parametrize('distribution, params', [('exponential', ()), ('weibull', (0.5,)), ('integers', (0, 10))])
+def test_pools_give_the_same_variates_at_any_block_size(distribution, params):
+    def variates(block_size):
+        pool = RandomStreams(42).pool('arrivals', distribution, *params, block_size=block_size)
+        values = [pool() for _ in range(10)]
+        values += pool.take(25).tolist()  # across a block boundary, or with the block exhausted
+        values += [pool() for _ in range(10)]
+        values += pool.take(0).tolist() + pool.take(3).tolist()
+        return values
+
+    expected = variates(4096)
+    assert len(expected) == 48
+    for block_size in 1, 7, 10, 64:
+        assert variates(block_size) == expected
+    generator = RandomStreams(42).generator('arrivals')
+    assert expected == getattr(generator, distribution)(*params, size=48).tolist()
+    assert all(type(value) is type(expected[0]) for value in expected)
+
+
+def test_pool_is_created_once():
+    streams = RandomStreams(42)
+    pool = streams.pool('service', 'exponential')
+    assert streams.pool('service', 'exponential') is pool
+    pool()
+    assert streams.pool('service', 'exponential')() == RandomStreams(42).pool('service', 'exponential').take(2)[1]
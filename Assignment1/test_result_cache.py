@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from result_cache import ResultCache
+
+
+def test_get_put(tmp_path):
+    cache = ResultCache(tmp_path)
+    key = cache.key('queue_sim', __file__, {'lambd': 0.5}, 42, 0)
+    assert cache.get(key) is None
+    cache.put(key, [1, 2, 3], {'lambd': 0.5})
+    assert cache.get(key) == [1, 2, 3]
+    assert key != cache.key('queue_sim', __file__, {'lambd': 0.5}, 42, 1)
+
+
+def test_unseeded_runs_are_not_cached(tmp_path):
+    with pytest.raises(ValueError):
+        ResultCache(tmp_path).key('sir', __file__, {}, None, 0)
+
+
+@pytest.mark.parametrize('data', [
+    b'cno_such_module\nResult\n.',  # a module that was renamed or removed: ModuleNotFoundError
+    b'cresult_cache\nNoSuchClass\n.',  # a class that was renamed or removed: AttributeError
+    b'\x80\x04\x95',  # truncated: UnpicklingError
+])
+def test_stale_entries_are_misses(tmp_path, data):
+    cache = ResultCache(tmp_path)
+    key = cache.key('queue_sim', __file__, {}, 42, 0)
+    with open(os.path.join(tmp_path, f'{key}.pkl'), 'wb') as f:
+        f.write(data)
+    assert cache.get(key) is None
+    assert cache.entries() == []  # deleted
+    assert cache.invalidate() == 0
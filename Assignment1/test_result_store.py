@@ -0,0 +1,66 @@
+import csv
+import itertools
+import sys
+
+import result_store
+from queue_sim import Queues, run_record, write_deadline_misses, write_queue_lengths
+from random_streams import RandomStreams
+from result_store import ResultStore
+
+
+def test_list_run_without_completed_jobs(tmp_path, monkeypatch, capsys):
+    sim = Queues(0.7, 1, 1, 1, streams=RandomStreams(42))
+    sim.run(0.001)
+    store = ResultStore(tmp_path / 'results.db')
+    store.add_many([run_record(sim, 0.001, 42, 0)])
+    assert store.runs()[0]['w'] is None  # SQLite stores NaN as NULL
+    store.close()
+
+    monkeypatch.setattr(sys, 'argv', ['result_store.py', str(tmp_path / 'results.db'), 'list'])
+    result_store.main()
+    assert 'W=nan jobs=0' in capsys.readouterr().out
+
+
+def read_rows(path):
+    """The rows of a CSV file, with numbers parsed (NaN included), sorted."""
+
+    def parse(value):
+        try:
+            return repr(float(value))
+        except ValueError:
+            return value
+
+    with open(path) as f:
+        return sorted([parse(value) for value in row] for row in csv.reader(f))
+
+
+def test_export_gives_back_the_csv_files(tmp_path):
+    records = []
+    for lambd, d, replication in itertools.product([0.5, 0.9], [1, 2], [0, 1]):
+        sim = Queues(lambd, 1, 5, d, deadline_mode=True, slack_margin=[1, 2], streams=RandomStreams(42, replication))
+        sim.run(500)
+        sim.flush_queue_length_distribution()
+        records.append(run_record(sim, 500, 42, replication))
+    direct = tmp_path / 'direct'
+    direct.mkdir()
+    with open(direct / 'out.csv', 'w', newline='') as f:
+        for record in records:
+            params = record['params']
+            csv.writer(f).writerow([params[name] for name in ['lambd', 'mu', 'max_t', 'n', 'd']] + record['metrics'])
+    for record in records:
+        params = record['params']
+        write_queue_lengths(direct / 'd_out.csv', record['queue_lengths'], params['lambd'], params['d'], params['n'])
+        write_deadline_misses(direct / 'dl.csv', record['slack_margins'], record['deadline_misses'], record['jobs'],
+                              params['lambd'], params['d'])
+
+    store = ResultStore(tmp_path / 'results.db')
+    store.add_many(records[:5])
+    store.add_many(records)  # the same runs again replace the first ones
+    runs = store.runs()
+    assert len(runs) == 8
+    assert len(store.runs(lambd=0.9, d=2)) == 2
+    assert len(store.runs(slack_margins=[1, 2])) == 8
+    for kind, name in [('out', 'out.csv'), ('queue-lengths', 'd_out.csv'), ('deadline-misses', 'dl.csv')]:
+        store.export(kind, tmp_path / name, runs)
+        assert read_rows(tmp_path / name) == read_rows(direct / name)
+    store.close()
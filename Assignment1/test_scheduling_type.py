@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+import pytest
+
+from queue_sim import Queues
+from random_streams import RandomStreams
+from scheduling_type import SchedulingType
+
+LAMBD = 0.7
+SIZES = np.linspace(0, 60, 600_001)  # job sizes, for the M/M/1 formulas that integrate over them
+LOAD_BELOW = LAMBD * (1 - np.exp(-SIZES) * (1 + SIZES))  # load brought by the jobs smaller than each size
+
+
+def integral(y, x=SIZES):
+    """Cumulative integral of y over x, by the trapezoidal rule."""
+
+    return np.concatenate(([0], np.cumsum((y[1:] + y[:-1]) / 2 * np.diff(x))))
+
+
+def mean_over_sizes(response_time):
+    """Mean over exponential job sizes of mean 1 of the response times of jobs of each size."""
+
+    return integral(response_time * np.exp(-SIZES))[-1]
+
+
+def simulated_w(scheduling_type, lambd=LAMBD, n=10, max_t=10_000, **kwargs):
+    """W and the half-width of its 99.9% confidence interval, with each job sent to a random server (d=1): every
+    server is an M/M/1 queue."""
+
+    sim = Queues(lambd, 1, n, 1, scheduling_type=scheduling_type, streams=RandomStreams(42), streaming=True,
+                 **kwargs)
+    sim.run_batches(max_t)
+    return sim.response_times.mean, sim.response_batches.half_width(0.999)
+
+
+@pytest.mark.parametrize('scheduling_type', [SchedulingType.FIFO, SchedulingType.LIFO])
+def test_size_blind_disciplines_match_mm1(scheduling_type):
+    w, half_width = simulated_w(scheduling_type)
+    assert abs(w - 1 / (1 - LAMBD)) <= half_width
+
+
+def test_sjf_matches_mm1():
+    # non-preemptive priority to shorter jobs: a job of size x waits lambda E[S^2] / 2 / (1 - rho(x))^2
+    expected = mean_over_sizes(SIZES + LAMBD / (1 - LOAD_BELOW) ** 2)
+    w, half_width = simulated_w(SchedulingType.SJF)
+    assert abs(w - expected) <= half_width
+    assert expected < 1 / (1 - LAMBD)
+
+
+def test_processor_sharing_matches_mm1():
+    w, half_width = simulated_w(SchedulingType.PS)
+    assert abs(w - 1 / (1 - LAMBD)) <= half_width
+
+
+def test_srpt_matches_mg1_formula():
+    # Schrage and Miller: a job of size x waits lambda m2(x) / 2 / (1 - rho(x))^2, with m2(x) the second moment of
+    # min(S, x), then is served in the integral of 1 / (1 - rho(t)) for t up to x
+    second_moment = 2 - np.exp(-SIZES) * (2 * SIZES + 2)
+    expected = mean_over_sizes(LAMBD * second_moment / 2 / (1 - LOAD_BELOW) ** 2 + integral(1 / (1 - LOAD_BELOW)))
+    w, half_width = simulated_w(SchedulingType.SRPT)
+    assert abs(w - expected) <= half_width
+    assert expected < simulated_w(SchedulingType.SJF)[0]
+
+
+def erlang_c(c, load):
+    """Probability that a job of an M/M/c queue with offered load `load` (lambda / mu) has to wait."""
+
+    waiting = load ** c / math.factorial(c) * c / (c - load)
+    return waiting / (sum(load ** k / math.factorial(k) for k in range(c)) + waiting)
+
+
+@pytest.mark.parametrize('scheduling_type, slack_margin', [(SchedulingType.FIFO, 1.0), (SchedulingType.LIFO, 1.0),
+                                                           (SchedulingType.EDF, 1e-9)])
+def test_global_dispatch_matches_mmc(scheduling_type, slack_margin):
+    # with a tiny slack margin, deadlines are in the order of arrivals: global EDF serves jobs as global FIFO
+    lambd, n = 0.8, 5
+    expected = 1 + erlang_c(n, lambd * n) / (n - lambd * n)
+    w, half_width = simulated_w(scheduling_type, lambd, n, 20_000, dispatch='global',
+                                deadline_mode=scheduling_type == SchedulingType.EDF, slack_margin=slack_margin)
+    assert abs(w - expected) <= half_width
+
+
+def test_global_edf_serves_jobs_by_deadline():
+    # deadlines grow with job sizes: EDF favours short jobs, and beats FIFO on W
+    fifo, _ = simulated_w(SchedulingType.FIFO, 0.8, 5, 20_000, dispatch='global')
+    edf, _ = simulated_w(SchedulingType.EDF, 0.8, 5, 20_000, dispatch='global', deadline_mode=True)
+    assert edf < fifo
@@ -0,0 +1,69 @@
+import argparse
+import csv
+import itertools
+import os
+import subprocess
+import sys
+import time
+
+import sweep
+from scheduling_type import SchedulingType
+
+
+def flaky(config, point):
+    """Kill the worker on point 3, and raise the first time point 5 runs."""
+
+    time.sleep(0.1)  # so that several points are running when the worker dies
+    if point == 3:
+        os._exit(1)
+    if point == 5 and not os.path.exists(config['marker']):
+        open(config['marker'], 'w').close()
+        raise ValueError(point)
+    return point * 10
+
+
+def test_only_the_point_that_kills_its_worker_is_charged(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, 'run_point', flaky)
+    results = {}
+    failed = sweep.run_sweep({'marker': tmp_path / 'marker'}, list(range(8)), 4, 0, results.__setitem__)
+    assert sorted(failed) == [3, 5]  # with no retries, only the point that raised and the one that killed its worker
+    assert results == {i: i * 10 for i in [0, 1, 2, 4, 6, 7]}
+
+
+def test_failed_points_are_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, 'run_point', flaky)
+    results = {}
+    failed = sweep.run_sweep({'marker': tmp_path / 'marker'}, list(range(8)), 4, 2, results.__setitem__)
+    assert failed == [3]
+    assert results == {i: i * 10 for i in range(8) if i != 3}
+
+
+def run_script(script, *args, cwd):
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), script), *args],
+                   cwd=cwd, check=True, capture_output=True)
+
+
+def read_rows(path):
+    with open(path) as f:
+        return sorted(tuple(row) for row in csv.reader(f))
+
+
+def test_sweep_writes_the_results_of_queue_sim(tmp_path):
+    common = ['--max-t', '2000', '--n', '5', '--seed', '42', '--deadline_mode', '--slack_margin', '1', '2']
+    run_script('sweep.py', '--lambd', '0.5', '0.9', '--d', '1', '2', '--replications', '2', '--workers', '2',
+               *common, cwd=tmp_path)
+    (tmp_path / 'single').mkdir()
+    for lambd, d, replication in itertools.product(['0.5', '0.9'], ['1', '2'], ['0', '1']):
+        run_script('queue_sim.py', '--lambd', lambd, '--d', d, '--replication', replication, '--csv', 'out.csv',
+                   *common, cwd=tmp_path / 'single')
+    for name in 'out.csv', 'd_out.csv', 'dl.csv':
+        assert read_rows(tmp_path / name) == read_rows(tmp_path / 'single' / name)
+    assert len(read_rows(tmp_path / 'out.csv')) == 8
+
+
+def test_grid_splits_edf_margins():
+    args = argparse.Namespace(lambd=[0.5], d=[1, 2], slack_margin=[1.0, 2.0], replications=1,
+                              scheduling_type=SchedulingType.EDF.value)
+    assert [point['slack_margin'] for point in sweep.grid(args)] == [[1.0], [2.0], [1.0], [2.0]]
+    args.scheduling_type = SchedulingType.FIFO.value
+    assert [point['slack_margin'] for point in sweep.grid(args)] == [[1.0, 2.0], [1.0, 2.0]]
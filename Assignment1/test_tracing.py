@@ -0,0 +1,51 @@
+import json
+import logging
+
+from discrete_event_sim import Event, Simulation
+from tracing import DEBUG, INFO, JsonLinesSink, NullSink, TextSink, Tracer
+
+
+class Traced(Event):
+    def process(self, sim):
+        if sim.tracing:
+            sim.trace('tick', DEBUG, count=len(sim.ticks))
+            sim.trace('tock', node='a')
+        sim.ticks.append(sim.t)
+        sim.log_info("free-form")
+
+
+def run(tracer):
+    sim = Simulation(tracer=tracer)
+    sim.ticks = []
+    for t in 1, 2:
+        sim.schedule(t, Traced())
+    sim.run()
+    return sim
+
+
+def test_no_tracer_or_null_sinks_disable_tracing():
+    for tracer in None, Tracer([NullSink()]):
+        sim = run(tracer)
+        assert not sim.tracing
+        assert sim.ticks == [1, 2]
+
+
+def test_json_lines_filtered_by_level_and_category(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    tracer = Tracer([JsonLinesSink(path)], level=INFO, categories=['tock', 'log'])
+    run(tracer)
+    tracer.close()
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert records == [{'t': 1, 'level': 'INFO', 'category': 'tock', 'node': 'a'},
+                       {'t': 1, 'level': 'INFO', 'category': 'log', 'message': 'free-form'},
+                       {'t': 2, 'level': 'INFO', 'category': 'tock', 'node': 'a'},
+                       {'t': 2, 'level': 'INFO', 'category': 'log', 'message': 'free-form'}]
+
+
+def test_text_sink_renders_templates(caplog):
+    tracer = Tracer([TextSink({'tock': 'tock on {node}'}, time_format=lambda t: f'day {t:g}')])
+    with caplog.at_level(logging.DEBUG):
+        run(tracer)
+    assert caplog.messages[:3] == ['day 1: tick count=0', 'day 1: tock on a', 'day 1: free-form']
+    assert len(caplog.messages) == 6
@@ -0,0 +1,94 @@
+# tracing.py
+"""Structured tracing for simulations.
+
+Events report what happens as a category plus structured fields, e.g.
+    if sim.tracing:
+        sim.trace('contact', DEBUG, source=self.source, destination=self.destination)
+
+`sim.tracing` is a plain attribute that is only true when a tracer is installed, so when tracing is off the cost is a
+single attribute check: no string is formatted and no field is computed. The tracer filters by level and category
+before handing the record to its sinks, which do any formatting:
+
+- `TextSink` renders records with per-category templates and emits them through `logging` (as `log_info` did);
+- `JsonLinesSink` writes one JSON object per record to a file;
+- `NullSink` drops everything.
+"""
+
+import json
+import logging
+from logging import DEBUG, INFO  # trace levels are the same as the logging ones
+
+
+class NullSink:
+    """Discard every record."""
+
+    def write(self, t, level, category, fields):
+        pass
+
+    def close(self):
+        pass
+
+
+class TextSink:
+    """Render records as text and emit them through `logging`.
+
+    `formats` maps categories to str.format templates using the record fields; records of other categories are
+    rendered as "category key=value ...", except for the 'log' category of `Simulation.log_info`, which is rendered
+    as its message. `time_format` converts the simulated time to a string.
+    """
+
+    def __init__(self, formats=None, time_format=lambda t: f'{t:.2f}'):
+        self.formats = {'log': '{message}', **(formats or {})}
+        self.time_format = time_format
+
+    def write(self, t, level, category, fields):
+        template = self.formats.get(category)
+        if template is None:
+            text = ' '.join([category] + [f'{key}={value}' for key, value in fields.items()])
+        else:
+            text = template.format(**fields)
+        logging.log(level, f'{self.time_format(t)}: {text}')
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    """Write each record as a JSON object on its own line: {"t": ..., "level": ..., "category": ..., fields...}."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w')
+
+    def write(self, t, level, category, fields):
+        record = {'t': t, 'level': logging.getLevelName(level), 'category': category}
+        record.update(fields)
+        self.file.write(json.dumps(record, default=str) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class Tracer:
+    """Dispatch trace records of at least `level`, and in `categories` if given, to `sinks`."""
+
+    def __init__(self, sinks, level=DEBUG, categories=None):
+        self.sinks = [sink for sink in sinks if not isinstance(sink, NullSink)]
+        self.level = level
+        self.categories = None if categories is None else set(categories)
+
+    @property
+    def active(self):
+        return bool(self.sinks)
+
+    def wants(self, level, category):
+        return level >= self.level and (self.categories is None or category in self.categories)
+
+    def emit(self, t, level, category, fields):
+        if self.wants(level, category):
+            for sink in self.sinks:
+                sink.write(t, level, category, fields)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -20,10 +20,19 @@ MUSTANG_URL = 'https://ftp.pdl.cmu.edu/pub/datasets/ATLAS/mustang/mustang_releas
 # NOTE: if you want to shuffle a trace, have a look at the `random.shuffle` function.
 
 
-def weibull_generator(shape, mean):
-    """Returns a callable that outputs random variables with a Weibull distribution having the given shape and mean."""
+def weibull_generator(shape, mean, rng=random):
+    """Returns a callable that outputs random variables with a Weibull distribution having the given shape and mean.
 
-    return functools.partial(random.weibullvariate, mean / math.gamma(1 + 1 / shape), shape)
+    Variates are drawn from `rng`, a `random.Random` instance (e.g., a stream of random_streams.RandomStreams) or the
+    `random` module itself."""
+
+    return functools.partial(rng.weibullvariate, weibull_scale(shape, mean), shape)
+
+
+def weibull_scale(shape, mean):
+    """Scale parameter of the Weibull distribution having the given shape and mean."""
+
+    return mean / math.gamma(1 + 1 / shape)
 
 
 def isoformat2ts(date_string):
@@ -0,0 +1,244 @@
+# broker.py
+"""Work queue over TCP, to spread the tasks of a sweep over several hosts.
+
+A coordinator (`serve`) holds the list of tasks and hands them out to the workers (`work`) that connect to it, from
+the same host or from others; workers run them and send the results back, which the coordinator passes to a callback
+in its main thread, so that a single process writes the output files. Messages are pickled, on connections
+authenticated by a shared secret key (see `multiprocessing.connection`): anyone who knows the key can run arbitrary code
+on the coordinator and the workers, so there is no default one. Keep it secret, and only run workers and coordinators
+you trust.
+
+A task given to a worker is leased for `lease_time` seconds, and the worker renews the lease while it runs it. When a
+lease expires, or the worker disconnects, the task goes back to the queue, to be given to another worker; so does a
+task that raised an exception, up to `retries` times. Results of tasks that had already been completed are ignored.
+
+sweep.py uses this with --serve (coordinator) and --connect (workers); on a single machine, e.g.
+
+    export SWEEP_AUTHKEY=$(python3 -c 'import secrets; print(secrets.token_hex(16))')
+    ./sweep.py --serve localhost:5000 --lambd 0.9 0.99 --d 1 2 5 &
+    ./sweep.py --connect localhost:5000 --workers 4
+
+(without SWEEP_AUTHKEY or --authkey, --serve generates a key and prints it for the workers). storage.py in
+Assignment2, which keeps a copy of this file, spreads its --replications the same way.
+"""
+
+import collections
+import itertools
+import logging
+import multiprocessing
+import queue
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+AUTHKEY_ENV = 'SWEEP_AUTHKEY'  # environment variable holding the key, if not given on the command line
+
+
+def new_authkey():
+    """A random key, as a string to share with the workers."""
+
+    return secrets.token_hex(16)
+
+
+def parse_address(address):
+    """'host:port' -> (host, port)."""
+
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+class Broker:
+    """The state of the coordinator: tasks waiting, leased, completed and failed. All methods are thread-safe."""
+
+    def __init__(self, tasks, lease_time=60.0, retries=2):
+        self.tasks = tasks
+        self.lease_time = lease_time
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.waiting = collections.deque(range(len(tasks)))
+        self.leases = {}  # task index -> (connection id, expiry time)
+        self.attempts = [0] * len(tasks)
+        self.completed = set()
+        self.failed = set()  # indices of the tasks given up on
+        self.results = queue.Queue()  # (task, result) pairs, for the main thread
+
+    def finished(self):
+        with self.lock:
+            self._expire()
+            return not self.waiting and not self.leases
+
+    def lease(self, connection_id):
+        """Return the index of the next task to run and lease it to `connection_id`, or None if there is none now."""
+
+        with self.lock:
+            self._expire()
+            if not self.waiting:
+                return None
+            i = self.waiting.popleft()
+            self.leases[i] = connection_id, time.monotonic() + self.lease_time
+            return i
+
+    def renew(self, i, connection_id):
+        with self.lock:
+            if self.leases.get(i, (None,))[0] == connection_id:
+                self.leases[i] = connection_id, time.monotonic() + self.lease_time
+
+    def complete(self, i, result):
+        with self.lock:
+            if i in self.completed or i in self.failed:
+                return  # another worker already did it after the lease had expired, or it was given up on
+            self.leases.pop(i, None)
+            if i in self.waiting:
+                self.waiting.remove(i)
+            self.completed.add(i)
+            self.results.put((self.tasks[i], result))  # under the lock, so that `finished` implies it is queued
+
+    def fail(self, i, connection_id, error):
+        with self.lock:
+            if self.leases.get(i, (None,))[0] == connection_id:
+                del self.leases[i]
+                self._retry(i, error)
+
+    def release(self, connection_id):
+        """Put back in the queue the tasks leased to `connection_id`, which has disconnected."""
+
+        with self.lock:
+            for i in [i for i, (owner, _) in self.leases.items() if owner == connection_id]:
+                del self.leases[i]
+                self._retry(i, "worker disconnected")
+
+    def _expire(self):
+        now = time.monotonic()
+        for i in [i for i, (_, expiry) in self.leases.items() if expiry < now]:
+            del self.leases[i]
+            self._retry(i, "lease expired")
+
+    def _retry(self, i, error):
+        self.attempts[i] += 1
+        if self.attempts[i] > self.retries:
+            logging.error(f"{self.tasks[i]} failed {self.attempts[i]} times, giving up: {error}")
+            self.failed.add(i)
+        else:
+            logging.warning(f"{self.tasks[i]} failed, retrying: {error}")
+            self.waiting.append(i)
+
+
+def _handle(broker, connection, connection_id):
+    """Serve the requests of a worker until it disconnects."""
+
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == 'lease':
+                i = broker.lease(connection_id)
+                if i is not None:
+                    connection.send(('task', i, broker.tasks[i], broker.lease_time))
+                elif broker.finished():
+                    connection.send(('done',))
+                else:
+                    connection.send(('wait', 1.0))  # all the tasks are leased: one might come back
+            elif message[0] == 'renew':
+                broker.renew(message[1], connection_id)
+            elif message[0] == 'result':
+                broker.complete(message[1], message[2])
+            elif message[0] == 'error':
+                broker.fail(message[1], connection_id, message[2])
+    except (EOFError, OSError):
+        pass
+    finally:
+        broker.release(connection_id)
+        connection.close()
+
+
+def serve(tasks, address, on_result, authkey, lease_time=60.0, retries=2):
+    """Hand out `tasks` to the workers connecting to `address` ('host:port') with the key `authkey` (bytes), until all
+    of them are done or failed.
+
+    `on_result(task, result)` is called in this thread as results arrive. Returns the list of failed tasks.
+    """
+
+    broker = Broker(tasks, lease_time, retries)
+    listener = Listener(parse_address(address), authkey=authkey)
+    closed = threading.Event()
+
+    def accept():
+        for connection_id in itertools.count():
+            try:
+                connection = listener.accept()
+            except (OSError, multiprocessing.AuthenticationError):
+                if closed.is_set():
+                    return
+                logging.warning("rejected a connection that failed authentication")
+                continue
+            threading.Thread(target=_handle, args=(broker, connection, connection_id), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    logging.info(f"serving {len(tasks)} tasks on {address}")
+    try:
+        while not broker.finished() or not broker.results.empty():
+            try:
+                task, result = broker.results.get(timeout=1)
+            except queue.Empty:
+                continue
+            on_result(task, result)
+    finally:
+        closed.set()
+        listener.close()
+    return [tasks[i] for i in sorted(broker.failed)]
+
+
+def _work(address, authkey, function):
+    """Run tasks from the coordinator at `address` until there are none left (in a worker process)."""
+
+    try:
+        connection = Client(parse_address(address), authkey=authkey)
+    except ConnectionRefusedError:
+        logging.error(f"no coordinator at {address}")
+        return
+    send_lock = threading.Lock()  # the main thread and the lease renewals share the connection
+
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    try:
+        while True:
+            send(('lease',))
+            reply = connection.recv()
+            if reply[0] == 'done':
+                return
+            if reply[0] == 'wait':
+                time.sleep(reply[1])
+                continue
+            _, i, task, lease_time = reply
+            finished = threading.Event()
+
+            def renew(i=i, finished=finished):
+                while not finished.wait(lease_time / 3):
+                    send(('renew', i))
+
+            threading.Thread(target=renew, daemon=True).start()
+            try:
+                result = function(*task)
+            except Exception as e:
+                send(('error', i, repr(e)))
+            else:
+                send(('result', i, result))
+            finally:
+                finished.set()
+    except (EOFError, OSError):  # the coordinator has finished
+        pass
+    finally:
+        connection.close()
+
+
+def work(address, function, authkey, processes=1):
+    """Run `processes` worker processes, each calling `function(*task)` on tasks from the coordinator at `address`,
+    which has the key `authkey` (bytes)."""
+
+    workers = [multiprocessing.Process(target=_work, args=(address, authkey, function)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
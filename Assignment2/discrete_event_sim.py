@@ -1,36 +1,118 @@
-import heapq
-import logging
+import collections
+import json
 import sys
 import matplotlib.pyplot as plt
 import os
+import pickle
 import re
+import time
+
+from event_queue import make_event_queue
+from event_trace import EventTrace
+from random_streams import RandomStreams
+from tracing import INFO
 
 
 # TODO: implement the event queue! - Done
 # suggestion: have a look at the heapq library (https://docs.python.org/dev/library/heapq.html)
 # and in particular heappush and heappop
+# The queue itself lives in event_queue.py: a heapq-based heap by default, or a calendar queue for very large runs.
 
 class Simulation:
     """Subclass this to represent the simulation state.
 
     Here, self.t is the simulated time and self.events is the event queue.
+
+    Queue entries are (time, seq, event) tuples, where seq is the number of events scheduled before: events happening
+    at the same time are processed in the order they were scheduled, deterministically, without ever comparing the
+    events themselves.
+
+    Canceled events are not removed from the queue right away: they stay there as tombstones and are skipped when
+    popped. Once tombstones are more than COMPACT_FRACTION of the queue (and at least COMPACT_MIN_TOMBSTONES), the
+    queue is rebuilt without them.
     """
 
-    def __init__(self):
+    COMPACT_MIN_TOMBSTONES = 100
+    COMPACT_FRACTION = 0.5
+
+    def __init__(self, event_queue='heap', tracer=None, streams=None):
         """Extend this method with the needed initialization.  - Done
 
         You can call super().__init__() there to call the code here.
+        `event_queue` selects the event set implementation (see event_queue.EVENT_QUEUES), `tracer` is an optional
+        `tracing.Tracer`, `streams` the `random_streams.RandomStreams` that subclasses draw their random numbers from
+        (unseeded if None).
         """
 
         self.t = 0  # simulated time
-        self.events = []  # set up self.events as an empty queue
+        self.events = make_event_queue(event_queue)  # set up self.events as an empty queue
+        self.tombstones = 0  # number of canceled events still in self.events
+        self.seq = 0  # number of events scheduled so far, used to break ties
+        self.profile = None  # statistics of profiled runs, see `run_instrumented`
+        self.event_trace = None  # see `set_event_trace`
+        self.event_trace_size = None  # in a snapshot, the size of the event trace when it was taken
+        self.streams = RandomStreams() if streams is None else streams
+        self.set_tracer(tracer)
+
+    def set_tracer(self, tracer):
+        """Install a `tracing.Tracer`, or disable tracing with None."""
+
+        self.tracer = tracer
+        self.tracing = tracer is not None and tracer.active  # check this before calling `trace`
+
+    def trace(self, category, level=INFO, **fields):
+        """Emit a trace record at the current time. Only call this if `self.tracing` is true."""
+
+        self.tracer.emit(self.t, level, category, fields)
+
+    def set_event_trace(self, writer):
+        """Record every processed event with `writer` (an event_trace.EventTraceWriter), or stop with None.
+
+        A simulation loaded from a snapshot first cuts the trace back to its size when the snapshot was taken: the
+        events recorded after that are processed, and recorded, again.
+        """
+
+        if writer is not None and self.event_trace_size is not None:
+            writer.truncate(self.event_trace_size)
+        self.event_trace = writer
+
+    def __getstate__(self):
+        # tracers and event traces hold open files: they are not saved in snapshots and must be installed again
+        # after loading
+        state = self.__dict__.copy()
+        state['tracer'], state['tracing'], state['event_trace'] = None, False, None
+        state['event_trace_size'] = None if self.event_trace is None else self.event_trace.size()
+        return state
 
     def schedule(self, delay, event):
-        """Add an event to the event queue after the required delay."""
+        """Add an event to the event queue after the required delay.
+
+        Returns the event itself, which acts as a handle: call its `cancel()` method to cancel it.
+        """
 
         # add event to the queue at time self.t + delay
         event_time = self.t + delay
-        heapq.heappush(self.events, (event_time, event))
+        self.seq += 1
+        previous = getattr(event, 'sim', None)
+        event.sim, event.seq = self, self.seq  # only the queue entry with this seq is live
+        self.events.push((event_time, self.seq, event))
+        if previous is not None:  # rescheduled while still in the queue: its previous entry is now a tombstone
+            previous.event_canceled()
+        return event
+
+    def event_canceled(self):
+        """Called by `Event.cancel`: count the new tombstone and compact the queue if there are too many."""
+
+        self.tombstones += 1
+        tombstones = self.tombstones
+        if tombstones >= self.COMPACT_MIN_TOMBSTONES and tombstones > self.COMPACT_FRACTION * len(self.events):
+            self.compact()
+
+    def compact(self):
+        """Rebuild the event queue without the canceled events."""
+
+        self.events.rebuild([entry for entry in self.events if entry[-1].seq == entry[1]])
+        self.tombstones = 0
 
     def decide_which_plot(self):
         # Get the path of the current file
@@ -76,19 +158,179 @@ class Simulation:
         if all(os.path.exists(log_file) for log_file in client_server_log_files):
             self.plot_combined_results(client_server_log_files, 'Combined Client-Server Simulation Results', plots_combined[1])
 
-    def run(self, max_t=float('inf')):
-        """Run the simulation until the event queue is empty or max_t is reached."""
-        while self.events and self.events[0][0] <= max_t:
-            t, event = heapq.heappop(self.events)  # Get the first event from the queue
+    def run(self, max_t=float('inf'), profile=False, checkpoint=None, checkpoint_interval=float('inf'),
+            max_events=None, wall_time=None, stop_when=None, check_every=10_000):
+        """Run the simulation until the event queue is empty or max_t is reached.
+
+        The run can also be stopped earlier, by processing at most `max_events` events, by spending at most
+        `wall_time` seconds, or as soon as `stop_when(self)` is true. Those conditions are checked every
+        `check_every` events (see `Budget`); the method returns the reason why the run was stopped early (one of
+        Budget.REASONS), or None if it ended normally.
+
+        If `profile` is true, per-event-class statistics are collected in self.profile (see `Profile`). Profiling
+        and event traces (see `set_event_trace`) use their own loop, `run_instrumented`, so that normal runs pay
+        nothing for them.
+
+        If `checkpoint` is a file name, a snapshot of the simulation is written there (see `save_checkpoint`) every
+        `checkpoint_interval` units of simulated time and when the run is over. Events after max_t stay in the queue,
+        so a simulation loaded from the snapshot can be run again with a larger max_t to extend the horizon.
+        """
+        instrumented = profile or self.event_trace is not None
+        budget = None
+        if max_events is not None or wall_time is not None or stop_when is not None:
+            budget = Budget(max_events, wall_time, stop_when, check_every)
+            step = (lambda n, horizon: self.run_instrumented(horizon, n, profile)) if instrumented else self.step
+            loop = lambda horizon: budget.run(self, step, horizon)
+        elif instrumented:
+            loop = lambda horizon: self.run_instrumented(horizon, profile=profile)
+        else:
+            loop = self.run_loop
+        if checkpoint is None:
+            loop(max_t)
+        else:
+            # run in slices of simulated time, saving a snapshot after each one
+            horizon = self.t
+            while horizon < max_t and len(self.events) > self.tombstones:
+                horizon = min(horizon + checkpoint_interval, max_t)
+                loop(horizon)
+                self.save_checkpoint(checkpoint)
+                if budget is not None and budget.exhausted:
+                    break
+        if self.event_trace is not None:
+            self.event_trace.flush()
+
+        self.decide_which_plot()
+        return budget and budget.exhausted
+
+    def save_checkpoint(self, path):
+        """Write a snapshot of the simulation to `path`: the clock, the pending events and the subclass state, random
+        streams included (all the randomness comes from self.streams: the global `random` module isn't saved).
+
+        The snapshot is first written to a temporary file, then renamed: an interrupted run never leaves a truncated
+        snapshot behind.
+        """
+
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'simulation': self}, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if self.event_trace is not None:
+            self.event_trace.flush()  # the trace on disk then covers exactly the events before the snapshot
+
+    @staticmethod
+    def load_checkpoint(path):
+        """Return the simulation saved in `path` by `save_checkpoint`."""
+
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+        return snapshot['simulation']  # older snapshots also hold a 'random_state', now ignored
+
+    def run_loop(self, max_t):
+        """The simulation loop of `run`, without profiling."""
+        push, pop = self.events.push, self.events.pop
+        while True:
+            try:
+                t, seq, event = pop()  # Get the first event from the queue
+            except IndexError:  # the queue is empty
+                break
+            if event.seq != seq:  # canceled event, or one rescheduled since
+                self.tombstones -= 1
+                continue
             if t > max_t:
+                push((t, seq, event))  # leave it in the queue, so the simulation can be continued later
                 break
             self.t = t
+            event.sim = None  # no longer scheduled: cancel() does nothing, unless process() reschedules it
             event.process(self)
+            free_list = event.free_list
+            if free_list is not None:  # pooled event class: recycle the instance
+                free_list.append(event)
+
+    def step(self, n=1, max_t=float('inf')):
+        """Process the next n events (canceled ones don't count), stopping earlier if the queue is empty or the
+        next event is after max_t. Returns the number of events processed."""
+
+        push, pop = self.events.push, self.events.pop
+        processed = 0
+        while processed < n:
+            try:
+                t, seq, event = pop()
+            except IndexError:
+                break
+            if event.seq != seq:
+                self.tombstones -= 1
+                continue
+            if t > max_t:
+                push((t, seq, event))
+                break
+            self.t = t
+            event.sim = None
+            event.process(self)
+            processed += 1
+            free_list = event.free_list
+            if free_list is not None:
+                free_list.append(event)
+        return processed
 
-        self.decide_which_plot()
+    def run_instrumented(self, max_t=float('inf'), max_events=float('inf'), profile=False):
+        """Same as `run_loop`, but record each event in self.event_trace, if set, and profile the run if `profile` is
+        true: measure the wall time spent on each event and the length of the event queue.
+
+        At most `max_events` events are processed; returns the number of events processed.
+        """
+
+        if profile and self.profile is None:
+            self.profile = Profile()
+        profile = self.profile if profile else None
+        event_trace = self.event_trace
+        events = self.events
+        push, pop = events.push, events.pop
+        perf_counter = time.perf_counter
+        start = perf_counter()
+        processed = 0
+        while processed < max_events:
+            try:
+                t, seq, event = pop()
+            except IndexError:
+                break
+            if event.seq != seq:
+                self.tombstones -= 1
+                continue
+            if t > max_t:
+                push((t, seq, event))
+                break
+            self.t = t
+            event.sim = None
+            if event_trace is not None:
+                event_trace.record(t, event)
+            if profile is None:
+                event.process(self)
+            else:
+                before = perf_counter()
+                event.process(self)
+                elapsed = perf_counter() - before
+                event_class = type(event)
+                profile.counts[event_class] += 1
+                profile.times[event_class] += elapsed
+                queue_len = len(events)
+                profile.queue_len_sum += queue_len
+                if queue_len > profile.queue_len_peak:
+                    profile.queue_len_peak = queue_len
+            processed += 1
+            free_list = event.free_list
+            if free_list is not None:
+                free_list.append(event)
+        if profile is not None:
+            profile.wall_time += perf_counter() - start
+        return processed
         
     def plot_combined_results(self, log_file, title, file_path):
         def process_log_file(log_file):
+            data = self.event_trace_counts(log_file, 'BlockBackupComplete', 'BlockRestoreComplete')
+            if data is not None:
+                return data
             failures = []
             recoveries = []
             backups = []
@@ -156,26 +398,30 @@ class Simulation:
         recoveries = []
         backups = []
 
-        with open(log_file, 'r') as f:
-            for line in f:
-                parts = line.strip().split(':')
-                try:
-                    time_str = parts[1].strip()
-                    event_type = parts[2].strip().split()[0]
-                    time = self.convert_time_to_days(time_str)
-                    if 'fails' in event_type:
-                        failures.append((time, 1))
-                    elif 'recovers' in event_type:
-                        recoveries.append((time, 1))
-                    elif 'BlockBackupComplete' in event_type:
-                        backups.append((time, 1))
-                except:
-                    continue
-
-        # Convert to cumulative counts
-        failures = self.cumulative_count(failures)
-        recoveries = self.cumulative_count(recoveries)
-        backups = self.cumulative_count(backups)
+        data = self.event_trace_counts(log_file, 'BlockBackupComplete')
+        if data is not None:
+            failures, recoveries, backups = data["failures"], data["recoveries"], data["backups"]
+        else:
+            with open(log_file, 'r') as f:
+                for line in f:
+                    parts = line.strip().split(':')
+                    try:
+                        time_str = parts[1].strip()
+                        event_type = parts[2].strip().split()[0]
+                        time = self.convert_time_to_days(time_str)
+                        if 'fails' in event_type:
+                            failures.append((time, 1))
+                        elif 'recovers' in event_type:
+                            recoveries.append((time, 1))
+                        elif 'BlockBackupComplete' in event_type:
+                            backups.append((time, 1))
+                    except:
+                        continue
+
+            # Convert to cumulative counts
+            failures = self.cumulative_count(failures)
+            recoveries = self.cumulative_count(recoveries)
+            backups = self.cumulative_count(backups)
 
         plt.figure(figsize=(12, 8))
 
@@ -242,7 +488,29 @@ class Simulation:
         return total_days
 
     def log_info(self, msg):
-        logging.info(f'{self.t:.2f}: {msg}')
+        """Trace a free-form message; prefer `trace` with structured fields, checking `self.tracing` first."""
+
+        if self.tracing:
+            self.trace('log', message=msg)
+
+    def event_trace_counts(self, log_file, *backup_kinds):
+        """Cumulative failures, recoveries and backups (with event types `backup_kinds`) over time, in days, read from
+        the binary event trace saved next to `log_file` (see storage.py --event-trace); None if there is none."""
+
+        path = log_file.replace('.log', '.events')
+        if not (os.path.exists(path) and os.path.exists(f'{path}.json')):
+            return None
+        trace = EventTrace(path)
+
+        def cumulative(*kinds):
+            days = trace.times(*kinds) / 86400
+            return list(zip(days.tolist(), range(1, len(days) + 1)))
+
+        return {
+            "failures": cumulative('Fail'),
+            "recoveries": cumulative('Recover'),
+            "backups": cumulative(*backup_kinds),
+        }
 
     def cumulative_count(self, events):
         """Helper function to convert event list to cumulative counts."""
@@ -259,12 +527,151 @@ class Event:
     Subclass this to represent your events.
 
     You may need to define __init__ to set up all the necessary information.
+
+    Subclasses should declare __slots__ with their attributes to save memory on high-rate events. Classes decorated
+    with @pooled also recycle their instances: create them with `cls.new(...)` instead of `cls(...)`.
     """
 
+    # the simulation this event is scheduled on (None once processed or canceled), and the seq of its live entry in the
+    # queue (None once canceled): entries with another seq are tombstones
+    __slots__ = ('sim', 'seq')
+
+    free_list = None  # list of recycled instances, for @pooled classes
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.free_list = None  # pooling is not inherited: a @pooled class must not receive instances of its subclasses
+
+    @classmethod
+    def new(cls, *args):
+        """Return an initialized instance, reusing a recycled one if available."""
+
+        free_list = cls.free_list
+        if free_list:
+            event = free_list.pop()
+            event.__init__(*args)
+            return event
+        return cls(*args)
+
     def process(self, sim: Simulation):
         raise NotImplementedError
 
-    def __lt__(self, other):
-        """Method needed to break ties with events happening at the same time."""
+    def trace_ids(self):
+        """Return the (entity id, entity id, payload) stored with this event in binary event traces.
+
+        Override this to record something meaningful: unused ids are -1, an unused payload is NaN.
+        """
+
+        return -1, -1, float('nan')
 
-        return id(self) < id(other)
+    def cancel(self, seq=None):
+        """Cancel this event: it will be skipped instead of processed. Does nothing if it is not scheduled.
+
+        With `seq`, the value of self.seq when it was scheduled, only cancel it if it is still scheduled that time: a
+        handle kept as (event, seq) can't cancel an unrelated event after a pooled instance has been recycled.
+        """
+
+        sim = getattr(self, 'sim', None)
+        if sim is not None and (seq is None or seq == self.seq):
+            self.sim = self.seq = None
+            sim.event_canceled()
+
+
+def pooled(cls):
+    """Class decorator: processed instances of `cls` are put in a free list and reused by `cls.new()`.
+
+    Only use it for events that are never rescheduled once they are processed. To keep a handle to a pooled event,
+    keep (event, event.seq) and cancel it with `event.cancel(seq)`: the instance may have been reused since.
+    """
+
+    cls.free_list = []
+    return cls
+
+
+class Profile:
+    """Statistics collected by `Simulation.run(profile=True)`.
+
+    For each event class, how many events were processed and the wall time spent processing them; the event queue
+    length (tombstones included) is sampled after each event.
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()  # event class -> number of processed events
+        self.times = collections.defaultdict(float)  # event class -> total wall time spent in `process`, in seconds
+        self.queue_len_sum = 0  # sum of the queue lengths after each event, to compute the mean
+        self.queue_len_peak = 0
+        self.wall_time = 0  # wall time spent in the profiled loop
+
+    def as_dict(self):
+        """Return the statistics as a JSON-serializable dictionary."""
+
+        n_events = sum(self.counts.values())
+        return {
+            'events': n_events,
+            'wall_time': self.wall_time,
+            'queue_len_mean': self.queue_len_sum / n_events if n_events else 0,
+            'queue_len_peak': self.queue_len_peak,
+            'classes': {
+                event_class.__name__: {
+                    'count': count,
+                    'total_time': self.times[event_class],
+                    'mean_time': self.times[event_class] / count,
+                } for event_class, count in self.counts.most_common()
+            },
+        }
+
+    def report(self):
+        """Return a compact, human-readable report, slowest event classes first."""
+
+        stats = self.as_dict()
+        lines = [f"{'event class':<24} {'count':>12} {'total (s)':>10} {'mean (us)':>10} {'share':>6}"]
+        classes = sorted(stats['classes'].items(), key=lambda item: item[1]['total_time'], reverse=True)
+        total_time = sum(s['total_time'] for _, s in classes) or 1
+        for name, s in classes:
+            lines.append(f"{name:<24} {s['count']:>12,} {s['total_time']:>10.3f} {s['mean_time'] * 1e6:>10.2f} "
+                         f"{s['total_time'] / total_time:>6.1%}")
+        lines.append(f"{stats['events']:,} events in {stats['wall_time']:.3f} s; event queue length: "
+                     f"mean {stats['queue_len_mean']:.1f}, peak {stats['queue_len_peak']:,}")
+        return '\n'.join(lines)
+
+    def save(self, path):
+        """Print the report if `path` is '-', otherwise write the statistics as JSON in `path`."""
+
+        if path == '-':
+            print(self.report())
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.as_dict(), f, indent=2)
+
+
+class Budget:
+    """Stop conditions for `Simulation.run`, besides the simulated time; they are checked every `check_every` events.
+
+    `max_events` bounds the number of processed events, `wall_time` the wall-clock seconds spent, and `stop_when` is
+    a predicate called with the simulation (e.g., `lambda sim: len(sim.completions) >= 10_000_000`).
+    """
+
+    REASONS = ('max_events', 'wall_time', 'stop_when')
+
+    def __init__(self, max_events=None, wall_time=None, stop_when=None, check_every=10_000):
+        self.events_left = float('inf') if max_events is None else max_events
+        self.deadline = float('inf') if wall_time is None else time.monotonic() + wall_time
+        self.stop_when = stop_when
+        self.check_every = check_every
+        self.exhausted = None  # the reason why the run was stopped, once it was
+
+    def run(self, sim, step, max_t):
+        """Run `sim` through `step(n, max_t)` in chunks, until max_t, an empty queue or the end of the budget."""
+
+        while self.exhausted is None:
+            n = min(self.check_every, self.events_left)
+            processed = step(n, max_t)
+            self.events_left -= processed
+            if self.events_left <= 0:
+                self.exhausted = 'max_events'
+            elif processed < n:  # the queue is empty, or the next event is after max_t
+                break
+            elif self.stop_when is not None and self.stop_when(sim):
+                self.exhausted = 'stop_when'
+            elif time.monotonic() >= self.deadline:
+                self.exhausted = 'wall_time'
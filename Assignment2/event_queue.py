@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# event_queue.py
+"""Event-set implementations for `Simulation.events`.
+
+Every implementation stores opaque entries (tuples whose first item is the event time) and exposes the same small
+interface used by the simulation loop:
+
+- `push(entry)` adds an entry;
+- `pop()` removes and returns the entry with the smallest time, raising IndexError when empty;
+- `len()`, iteration (in no particular order) and `rebuild(entries)` to replace the whole content.
+
+`HeapQueue` (the default) is a binary heap managed by `heapq`. `CalendarQueue` is R. Brown's calendar queue (1988):
+events are hashed in buckets ("days") of a fixed width, and the queue automatically resizes and recomputes the width
+when the number of events changes too much, giving amortised O(1) enqueue and dequeue.
+
+Run this file to benchmark the two implementations on the classic "hold" model and find the crossover point.
+"""
+
+import argparse
+import functools
+import heapq
+import random
+import time
+
+
+class HeapQueue:
+    """Binary heap: O(log N) per operation, but every operation runs in C."""
+
+    def __init__(self):
+        self.entries = []
+        # bind the heapq functions once: this avoids a Python-level method call per event
+        self.push = functools.partial(heapq.heappush, self.entries)
+        self.pop = functools.partial(heapq.heappop, self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def rebuild(self, entries):
+        self.entries[:] = entries
+        heapq.heapify(self.entries)
+
+
+class CalendarQueue:
+    """Calendar queue with automatic bucket resizing.
+
+    Bucket i holds, as a small heap, the entries whose "virtual bucket" int(time / width) is congruent to i modulo
+    the number of buckets. Dequeuing scans the buckets from the current one, looking for an entry belonging to the
+    current virtual bucket ("today"); if a whole year goes by without finding one, we fall back to a direct search.
+    """
+
+    MIN_BUCKETS = 2
+    SAMPLE_SIZE = 25  # number of entries looked at when estimating the bucket width
+
+    def __init__(self, width=1.0, n_buckets=MIN_BUCKETS):
+        self.width = width  # time span of each bucket
+        self.size = 0  # number of entries in the queue
+        self.current = 0  # virtual bucket we are currently dequeuing from
+        self._setup(n_buckets)
+
+    def _setup(self, n_buckets):
+        self.buckets = [[] for _ in range(n_buckets)]
+        self.n_buckets = n_buckets
+        self.grow_threshold = 2 * n_buckets
+        self.shrink_threshold = n_buckets // 2 - 2 if n_buckets > self.MIN_BUCKETS else -1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+    def push(self, entry):
+        virtual_bucket = int(entry[0] / self.width)
+        heapq.heappush(self.buckets[virtual_bucket % self.n_buckets], entry)
+        if virtual_bucket < self.current:  # an entry in the past of the calendar: restart scanning from there
+            self.current = virtual_bucket
+        self.size += 1
+        if self.size > self.grow_threshold:
+            self.resize(2 * self.n_buckets)
+
+    def pop(self):
+        if not self.size:
+            raise IndexError('pop from an empty event queue')
+        buckets, n_buckets, width = self.buckets, self.n_buckets, self.width
+        current = self.current
+        for _ in range(n_buckets):
+            bucket = buckets[current % n_buckets]
+            if bucket and int(bucket[0][0] / width) <= current:
+                break
+            current += 1
+        else:  # a whole year without events: jump directly to the bucket holding the earliest one
+            bucket = min((b for b in buckets if b), key=lambda b: b[0][0])
+            current = int(bucket[0][0] / width)
+        self.current = current
+        entry = heapq.heappop(bucket)
+        self.size -= 1
+        if self.size < self.shrink_threshold:
+            self.resize(self.n_buckets // 2)
+        return entry
+
+    def resize(self, n_buckets):
+        """Change the number of buckets, re-estimating the bucket width from the entries currently queued."""
+
+        entries = list(self)
+        self.width = self._estimate_width(entries)
+        self._setup(max(n_buckets, self.MIN_BUCKETS))
+        self._fill(entries)
+
+    def rebuild(self, entries):
+        entries = list(entries)
+        self.width = self._estimate_width(entries)
+        n_buckets = self.MIN_BUCKETS
+        while 2 * n_buckets < len(entries):
+            n_buckets *= 2
+        self._setup(n_buckets)
+        self._fill(entries)
+
+    def _fill(self, entries):
+        width, n_buckets, buckets = self.width, self.n_buckets, self.buckets
+        for entry in entries:
+            buckets[int(entry[0] / width) % n_buckets].append(entry)
+        for bucket in buckets:
+            heapq.heapify(bucket)
+        self.size = len(entries)
+        self.current = int(min(entry[0] for entry in entries) / width) if entries else 0
+
+    def _estimate_width(self, entries):
+        """Brown's heuristic: three times the average separation between the earliest events, ignoring outliers."""
+
+        times = sorted(entry[0] for entry in heapq.nsmallest(self.SAMPLE_SIZE, entries, key=lambda e: e[0]))
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        if not gaps:
+            return self.width
+        average = sum(gaps) / len(gaps)
+        kept = [gap for gap in gaps if gap <= 2 * average]
+        average = sum(kept) / len(kept) if kept else average
+        return 3 * average if average > 0 else self.width
+
+
+EVENT_QUEUES = {
+    'heap': HeapQueue,
+    'calendar': CalendarQueue,
+}
+
+
+def make_event_queue(kind='heap'):
+    """Return an empty event queue of the given kind (one of the keys of EVENT_QUEUES)."""
+
+    try:
+        return EVENT_QUEUES[kind]()
+    except KeyError:
+        raise ValueError(f"unknown event queue {kind!r}, choose among {', '.join(EVENT_QUEUES)}") from None
+
+
+def hold_benchmark(kind, size, operations):
+    """Time the "hold" model: keep `size` events queued, then repeatedly pop one and push it back in the future.
+
+    Returns the average time per hold operation (one pop plus one push), in seconds.
+    """
+
+    rng = random.Random(42)
+    queue = make_event_queue(kind)
+    for i in range(size):
+        queue.push((rng.expovariate(1), i))
+    push, pop, expovariate = queue.push, queue.pop, rng.expovariate
+    start = time.perf_counter()
+    for _ in range(operations):
+        t, i = pop()
+        push((t + expovariate(1), i))
+    return (time.perf_counter() - start) / operations
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description="Compare the event queue implementations on the hold model.")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10 ** i for i in range(2, 7)],
+                        help="number of events kept in the queue")
+    parser.add_argument('--operations', type=int, default=200_000, help="hold operations timed for each size")
+    args = parser.parse_args()
+
+    print(f"{'size':>10} " + ' '.join(f"{kind:>12}" for kind in EVENT_QUEUES) + "  (ns per hold operation)")
+    crossover = None
+    for size in args.sizes:
+        timings = {kind: hold_benchmark(kind, size, args.operations) for kind in EVENT_QUEUES}
+        print(f"{size:>10} " + ' '.join(f"{timings[kind] * 1e9:>12.0f}" for kind in EVENT_QUEUES))
+        if crossover is None and timings['calendar'] < timings['heap']:
+            crossover = size
+    if crossover is None:
+        print("heapq was faster at every size tested")
+    else:
+        print(f"the calendar queue is faster from {crossover} queued events")
+
+
+if __name__ == '__main__':
+    main()
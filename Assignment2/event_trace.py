@@ -0,0 +1,114 @@
+# event_trace.py
+"""Binary trace of processed events, with a memory-mapped NumPy reader.
+
+Install an `EventTraceWriter` with `Simulation.set_event_trace` and every processed event is stored as a fixed-width
+record: time, event type code, two entity ids and a payload (see `Event.trace_ids`). Records are buffered and written
+in chunks; the event type names go in a small JSON file next to the trace (`<path>.json`).
+
+`EventTrace` memory-maps the file as a NumPy structured array, so that post-processing millions of events is a
+vectorised scan, e.g.
+    trace = EventTrace('run.events')
+    fail_times = trace.times('Fail')
+"""
+
+import json
+import os
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ('t', '<f8'),  # simulated time
+    ('kind', '<u2'),  # event type code, an index in the list of names saved in <path>.json
+    ('a', '<i8'),  # first entity id (-1 if unused)
+    ('b', '<i8'),  # second entity id (-1 if unused)
+    ('payload', '<f8'),  # event-specific value (NaN if unused)
+])
+
+
+class EventTraceWriter:
+    """Write event records to `path`, `chunk_size` records at a time.
+
+    With `append`, records are added to an existing trace (e.g., when resuming a simulation from a snapshot, which cuts
+    it back to its size at the time of the snapshot with `truncate`).
+    """
+
+    def __init__(self, path, chunk_size=65536, append=False):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.codes = {}  # event type name -> code
+        if append and os.path.exists(path):
+            with open(f'{path}.json') as f:
+                self.codes = {name: code for code, name in enumerate(json.load(f)['kinds'])}
+        self.file = open(path, 'ab' if append else 'wb')
+        self.buffer = []
+
+    def record(self, t, event):
+        """Append the record of `event`, processed at time t."""
+
+        name = type(event).__name__
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.codes)
+        self.buffer.append((t, code) + event.trace_ids())
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def size(self):
+        """Size of the trace in bytes, buffered records included."""
+
+        return self.file.tell() + len(self.buffer) * RECORD_DTYPE.itemsize
+
+    def truncate(self, size):
+        """Drop the records after the first `size` bytes (see `size`)."""
+
+        self.flush()
+        if size < self.file.tell():
+            self.file.truncate(size)
+            self.file.seek(size)
+
+    def flush(self):
+        if self.buffer:
+            np.array(self.buffer, dtype=RECORD_DTYPE).tofile(self.file)
+            self.buffer.clear()
+        self.file.flush()
+        with open(f'{self.path}.json', 'w') as f:
+            json.dump({'kinds': list(self.codes), 'dtype': RECORD_DTYPE.descr}, f)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class EventTrace:
+    """Read-only, memory-mapped view of a trace written by `EventTraceWriter`.
+
+    `records` is a structured array with the fields of RECORD_DTYPE; `kinds` the list of event type names.
+    """
+
+    def __init__(self, path):
+        with open(f'{path}.json') as f:
+            self.kinds = json.load(f)['kinds']
+        if os.path.getsize(path):
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r')
+        else:  # np.memmap can't map empty files
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def mask(self, *kinds):
+        """Boolean mask of the records of the given event types."""
+
+        codes = [self.kinds.index(kind) for kind in kinds if kind in self.kinds]
+        return np.isin(self.records['kind'], codes)
+
+    def times(self, *kinds):
+        """Times of the events of the given types, in order."""
+
+        return np.asarray(self.records['t'][self.mask(*kinds)])
+
+    def counts(self):
+        """Number of records of each event type."""
+
+        counts = np.bincount(self.records['kind'], minlength=len(self.kinds))
+        return dict(zip(self.kinds, counts.tolist()))
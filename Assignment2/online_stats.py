@@ -0,0 +1,180 @@
+# online_stats.py
+"""Statistics accumulated online, in constant memory, as values are observed one at a time."""
+
+import math
+import statistics
+
+import numpy as np
+
+
+class RunningStats:
+    """Count, mean and variance of a stream of values, with Welford's numerically stable algorithm."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the current mean
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def add_many(self, values):
+        """Add a NumPy array of values at once (Chan, Golub and LeVeque's update for combining two sets)."""
+
+        n = len(values)
+        if not n:
+            return
+        mean = values.mean()
+        total = self.count + n
+        delta = mean - self.mean
+        self.m2 += ((values - mean) ** 2).sum() + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+
+    @property
+    def variance(self):
+        """Sample variance (NaN with fewer than two values)."""
+
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class DDSketch:
+    """Quantile sketch with relative accuracy `alpha` (DDSketch, Masson, Rim and Lee, VLDB 2019).
+
+    Positive values are counted in logarithmically sized bins, so that any quantile is returned within a relative
+    error of alpha, in memory that only grows with the logarithm of the range of values; values <= 0 are counted
+    as zeros. Sketches with the same alpha can be merged (e.g., across replications run in different processes),
+    and saved as JSON-compatible dicts with `to_dict`.
+    """
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}  # bin index i -> number of values in (gamma ** (i - 1), gamma ** i]
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, x):
+        self.count += 1
+        if x <= 0:
+            self.zero_count += 1
+            return
+        i = math.ceil(math.log(x) / self.log_gamma)
+        self.bins[i] = self.bins.get(i, 0) + 1
+
+    def add_many(self, values):
+        """Add a NumPy array of values at once."""
+
+        positive = values[values > 0]
+        self.count += len(values)
+        self.zero_count += len(values) - len(positive)
+        indices, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True)
+        bins = self.bins
+        for i, count in zip(indices.tolist(), counts.tolist()):
+            bins[i] = bins.get(i, 0) + count
+
+    def quantile(self, q):
+        """Estimate of the q-quantile (0 <= q <= 1), NaN if the sketch is empty."""
+
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                return 2 * self.gamma ** i / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def merge(self, other):
+        """Add the values counted by `other` to this sketch."""
+
+        if other.alpha != self.alpha:
+            raise ValueError(f"can't merge sketches with different accuracies ({self.alpha} and {other.alpha})")
+        for i, count in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def to_dict(self):
+        return {'alpha': self.alpha, 'zero_count': self.zero_count, 'count': self.count,
+                'bins': {str(i): count for i, count in self.bins.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['alpha'])
+        sketch.zero_count, sketch.count = data['zero_count'], data['count']
+        sketch.bins = {int(i): count for i, count in data['bins'].items()}
+        return sketch
+
+
+def t_quantile(p, df):
+    """Quantile p of Student's t distribution with df degrees of freedom.
+
+    Cornish-Fisher expansion around the normal quantile (Abramowitz and Stegun 26.7.5): within 1e-3 of the exact value
+    for df >= 5, which is all batch means need.
+    """
+
+    z = statistics.NormalDist().inv_cdf(p)
+    terms = [(z ** 3 + z) / 4,
+             (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96,
+             (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384,
+             (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160]
+    return z + sum(term / df ** (i + 1) for i, term in enumerate(terms))
+
+
+class BatchMeans:
+    """Confidence interval for the mean of a correlated series (e.g., response times in a queue), by batch means.
+
+    Values are added as increments, (sum, count) of the values observed since the previous one; `increments` of them
+    make a batch. Whenever there are 2 * `batches` batches, adjacent ones are merged and batches get twice as many
+    increments: memory stays constant, and batches grow with the run, so that their means get less correlated. The
+    interval is computed on the batch means with Student's t, once there are at least `batches` complete batches.
+    """
+
+    def __init__(self, batches=16):
+        self.batches = batches
+        self.increments = 1  # increments per batch
+        self.totals = []  # sum of the values of each complete batch
+        self.counts = []  # number of values of each complete batch
+        self.partial = [0.0, 0, 0]  # sum, count and increments of the batch being filled
+
+    def add(self, total, count):
+        partial = self.partial
+        partial[0] += total
+        partial[1] += count
+        partial[2] += 1
+        if partial[2] == self.increments:
+            self.totals.append(partial[0])
+            self.counts.append(partial[1])
+            self.partial = [0.0, 0, 0]
+            if len(self.totals) == 2 * self.batches:
+                self.totals = [a + b for a, b in zip(self.totals[::2], self.totals[1::2])]
+                self.counts = [a + b for a, b in zip(self.counts[::2], self.counts[1::2])]
+                self.increments *= 2
+
+    @property
+    def mean(self):
+        """Mean of all the values added (NaN before any)."""
+
+        count = sum(self.counts) + self.partial[1]
+        return (sum(self.totals) + self.partial[0]) / count if count else math.nan
+
+    def half_width(self, confidence=0.95):
+        """Half-width of the confidence interval of the mean (NaN until there are enough batches)."""
+
+        k = len(self.totals)
+        if k < self.batches or not all(self.counts):
+            return math.nan
+        means = [total / count for total, count in zip(self.totals, self.counts)]
+        return t_quantile((1 + confidence) / 2, k - 1) * statistics.stdev(means) / math.sqrt(k)
@@ -3,9 +3,8 @@
 import argparse
 import configparser
 import logging
-import random
+import os
 from dataclasses import dataclass
-from random import expovariate
 from typing import Optional, List
 from dataclasses import dataclass, field
 from typing import List, Optional
@@ -16,12 +15,19 @@ from typing import List, Optional
 # It should be trivial to install (e.g., apt install python3-humanfriendly or conda/pip install humanfriendly).
 from humanfriendly import format_timespan, parse_size, parse_timespan
 
+import broker
 from discrete_event_sim import Simulation, Event
+from event_queue import EVENT_QUEUES
+from event_trace import EventTraceWriter
+from online_stats import BatchMeans
+from random_streams import RandomStreams
+from result_cache import DEFAULT_SIZE as DEFAULT_CACHE_SIZE, ResultCache
+from tracing import INFO, JsonLinesSink, TextSink, Tracer
 
 
-def exp_rv(mean):
-    """Return an exponential random variable with the given mean."""
-    return expovariate(1 / mean)
+def exp_rv(rng, mean):
+    """Return an exponential random variable with the given mean, drawn from the `random.Random` instance rng."""
+    return rng.expovariate(1 / mean)
 
 
 class DataLost(Exception):
@@ -29,20 +35,61 @@ class DataLost(Exception):
     pass
 
 
+COUNTS = ['failures', 'data_losses', 'backups', 'restores']  # the counts of `Backup`, in the order they are printed
+YEAR = parse_timespan('1 year')
+
+
 class Backup(Simulation):
     """Backup simulation.
     """
 
+    BATCH_TIME = parse_timespan('1 week')  # simulated time of each increment of the batch means (see `run_batches`)
+
+    TRACE_FORMATS = {  # how trace records are rendered by --verbose (plot_results parses the first word)
+        'recovers': 'recovers {node}',
+        'fails': 'fails {node}',
+        'transfer': '{kind} from {uploader} to {downloader}',
+        'blocks': '{node}: {local_blocks} local blocks, {backed_up_blocks} backed up blocks, '
+                  '{remote_blocks_held} remote blocks held',
+    }
+
     # type annotations for `Node` are strings here to allow a forward declaration:
     # https://stackoverflow.com/questions/36193540/self-reference-or-forward-reference-of-type-annotations-in-python
-    def __init__(self, nodes: List['Node']):
-        super().__init__()  # call the __init__ method of parent class
+    def __init__(self, nodes: List['Node'], event_queue: str = 'heap', tracer: Optional[Tracer] = None,
+                 streams: Optional[RandomStreams] = None):
+        super().__init__(event_queue, tracer, streams)  # call the __init__ method of parent class
+        # separate random streams for churn (uptime/downtime), failures and repairs
+        self.churn_rng = self.streams.stream('churn')
+        self.failure_rng = self.streams.stream('failures')
+        self.repair_rng = self.streams.stream('repairs')
         self.nodes = nodes
+        self.failures = 0  # nodes that lost their local data
+        self.data_losses = 0  # failures of nodes with fewer than k blocks backed up, whose data can't be restored
+        self.backups = 0  # blocks backed up on a peer
+        self.restores = 0  # blocks restored from a peer
+        self.batches = {name: BatchMeans() for name in COUNTS}  # confidence intervals of their rates, see `run_batches`
+        for index, node in enumerate(nodes):
+            node.index = index  # identifies the node in binary event traces
 
         # we add to the event queue the first event of each node going online and of failing
         for node in nodes:
             self.schedule(node.arrival_time, Online(node))
-            self.schedule(node.arrival_time + exp_rv(node.average_lifetime), Fail(node))
+            self.schedule(node.arrival_time + exp_rv(self.failure_rng, node.average_lifetime), Fail(node))
+
+    def run_batches(self, max_t, stop_when=None):
+        """Run until max_t in slices of BATCH_TIME, adding the counts of each slice to self.batches; stop after a
+        slice if `stop_when(self)` is true, and return whether it was."""
+
+        horizon = self.t
+        while horizon < max_t:
+            start, horizon = horizon, min(horizon + self.BATCH_TIME, max_t)
+            before = [getattr(self, name) for name in COUNTS]
+            self.run_loop(horizon)  # not `run`, which plots the results of the logs of storage.sh
+            for name, count in zip(COUNTS, before):
+                self.batches[name].add(getattr(self, name) - count, horizon - start)
+            if stop_when is not None and stop_when(self):
+                return True
+        return False
 
     def schedule_transfer(self, uploader: 'Node', downloader: 'Node', block_id: int, restore: bool):
         """Helper function called by `Node.schedule_next_upload` and `Node.schedule_next_download`.
@@ -87,12 +134,6 @@ class Backup(Simulation):
                 node.set_n_active(desired_n_active)
 
 
-    def log_info(self, msg):
-        """Override method to get human-friendly logging for time."""
-
-        logging.info(f'{format_timespan(self.t)}: {msg}')
-
-
 class RedundancyCheckEvent(Event):
     """Event to check system redundancy and possibly increase n_active."""
     def process(self, sim: Backup):
@@ -142,6 +183,9 @@ class Node:
         if self.n_active == -1 or self.n_active > self.n or self.n_active is None:
             self.n_active = self.n
             
+        # position of this node in `Backup.nodes`, set by `Backup`
+        self.index: int = -1
+
         # whether this node is online. All nodes start offline.
         self.online: bool = False
 
@@ -311,6 +355,9 @@ class NodeEvent(Event):
         """Must be implemented by subclasses."""
         raise NotImplementedError
 
+    def trace_ids(self):
+        return self.node.index, -1, float('nan')
+
 
 class Online(NodeEvent):
     """A node goes online."""
@@ -324,7 +371,7 @@ class Online(NodeEvent):
         node.schedule_next_upload(sim)
         node.schedule_next_download(sim)
         # Schedule the next offline event
-        sim.schedule(exp_rv(node.average_uptime), Offline(node))
+        sim.schedule(exp_rv(sim.churn_rng, node.average_uptime), Offline(node))
 
 
 class Recover(Online):
@@ -332,10 +379,11 @@ class Recover(Online):
 
     def process(self, sim: Backup):
         node = self.node
-        sim.log_info(f"recovers {node}")
+        if sim.tracing:
+            sim.trace('recovers', node=node)
         node.failed = False
         super().process(sim)
-        sim.schedule(exp_rv(node.average_lifetime), Fail(node))
+        sim.schedule(exp_rv(sim.failure_rng, node.average_lifetime), Fail(node))
 
 
 class Disconnection(NodeEvent):
@@ -352,11 +400,11 @@ class Disconnection(NodeEvent):
         # retrieve the nodes we're uploading and downloading to and set their current downloads and uploads to None
         current_upload, current_download = node.current_upload, node.current_download
         if current_upload is not None:
-            current_upload.canceled = True
+            current_upload.cancel()
             current_upload.downloader.current_download = None
             node.current_upload = None
         if current_download is not None:
-            current_download.canceled = True
+            current_download.cancel()
             current_download.uploader.current_upload = None
             node.current_download = None
 
@@ -371,16 +419,20 @@ class Offline(Disconnection):
         assert node.online
         self.disconnect()
         # schedule the next online event
-        sim.schedule(exp_rv(self.node.average_downtime), Online(node))
+        sim.schedule(exp_rv(sim.churn_rng, self.node.average_downtime), Online(node))
 
 
 class Fail(Disconnection):
     """A node fails and loses all local data."""
 
     def process(self, sim: Backup):
-        sim.log_info(f"fails {self.node}")
+        if sim.tracing:
+            sim.trace('fails', node=self.node)
         self.disconnect()
         node = self.node
+        sim.failures += 1
+        if sum(peer is not None for peer in node.backed_up_blocks) < node.k:
+            sim.data_losses += 1
         node.failed = True
         node.local_blocks = [False] * node.n  # lose all local data
         # lose all remote data
@@ -392,7 +444,7 @@ class Fail(Disconnection):
         node.free_space = node.storage_size - node.block_size * node.n_active
 
         # schedule the next online and recover events
-        recover_time = exp_rv(node.average_recover_time)
+        recover_time = exp_rv(sim.repair_rng, node.average_recover_time)
         sim.schedule(recover_time, Recover(node))
 
 @dataclass
@@ -402,25 +454,28 @@ class TransferComplete(Event):
     uploader: Node
     downloader: Node
     block_id: int
-    canceled: bool = False
 
     def __post_init__(self):
         assert self.uploader is not self.downloader
 
+    def trace_ids(self):
+        return self.uploader.index, self.downloader.index, self.block_id
+
     def process(self, sim: Backup):
-        sim.log_info(f"{self.__class__.__name__} from {self.uploader} to {self.downloader}")
-        if self.canceled:
-            return  # this transfer was canceled, so ignore this event
+        # canceled transfers (see `Disconnection.disconnect`) are skipped by the simulation loop and never get here
+        if sim.tracing:
+            sim.trace('transfer', kind=self.__class__.__name__, uploader=self.uploader, downloader=self.downloader)
         uploader, downloader = self.uploader, self.downloader
         assert uploader.online and downloader.online
         self.update_block_state(sim)
         uploader.current_upload = downloader.current_download = None
         uploader.schedule_next_upload(sim)
         downloader.schedule_next_download(sim)
-        for node in [uploader, downloader]:
-            sim.log_info(f"{node}: {sum(node.local_blocks)} local blocks, "
-                         f"{sum(peer is not None for peer in node.backed_up_blocks)} backed up blocks, "
-                         f"{len(node.remote_blocks_held)} remote blocks held")
+        if sim.tracing and sim.tracer.wants(INFO, 'blocks'):  # computing the fields is not free: check first
+            for node in [uploader, downloader]:
+                sim.trace('blocks', node=node, local_blocks=sum(node.local_blocks),
+                          backed_up_blocks=sum(peer is not None for peer in node.backed_up_blocks),
+                          remote_blocks_held=len(node.remote_blocks_held))
 
     def update_block_state(self, sim: Backup):
         """Needs to be specified by the subclasses, `BackupComplete` and `DownloadComplete`."""
@@ -431,6 +486,7 @@ class BlockBackupComplete(TransferComplete):
 
     def update_block_state(self, sim: Backup):
         owner, peer = self.uploader, self.downloader
+        sim.backups += 1
         peer.free_space -= owner.block_size
         assert peer.free_space >= 0
         owner.backed_up_blocks[self.block_id] = peer
@@ -440,6 +496,7 @@ class BlockBackupComplete(TransferComplete):
 class BlockRestoreComplete(TransferComplete):
     def update_block_state(self, sim:Backup):
         owner = self.downloader
+        sim.restores += 1
         owner.local_blocks[self.block_id] = True
 
         if sum(owner.local_blocks) >= owner.k:
@@ -450,59 +507,247 @@ class BlockRestoreComplete(TransferComplete):
             owner.failed = True
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("config", help="configuration file")
-    parser.add_argument("--max-t", default="100 years")
-    parser.add_argument("--seed", help="random seed")
-    parser.add_argument("--verbose", action='store_true')
-    parser.add_argument("--n-active", type=int, default=-1, 
-                        help="Number of active blocks to use out of n (overrides config).")
-    parser.add_argument("--tolerance", type=int, default=-1, 
-                        help="Difference between blocks that we have and blocks that we need. If it reaches below  this value, we add redundancy.")
-    args = parser.parse_args()
+# functions to parse every parameter of peer configuration
+PARSING_FUNCTIONS = [
+    ('n', int), ('k', int),
+    ('data_size', parse_size), ('storage_size', parse_size),
+    ('upload_speed', parse_size), ('download_speed', parse_size),
+    ('average_uptime', parse_timespan), ('average_downtime', parse_timespan),
+    ('average_lifetime', parse_timespan), ('average_recover_time', parse_timespan),
+    ('arrival_time', parse_timespan),
+    ('n_active', int), ('tolerance', int)
+]
 
-    if args.seed:
-        random.seed(args.seed)  # set a seed to make experiments repeatable
-    if args.verbose:
-        logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')  # output info on stdout
 
-    # functions to parse every parameter of peer configuration
-    parsing_functions = [
-        ('n', int), ('k', int),
-        ('data_size', parse_size), ('storage_size', parse_size),
-        ('upload_speed', parse_size), ('download_speed', parse_size),
-        ('average_uptime', parse_timespan), ('average_downtime', parse_timespan),
-        ('average_lifetime', parse_timespan), ('average_recover_time', parse_timespan),
-        ('arrival_time', parse_timespan),
-        ('n_active', int), ('tolerance', int)
-    ]
+def read_nodes(config_text: str, n_active: int = -1, tolerance: int = -1) -> List[Node]:
+    """The nodes described by `config_text`, the contents of a configuration file like p2p.cfg."""
 
     config = configparser.ConfigParser()
-    config.read(args.config)
+    config.read_string(config_text)
     nodes = []  # we build the list of nodes to pass to the Backup class
     for node_class in config.sections():
         class_config = config[node_class]
         # list comprehension: https://docs.python.org/3/tutorial/datastructures.html#list-comprehensions
-        
-        # cfg = [parse(class_config[name]) for name, parse in parsing_functions]
+
+        # cfg = [parse(class_config[name]) for name, parse in PARSING_FUNCTIONS]
         cfg = []
-        for name, parse in parsing_functions:
-            if name == 'n_active' and args.n_active is not None:
-                cfg.append(args.n_active)  # Use command-line value
-            elif name == 'tolerance' and args.tolerance is not None:
-                cfg.append(args.tolerance)  # Use command-line value
+        for name, parse in PARSING_FUNCTIONS:
+            if name == 'n_active' and n_active is not None:
+                cfg.append(n_active)  # Use command-line value
+            elif name == 'tolerance' and tolerance is not None:
+                cfg.append(tolerance)  # Use command-line value
             else:
                 cfg.append(parse(class_config[name]))
 
         # the `callable(p1, p2, *args)` idiom is equivalent to `callable(p1, p2, args[0], args[1], ...)
         nodes.extend(Node(f"{node_class}-{i}", *cfg) for i in range(class_config.getint('number')))
-    sim = Backup(nodes)
-    if args.n_active is not None:
+    return nodes
+
+
+def new_backup(config: dict, streams: RandomStreams, tracer: Optional[Tracer] = None) -> Backup:
+    """A new `Backup` simulation of the nodes of config['nodes'] (see `read_nodes`), with the redundancy check."""
+
+    sim = Backup(read_nodes(config['nodes'], config['n_active'], config['tolerance']), config['event_queue'], tracer,
+                 streams)
+    if config['n_active'] is not None:
         # schedule the first redundancy check in 1 week
         sim.schedule(parse_timespan("1 week"), RedundancyCheckEvent())
-    sim.run(parse_timespan(args.max_t))
+    return sim
+
+
+def run_params(config: dict) -> dict:
+    """The parameters of `config` that the results depend on, for result_cache.py."""
+
+    return {name: config[name] for name in ['nodes', 'max_t', 'n_active', 'tolerance', 'target_ci', 'target_metric',
+                                            'confidence']}
+
+
+def run_record(sim: Backup, config: dict, replication: int, target_reached: bool = False) -> dict:
+    """The results of `sim`, a finished run of `config`, as a dict.
+
+    Besides the counts, it holds the half-widths of the confidence intervals of their rates, per second (NaN unless
+    the run went through `Backup.run_batches` long enough).
+    """
+
+    return {
+        'simulator': 'storage', 'params': run_params(config),
+        'seed': config['seed'], 'replication': replication, 't': sim.t,
+        'failures': sim.failures, 'data_losses': sim.data_losses, 'backups': sim.backups, 'restores': sim.restores,
+        'half_widths': {name: sim.batches[name].half_width(config['confidence']) for name in COUNTS},
+        'target_reached': target_reached,  # whether the run stopped before max_t because target_ci was reached
+    }
+
+
+def run_replication(config: dict, replication: int) -> dict:
+    """Run replication `replication` of `config` (in a worker process, see broker.py), or find it in the cache, and
+    return its results.
+
+    `config` holds the contents of the configuration file ('nodes') and the options common to all the replications.
+    """
+
+    sim = new_backup(config, RandomStreams(config['seed'], replication))
+    cache = None
+    if config['cache'] is not None and config['seed'] is not None:
+        cache = ResultCache(config['cache'], config['cache_size'])
+        key = cache.key('storage', __file__, run_params(config), config['seed'], replication)
+        record = cache.get(key)
+        if record is not None:
+            return record
+    precise_enough = None
+    if config['target_ci'] is not None:
+        metric = config['target_metric']
+        batches = sim.batches[metric]
+        precise_enough = lambda sim: (getattr(sim, metric) > 0  # no rate to estimate before the first event
+                                      and batches.half_width(config['confidence']) <= config['target_ci'] * batches.mean)
+    reached = sim.run_batches(config['max_t'], precise_enough)
+    record = run_record(sim, config, replication, reached)
+    if cache is not None:
+        cache.put(key, record, record['params'])
+    return record
+
+
+def format_record(record: dict) -> str:
+    rates = ", ".join(f"{record[name] / record['t'] * YEAR:.4g} ± {record['half_widths'][name] * YEAR:.2g} "
+                      f"{name.replace('_', ' ')}" for name in COUNTS)
+    return (f"replication {record['replication']}: {record['failures']} failures ({record['data_losses']} data "
+            f"losses), {record['backups']} backups, {record['restores']} restores in {format_timespan(record['t'])}; "
+            f"per year: {rates}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config", help="configuration file")
+    parser.add_argument("--max-t", default="100 years")
+    parser.add_argument("--seed", help="random seed")
+    parser.add_argument("--replication", type=int, default=0,
+                        help="replication number: each one gets independent random streams from the same seed")
+    parser.add_argument("--verbose", action='store_true')
+    parser.add_argument("--trace", metavar='FILE', help="write trace records to FILE as JSON lines")
+    parser.add_argument("--trace-categories", nargs='*', choices=list(Backup.TRACE_FORMATS) + ['log'],
+                        help="only trace these categories (default: all)")
+    parser.add_argument("--event-trace", metavar='FILE',
+                        help="record every event in the binary trace FILE (used by the plots if next to the log)")
+    parser.add_argument("--event-queue", choices=EVENT_QUEUES, default='heap',
+                        help="event queue implementation (calendar is amortised O(1) for very large runs)")
+    parser.add_argument("--profile", nargs='?', const='-', metavar='JSON_FILE',
+                        help="print per-event-class statistics, or save them as JSON in JSON_FILE")
+    parser.add_argument("--checkpoint", metavar='FILE', help="periodically save a snapshot of the simulation in FILE")
+    parser.add_argument("--checkpoint-every", default=None,
+                        help="simulated time between two snapshots, e.g. \"1 year\" (one is always saved at the end)")
+    parser.add_argument("--resume", metavar='FILE',
+                        help="resume from a snapshot instead of starting anew (--max-t can extend the original one)")
+    parser.add_argument("--max-events", type=int, help="stop after processing this many events")
+    parser.add_argument("--wall-time", type=float, help="stop after this many seconds of wall-clock time")
+    parser.add_argument("--n-active", type=int, default=-1, 
+                        help="Number of active blocks to use out of n (overrides config).")
+    parser.add_argument("--tolerance", type=int, default=-1, 
+                        help="Difference between blocks that we have and blocks that we need. If it reaches below  this value, we add redundancy.")
+    parser.add_argument("--replications", type=int, default=1,
+                        help="run this many replications, from --replication on, and print their loss and backup "
+                             "counts (no logs, traces or checkpoints)")
+    parser.add_argument("--serve", metavar='HOST:PORT',
+                        help="don't run the replications: hand them out to the workers connecting to HOST:PORT")
+    parser.add_argument("--connect", metavar='HOST:PORT',
+                        help="run --workers worker processes for the coordinator at HOST:PORT (see broker.py)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes with --connect")
+    parser.add_argument("--lease-time", type=float, default=60,
+                        help="with --serve, seconds without news from a worker before its replication is run again")
+    parser.add_argument("--retries", type=int, default=2, help="with --serve, times a failed replication is retried")
+    parser.add_argument("--authkey",
+                        help=f"secret key shared by the coordinator and the workers (default: ${broker.AUTHKEY_ENV}); "
+                             "if neither is set, --serve generates one and prints it")
+    parser.add_argument("--target-ci", type=float, metavar='REL',
+                        help="with --replications, stop each run as soon as the half-width of the confidence interval "
+                             "of the rate of --target-metric is at most REL times the rate (--max-t is then a budget)")
+    parser.add_argument("--target-metric", choices=COUNTS, default='data_losses', help="the rate --target-ci is about")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level of the intervals of the rates")
+    parser.add_argument("--cache", metavar='DIR',
+                        help="reuse the counts of identical seeded runs cached in DIR, and cache new ones, as with "
+                             "--replications (see result_cache.py)")
+    parser.add_argument("--cache-size", default=DEFAULT_CACHE_SIZE,
+                        help="size of the cache, beyond which the least recently used results are evicted")
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(format='{levelname}:{message}', level=logging.INFO, style='{')  # output info on stdout
+
+    authkey = args.authkey or os.environ.get(broker.AUTHKEY_ENV)
+    if args.connect is not None:
+        if not authkey:
+            logging.error(f"--connect needs the key of the coordinator: use --authkey or ${broker.AUTHKEY_ENV}")
+            exit(1)
+        broker.work(args.connect, run_replication, authkey.encode(), args.workers)
+        return
+
+    with open(args.config) as f:
+        config = {'nodes': f.read(), 'max_t': parse_timespan(args.max_t), 'seed': args.seed,
+                  'n_active': args.n_active, 'tolerance': args.tolerance, 'event_queue': args.event_queue,
+                  'cache': args.cache, 'cache_size': args.cache_size, 'target_ci': args.target_ci,
+                  'target_metric': args.target_metric, 'confidence': args.confidence}
+    if not 0 < args.confidence < 1 or (args.target_ci is not None and args.target_ci <= 0):
+        logging.error("confidence must be between 0 and 1, and target-ci positive")
+        exit(1)
+    if args.replications > 1 or args.serve is not None or args.cache is not None or args.target_ci is not None:
+        if args.verbose or args.trace or args.event_trace or args.profile or args.checkpoint or args.resume \
+                or args.max_events or args.wall_time:
+            logging.error("logs, traces, profiles, checkpoints and budgets are for single runs, not --replications, "
+                          "--serve, --cache or --target-ci")
+            exit(1)
+        replications = range(args.replication, args.replication + args.replications)
+        records = []
+
+        def on_result(task, record):
+            records.append(record)
+            print(format_record(record), flush=True)
+
+        if args.serve is not None:
+            if not authkey:
+                authkey = broker.new_authkey()
+                print(f"workers must connect with --authkey {authkey} (or ${broker.AUTHKEY_ENV}={authkey})")
+            failed = broker.serve([(config, r) for r in replications], args.serve, on_result, authkey.encode(),
+                                  args.lease_time, args.retries)
+        else:
+            failed = []
+            for r in replications:
+                on_result((config, r), run_replication(config, r))
+        print(f"{len(records)} replications: " + ", ".join(
+            f"{sum(record[name] for record in records) / len(records):.4g} {name.replace('_', ' ')}"
+            for name in ['failures', 'data_losses', 'backups', 'restores']) + " on average")
+        if failed:
+            logging.error(f"{len(failed)} replications failed")
+            exit(1)
+        return
+
+    sinks = []
+    if args.verbose:
+        sinks.append(TextSink(Backup.TRACE_FORMATS, time_format=format_timespan))
+    if args.trace:
+        sinks.append(JsonLinesSink(args.trace))
+    tracer = Tracer(sinks, categories=args.trace_categories)
+
+    if args.resume:
+        sim = Backup.load_checkpoint(args.resume)
+        sim.set_tracer(tracer)
+    else:
+        sim = new_backup(config, RandomStreams(args.seed, args.replication), tracer)  # a seed makes runs repeatable
+    event_trace = None
+    if args.event_trace:
+        event_trace = EventTraceWriter(args.event_trace, append=args.resume is not None)
+        sim.set_event_trace(event_trace)
+    checkpoint_interval = float('inf') if args.checkpoint_every is None else parse_timespan(args.checkpoint_every)
+    stopped = sim.run(config['max_t'], profile=args.profile is not None,
+                      checkpoint=args.checkpoint, checkpoint_interval=checkpoint_interval,
+                      max_events=args.max_events, wall_time=args.wall_time)
+    if stopped:
+        logging.warning(f"simulation stopped early ({stopped}) at time {sim.t}")
+    if args.profile is not None:
+        sim.profile.save(args.profile)
+    if event_trace is not None:
+        event_trace.close()
     sim.log_info(f"Simulation over")
+    tracer.close()
+    if not stopped:
+        print(format_record(run_record(sim, config, args.replication)))
 
 
 if __name__ == '__main__':